@@ -1,19 +1,67 @@
+import csv
 import os
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, session, current_app
+from datetime import date, datetime
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash, session, current_app, Response, stream_with_context, g
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy.exc import IntegrityError
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
-from models import db, User, Semester, WeeklySlot, Project, Announcement, Transaction, Activity
+from models import db, User, Semester, WeeklySlot, Project, Announcement, Transaction, TransactionArchive, Activity, DeletedActivity, MemberArrears
+import report_export
+import database
+from database import read_only
+import events_feed
+from cache import fragments
+import metrics
+import images
+import passwords
+import uploads
+import versions
+import refdata
+import http_cache
+from http_cache import conditional
+from pagination import keyset_page, keyset_pages
+from sqlalchemy.orm import joinedload
 from translations import TRANSLATIONS
+import ledger
+import arrears
+import approvals
+import member_import
+import slots
+import archive
+import search
+import money
+import migrations
+from dues_matrix import DuesMatrix, paid_weeks_subquery, collection_rates
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get("SECRET_KEY")
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get("DATABASE_URL")
 app.config['UPLOAD_FOLDER'] = os.path.join('static', 'uploads')
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+app.config['MAX_UPLOAD_BYTES'] = int(os.environ.get('MAX_UPLOAD_BYTES', 10 * 1024 * 1024))
+# Reject oversized requests before the body is read; leaves room for the other form fields
+app.config['MAX_CONTENT_LENGTH'] = app.config['MAX_UPLOAD_BYTES'] + 64 * 1024
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+# Instrumentation (see metrics.py): slow-query log threshold, the shared
+# directory gunicorn workers use to aggregate /metrics, and who may scrape it
+app.config['SLOW_QUERY_MS'] = int(os.environ.get('SLOW_QUERY_MS', 200))
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['METRICS_ALLOW_IPS'] = tuple(
+    ip.strip() for ip in os.environ.get('METRICS_ALLOW_IPS', '127.0.0.1,::1').split(',') if ip.strip())
+# Compiled template bytecode shared by workers; created by `flask precompile-templates`
+app.config['JINJA_CACHE_DIR'] = os.environ.get('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
 
+# WAL/busy-timeout tuning and the read-only engine (see database.py)
+database.configure(app)
 db.init_app(app)
+database.init_app(app, db)
+metrics.init_app(app)
+http_cache.init_app(app)
+passwords.init_app(app)
+if os.path.isdir(app.config['JINJA_CACHE_DIR']):
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
    
 login_manager = LoginManager()
 login_manager.login_view = 'login'
@@ -21,7 +69,8 @@ login_manager.init_app(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    # A cached snapshot (see refdata.py), not a session-bound User row
+    return refdata.get_user(int(user_id))
 
 # Context Processor for Language
 @app.context_processor
@@ -29,8 +78,31 @@ def inject_language():
     lang = session.get('lang', 'TH')
     return dict(t=TRANSLATIONS[lang], current_lang=lang, datetime=datetime)
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
+# Resized upload derivatives (see images.py), e.g. upload_url(txn.slip_filename, 'thumb')
+app.add_template_global(images.upload_url, 'upload_url')
+# Satang -> "1234.50", e.g. {{ txn.amount_minor|money }}
+app.add_template_filter(money.format_minor, 'money')
+
+def save_upload(file):
+    # Store an uploaded image under its content hash (see uploads.py); returns the
+    # stored name, or None when no file was sent. Raises uploads.UploadRejected.
+    stored = uploads.ingest(file, app.config['UPLOAD_FOLDER'], app.config['ALLOWED_EXTENSIONS'],
+                            app.config['MAX_UPLOAD_BYTES'])
+    if stored is None:
+        return None
+    if stored.created:
+        images.submit(app, stored.filename)
+    return stored.filename
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    flash(f"File is larger than {app.config['MAX_UPLOAD_BYTES'] // (1024 * 1024)} MB")
+    return redirect(request.referrer or url_for('home'))
+
+@app.errorhandler(passwords.HashingBusy)
+def hashing_busy(e):
+    # Every password worker is busy; ask the client to retry instead of queueing
+    return 'Too many sign-ins right now, please try again in a moment.', 503, {'Retry-After': '2'}
 
 # Routes
 
@@ -40,26 +112,71 @@ def set_lang(lang_code):
         session['lang'] = lang_code
     return redirect(request.referrer or url_for('home'))
 
+# Home page: upcoming events shown in the sidebar, announcements per "older news" page
+HOME_EVENTS = 5
+NEWS_PAGE_SIZE = 9
+
 @app.route('/')
+@read_only
+@conditional(versions.NEWS, versions.EVENTS, time_bucket=300, renders_user=True)
 def home():
-    announcements = Announcement.query.order_by(Announcement.created_at.desc()).all()
-    # Fetch upcoming events
-    upcoming_events = Activity.query.filter(Activity.start_date >= datetime.utcnow()).order_by(Activity.start_date.asc()).all()
-    return render_template('home.html', announcements=announcements, events=upcoming_events)
+    # Both sections are cached per language and data version (see cache.py);
+    # @conditional has already loaded the stamps into g.data_versions
+    lang = session.get('lang', 'TH')
+    news_html = fragments.get_or_render(
+        ('news', lang, g.data_versions[versions.NEWS][0], None),
+        lambda: render_template('partials/home_news.html', page=news_page(None)))
+    # "Upcoming" moves with the clock, so the events section is also keyed by a 5 minute bucket
+    now = datetime.utcnow().replace(second=0, microsecond=0)
+    now = now.replace(minute=now.minute - now.minute % 5)
+    events_html = fragments.get_or_render(
+        ('events', lang, g.data_versions[versions.EVENTS][0], now),
+        lambda: render_template('partials/home_events.html', events=Activity.query.filter(
+            Activity.start_date >= now).order_by(Activity.start_date.asc()).limit(HOME_EVENTS).all()))
+    return render_template('home.html', news_html=news_html, events_html=events_html)
+
+def news_page(cursor):
+    return keyset_page(Announcement.query, Announcement, cursor, per_page=NEWS_PAGE_SIZE,
+                       column=Announcement.created_at)
+
+@app.route('/news/older')
+@read_only
+@conditional(versions.NEWS)
+def older_news():
+    # Next page of announcement cards for the home page's "older news" button
+    cursor = request.args.get('cursor')
+    lang = session.get('lang', 'TH')
+    return fragments.get_or_render(
+        ('news', lang, g.data_versions[versions.NEWS][0], cursor),
+        lambda: render_template('partials/news_cards.html', page=news_page(cursor)))
 
 @app.route('/api/events')
+@read_only
+@conditional(versions.EVENTS, time_bucket=3600)
 def api_events():
-    events = Activity.query.all()
-    events_data = []
-    for event in events:
-        events_data.append({
-            'title': event.title,
-            'start': event.start_date.isoformat(),
-            'end': event.end_date.isoformat(),
-            'description': event.description,
-            'location': event.location
-        })
-    return {'events': events_data}
+    # ?start=&end= select a window (FullCalendar sends them); ?since= returns only
+    # events changed after that UTC time plus ids deleted since then
+    start, end = events_feed.window(events_feed.parse_timestamp(request.args.get('start')),
+                                    events_feed.parse_timestamp(request.args.get('end')))
+    since = events_feed.parse_timestamp(request.args.get('since'), wall_clock=False)
+    now = datetime.utcnow().isoformat() + 'Z'
+    if since:
+        changed, deleted = events_feed.changes_since(since, start, end)
+        # Clients apply 'deleted' before 'events': SQLite may reuse a deleted id
+        return {'events': changed, 'deleted': deleted, 'now': now}
+    stamp = g.data_versions[versions.EVENTS][0]
+    return {'events': events_feed.events_in_window(start, end, stamp), 'now': now}
+
+@app.route('/api/events.ics')
+@read_only
+@conditional(versions.EVENTS, time_bucket=3600)
+def api_events_ics():
+    start, end = events_feed.window(events_feed.parse_timestamp(request.args.get('start')),
+                                    events_feed.parse_timestamp(request.args.get('end')))
+    stamp = g.data_versions[versions.EVENTS][0]
+    body = events_feed.to_ics(events_feed.events_in_window(start, end, stamp), request.host.split(':')[0])
+    return Response(body, mimetype='text/calendar',
+                    headers={'Content-Disposition': 'inline; filename="ghuroba.ics"'})
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -67,7 +184,10 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password, password):
+        if user and passwords.verify_password(user.password, password):
+            if passwords.needs_rehash(user.password):
+                user.password = passwords.hash_password(password)
+                db.session.commit()
             login_user(user)
             return redirect(url_for('home'))
         flash('Invalid username or password')
@@ -87,12 +207,14 @@ def register():
         
         new_user = User(
             username=username,
-            password=generate_password_hash(password, method='scrypt'),
+            password=passwords.hash_password(password),
             real_name=real_name,
             department=department,
             role='member'
         )
         db.session.add(new_user)
+        db.session.flush()
+        arrears.add_members([new_user.id])
         db.session.commit()
         login_user(new_user)
         return redirect(url_for('home'))
@@ -109,10 +231,13 @@ def logout():
 @login_required
 def profile():
     if request.method == 'POST':
-        current_user.real_name = request.form.get('real_name')
+        # current_user is a read-only snapshot; update the row itself
+        user = User.query.get(current_user.id)
+        user.real_name = request.form.get('real_name')
         password = request.form.get('password')
         if password:
-            current_user.password = generate_password_hash(password, method='scrypt')
+            user.password = passwords.hash_password(password)
+        refdata.changed(versions.USERS)
         db.session.commit()
         flash('Profile updated')
         return redirect(url_for('profile'))
@@ -124,32 +249,50 @@ def profile():
 def dues():
     # Logic: Show current semester's slots. If none, show history or nothing.
     # For simplicity, getting all active semesters.
-    semester = Semester.query.filter_by(is_active=True).first()
+    semester = refdata.active_semester()
     slots_data = []
+    owed = 0
     if semester:
-        slots = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number).all()
-        for slot in slots:
-            # Check if user paid for this slot
-            txn = Transaction.query.filter_by(
-                user_id=current_user.id, 
-                weekly_slot_id=slot.id, 
-                type='income_dues'
-            ).first()
+        # Slots and this member's dues in one query
+        matrix, transactions = DuesMatrix.for_member(semester.id, current_user.id)
+        for slot in matrix.slots:
             slots_data.append({
                 'slot': slot,
-                'transaction': txn
+                'transaction': transactions.get(slot.id),
+                'status': matrix.status(current_user.id, slot.id)
             })
-    return render_template('member/dues.html', semester=semester, slots_data=slots_data)
+        owed = matrix.arrears(current_user.id)
+    return render_template('member/dues.html', semester=semester, slots_data=slots_data, arrears=owed,
+                           position=arrears.position(current_user.id))
+
+@app.route('/dues/history')
+@read_only
+@login_required
+def dues_history():
+    return render_template('member/history.html', member=current_user, **arrears_history(current_user.id))
+
+def arrears_history(user_id):
+    """Template arguments of a member's dues history, newest semester first."""
+    semesters = {sem.id: sem for sem in refdata.semesters()}
+    rows = [row for row in arrears.history(user_id) if row.semester_id in semesters]
+    rows.sort(key=lambda row: semesters[row.semester_id].start_date, reverse=True)
+    return {'rows': rows, 'semesters': semesters, 'total': arrears.position(user_id)}
 
 @app.route('/pay_dues/<int:slot_id>', methods=['POST'])
 @login_required
 def pay_dues(slot_id):
-    file = request.files.get('slip')
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        
+    # Check the amount before the slip is stored
+    try:
+        amount_minor = money.to_minor(request.form.get('amount', 0))
+    except ValueError as e:
+        flash(str(e))
+        return redirect(url_for('dues'))
+    try:
+        filename = save_upload(request.files.get('slip'))
+    except uploads.UploadRejected as e:
+        flash(str(e))
+        return redirect(url_for('dues'))
+    if filename:
         slot = WeeklySlot.query.get_or_404(slot_id)
         
         # Create Transaction
@@ -161,11 +304,9 @@ def pay_dues(slot_id):
         # Let's set amount to 0 initially or allow input? I'll allow input in a modal or just assume slip upload is enough.
         # Let's stick to simplest: User uploads slip. Admin verifies/enters amount? 
         # Or user enters amount. Let's say user enters amount.
-        amount = request.form.get('amount', 0)
-        
         txn = Transaction(
             type='income_dues',
-            amount=float(amount),
+            amount_minor=amount_minor,
             description=f"Week {slot.week_number} Dues",
             user_id=current_user.id,
             weekly_slot_id=slot.id,
@@ -175,15 +316,19 @@ def pay_dues(slot_id):
             semester_id=slot.semester_id
         )
         db.session.add(txn)
+        ledger.record(txn)
+        arrears.record(txn)
+        versions.bump(versions.LEDGER)
         db.session.commit()
         flash('Payment submitted for approval')
     return redirect(url_for('dues'))
 
 @app.route('/transparency')
+@read_only
+@conditional(versions.LEDGER, renders_user=True)
 def transparency():
-    # Calculate Net Balance
-    income = db.session.query(db.func.sum(Transaction.amount)).filter(Transaction.type.like('income%')).scalar() or 0
-    expense = db.session.query(db.func.sum(Transaction.amount)).filter(Transaction.type == 'expense').scalar() or 0
+    # Calculate Net Balance (from the incrementally maintained summary, see ledger.py)
+    income, expense = ledger.totals()
     balance = income - expense
     return render_template('member/transparency.html', balance=balance, income=income, expense=expense)
 
@@ -195,8 +340,7 @@ def admin_dashboard():
         return redirect(url_for('home'))
     
     # Calculate Grand Total
-    income = db.session.query(db.func.sum(Transaction.amount)).filter(Transaction.type.like('income%')).scalar() or 0
-    expense = db.session.query(db.func.sum(Transaction.amount)).filter(Transaction.type == 'expense').scalar() or 0
+    income, expense = ledger.totals()
     balance = income - expense
     
     # Check for pending dues count
@@ -210,15 +354,63 @@ def admin_approvals():
     if current_user.role != 'admin': return redirect(url_for('home'))
     
     if request.method == 'POST':
+        # Checked slips (txn_ids) or a single row's button (txn_id), reviewed in one statement
         txn_id = request.form.get('txn_id')
-        txn = Transaction.query.get(txn_id)
-        if txn:
-            txn.status = 'approved'
-            db.session.commit()
-            flash('Payment Approved')
+        txn_ids = [txn_id] if txn_id else request.form.getlist('txn_ids')
+        # A row's button always approves; a bulk submit must say what it does
+        action = 'approve' if txn_id else request.form.get('action')
+        try:
+            count = approvals.review([i for i in txn_ids if i], action, request.form.get('reason'))
+        except ValueError as e:
+            flash(str(e))
+            return redirect(url_for('admin_approvals', cursor=request.args.get('cursor')))
+        db.session.commit()
+        flash(f"{count} payments {'approved' if action == 'approve' else 'rejected'}")
+        return redirect(url_for('admin_approvals', cursor=request.args.get('cursor')))
     
-    pending_txns = Transaction.query.filter_by(status='pending', type='income_dues').order_by(Transaction.date.asc()).all()
-    return render_template('admin/approvals.html', transactions=pending_txns)
+    page = pending_dues_page(request.args.get('cursor'))
+    # Group the page by semester week for review
+    weeks = {}
+    for txn in page.items:
+        slot = txn.weekly_slot
+        weeks.setdefault((slot.semester_id, slot.week_number) if slot else (0, 0), []).append(txn)
+    weeks = [(weeks[key][0].weekly_slot, weeks[key]) for key in sorted(weeks)]
+    return render_template('admin/approvals.html', transactions=page.items, weeks=weeks, page=page)
+
+def pending_dues_query():
+    # Pending slips with the member and week loaded in the same query
+    return Transaction.query.options(joinedload(Transaction.user), joinedload(Transaction.weekly_slot)).filter_by(
+        status='pending', type='income_dues')
+
+def pending_dues_page(cursor):
+    # Oldest first, one page at a time
+    return keyset_page(pending_dues_query(), Transaction, cursor, descending=False)
+
+@app.route('/admin/api/approvals', methods=['GET', 'POST'])
+@login_required
+def api_approvals():
+    if current_user.role != 'admin': return {'error': 'forbidden'}, 403
+    if request.method == 'POST':
+        # {"ids": [...], "action": "approve" | "reject", "reason": "..."}
+        data = request.get_json(silent=True) or {}
+        try:
+            count = approvals.review(data.get('ids') or [], data.get('action'), data.get('reason'))
+        except (TypeError, ValueError) as e:
+            return {'error': str(e)}, 400
+        db.session.commit()
+        return {'updated': count}
+    page = pending_dues_page(request.args.get('cursor'))
+    return {
+        'pending': [{
+            'id': txn.id,
+            'member': txn.user.real_name if txn.user else None,
+            'week': txn.weekly_slot.week_number if txn.weekly_slot else None,
+            'amount': money.format_minor(txn.amount_minor),
+            'date': txn.date.isoformat() if txn.date else None,
+            'slip': images.upload_url(txn.slip_filename, 'thumb') if txn.slip_filename else None,
+        } for txn in page.items],
+        'next_cursor': page.next_cursor,
+    }
 
 @app.route('/admin/semesters', methods=['GET', 'POST'])
 @login_required
@@ -239,31 +431,31 @@ def admin_semesters():
             db.session.add(sem)
             db.session.flush() # get ID
             
-            # Auto-generate slots
-            current_date = start
-            week_num = 1
-            while current_date < end:
-                week_end = current_date + timedelta(days=6)
-                if week_end > end:
-                    week_end = end
-                
-                slot = WeeklySlot(
-                    semester_id=sem.id,
-                    week_number=week_num,
-                    start_date=current_date,
-                    end_date=week_end
-                )
-                db.session.add(slot)
-                current_date = week_end + timedelta(days=1)
-                week_num += 1
+            # Auto-generate slots (one multi-row insert, see slots.py)
+            slots.create(sem.id, start, end)
                 
+            refdata.changed(versions.REFDATA)
             db.session.commit()
             flash('Semester and slots created')
+        elif 'archive' in request.form:
+            sem = Semester.query.get(request.form.get('sem_id'))
+            if sem:
+                try:
+                    snapshot, moved = archive.close(sem)
+                except archive.ArchiveError as e:
+                    db.session.rollback()
+                    flash(str(e))
+                    return redirect(url_for('admin_semesters'))
+                versions.bump(versions.LEDGER)
+                refdata.changed(versions.REFDATA)
+                db.session.commit()
+                flash(f'Semester closed: {moved} rows archived')
         elif 'toggle_status' in request.form:
             sem_id = request.form.get('sem_id')
             sem = Semester.query.get(sem_id)
-            if sem:
+            if sem and not sem.archived_at:
                 sem.is_active = not sem.is_active
+                refdata.changed(versions.REFDATA)
                 db.session.commit()
                 flash('Semester status updated')
 
@@ -280,6 +472,7 @@ def admin_projects():
             desc = request.form.get('description')
             p = Project(name=name, description=desc)
             db.session.add(p)
+            refdata.changed(versions.REFDATA)
             db.session.commit()
         elif 'update_status' in request.form:
             project_id = request.form.get('project_id')
@@ -287,6 +480,7 @@ def admin_projects():
             p = Project.query.get(project_id)
             if p:
                 p.status = new_status
+                refdata.changed(versions.REFDATA)
                 db.session.commit()
     
     active_projects = Project.query.filter_by(status='Active').all()
@@ -309,7 +503,10 @@ def delete_project():
         # Manually set transactions project_id to None before deletion to keep financial record but orphan them
         for txn in p.transactions:
              txn.project_id = None
+        TransactionArchive.query.filter_by(project_id=p.id).update({TransactionArchive.project_id: None})
+        ledger.detach_project(p.id)
         db.session.delete(p)
+        refdata.changed(versions.REFDATA)
         db.session.commit()
         flash('Project deleted')
     return redirect(url_for('admin_projects'))
@@ -324,14 +521,80 @@ def admin_members():
         user = User.query.get(user_id)
         if user and user.role != 'admin': # Don't delete/reset other admins easily
             if action == 'reset':
-                user.password = generate_password_hash('1234', method='scrypt')
+                user.password = passwords.hash_password('1234')
                 flash(f'Password reset for {user.username}')
             elif action == 'delete':
+                TransactionArchive.query.filter_by(user_id=user.id).update({TransactionArchive.user_id: None})
+                arrears.remove_member(user.id)
                 db.session.delete(user)
                 flash(f'User {user.username} deleted')
+            refdata.changed(versions.USERS)
             db.session.commit()
-    members = User.query.filter_by(role='member').all()
-    return render_template('admin/members.html', members=members)
+    sort = request.args.get('sort')
+    if sort not in MEMBER_SORTS:
+        sort = None
+    return render_template('admin/members.html', members=members_query(sort).all(), sort=sort)
+
+MEMBER_COUNTERS = [db.func.coalesce(getattr(MemberArrears, name), 0).label(name)
+                   for name in ('owed_weeks', 'pending_weeks', 'paid_minor')]
+MEMBER_SORTS = {
+    'owed': (MEMBER_COUNTERS[0].desc(), User.id),
+    'pending': (MEMBER_COUNTERS[1].desc(), User.id),
+    'paid': (MEMBER_COUNTERS[2].desc(), User.id),
+    'name': (User.real_name, User.id),
+}
+
+def members_query(sort=None):
+    """Each member with the counters of their all-semesters arrears row (see arrears.py), in MEMBER_SORTS order."""
+    query = db.session.query(User, *MEMBER_COUNTERS).outerjoin(MemberArrears, db.and_(
+        MemberArrears.user_id == User.id, MemberArrears.semester_id == arrears.ALL_SEMESTERS,
+    )).filter(User.role == 'member')
+    return query.order_by(*MEMBER_SORTS.get(sort, (User.id,)))
+
+@app.route('/admin/members/<int:user_id>/history')
+@read_only
+@login_required
+def admin_member_history(user_id):
+    if current_user.role != 'admin': return redirect(url_for('home'))
+    member = User.query.get_or_404(user_id)
+    return render_template('member/history.html', member=member, **arrears_history(user_id))
+
+@app.route('/admin/arrears')
+@read_only
+@login_required
+def admin_arrears():
+    if current_user.role != 'admin': return redirect(url_for('home'))
+    semester_id = request.args.get('semester_id', arrears.ALL_SEMESTERS, type=int)
+    return render_template('admin/arrears.html', ranking=arrears.ranking(semester_id),
+                           semesters=refdata.semesters(), semester_id=semester_id)
+
+@app.route('/admin/members/import', methods=['GET', 'POST'])
+@login_required
+def import_members():
+    if current_user.role != 'admin': return redirect(url_for('home'))
+    result = None
+    if request.method == 'POST':
+        file = request.files.get('csv_file')
+        if not file or not file.filename:
+            flash('Choose a CSV file')
+            return redirect(url_for('import_members'))
+        try:
+            text = file.stream.read().decode('utf-8-sig')
+        except UnicodeDecodeError:
+            flash('The file is not UTF-8 encoded CSV')
+            return redirect(url_for('import_members'))
+        try:
+            # Hashing runs inside the request, so the page takes fewer rows than the CLI
+            result = member_import.import_members(text, skip_invalid=bool(request.form.get('skip_invalid')),
+                                                  dry_run=bool(request.form.get('dry_run')),
+                                                  max_rows=member_import.WEB_MAX_ROWS)
+        except IntegrityError:
+            # A username was taken between validation and insert; nothing was written
+            db.session.rollback()
+            flash('A username was registered during the import; nothing was imported, please retry')
+            return redirect(url_for('import_members'))
+    return render_template('admin/member_import.html', result=result, dry_run=bool(request.form.get('dry_run')),
+                           max_rows=member_import.WEB_MAX_ROWS)
 
 @app.route('/admin/treasury', methods=['GET', 'POST'])
 @login_required
@@ -342,8 +605,8 @@ def admin_treasury():
     # Prompt says "Cancelled: Hide from selection menus". So we show Active and Completed.
     # Actually usually you record expenses against active projects. But let's allow Completed too just in case.
     # But for "Cancelled", definitely hide.
-    projects = Project.query.filter(Project.status != 'Cancelled').all()
-    semesters = Semester.query.order_by(Semester.start_date.desc()).all()
+    projects = refdata.projects(include_cancelled=False)
+    semesters = refdata.semesters()
     
     selected_semester_id = request.args.get('semester_id')
     
@@ -352,29 +615,35 @@ def admin_treasury():
              txn_id = request.form.get('txn_id')
              txn = Transaction.query.get(txn_id)
              if txn:
+                 ledger.unrecord(txn)
+                 arrears.unrecord(txn)
+                 versions.bump(versions.LEDGER)
                  db.session.delete(txn)
                  db.session.commit()
                  flash('Transaction deleted')
         else:
             txn_type = request.form.get('type') # income_donation or expense
-            amount = float(request.form.get('amount'))
+            try:
+                amount_minor = money.to_minor(request.form.get('amount'))
+            except ValueError as e:
+                flash(str(e))
+                return redirect(url_for('admin_treasury'))
             desc = request.form.get('description')
             project_id = request.form.get('project_id')
             
-            filename = None
-            file = request.files.get('slip') # Receipt/Evidence
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                filename = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            try:
+                filename = save_upload(request.files.get('slip')) # Receipt/Evidence
+            except uploads.UploadRejected as e:
+                flash(str(e))
+                return redirect(url_for('admin_treasury'))
             
             # Get active semester for expenses/donations if not specified
             # For simplicity, we just grab the first active semester
-            active_sem = Semester.query.filter_by(is_active=True).first()
+            active_sem = refdata.active_semester()
             
             txn = Transaction(
                 type=txn_type,
-                amount=amount,
+                amount_minor=amount_minor,
                 description=desc,
                 project_id=project_id if project_id else None,
                 slip_filename=filename,
@@ -383,25 +652,76 @@ def admin_treasury():
                 semester_id=active_sem.id if active_sem else None
             )
             db.session.add(txn)
+            ledger.record(txn)
+            versions.bump(versions.LEDGER)
             db.session.commit()
             flash('Transaction recorded')
         
-    # Transactions Query
-    query = Transaction.query.filter(Transaction.status == 'approved')
-    if selected_semester_id:
-        query = query.filter(Transaction.semester_id == int(selected_semester_id))
-        
-    transactions = query.order_by(Transaction.date.desc()).all()
+    # Transactions Query; archived rows are listed from the archive table (see ledger_page)
+    page = ledger_page(None, selected_semester_id, request.args.get('cursor'), descending=True)
     
-    # Calculate Total Dues Collected (only for this view filter)
-    total_dues = sum(t.amount for t in transactions if t.type == 'income_dues')
+    # Totals for this view filter, summed in the database (or frozen, if archived)
+    subtotals = report_subtotals(None, selected_semester_id)
 
     return render_template('admin/treasury.html', 
                            projects=projects, 
-                           transactions=transactions, 
+                           transactions=page.items, 
+                           page=page,
                            semesters=semesters,
                            selected_semester_id=selected_semester_id,
-                           total_dues=total_dues)
+                           total_dues=subtotals.by_type.get('income_dues', 0))
+
+def ledger_model(semester_id):
+    # Archived semesters live in the archive table (see archive.py)
+    semester = refdata.semester(int(semester_id)) if semester_id else None
+    return TransactionArchive if semester and semester.archived_at else Transaction
+
+def ledger_page(project_id, semester_id, cursor, descending, with_project=False):
+    # One page of the treasury/report listing. Without a semester filter the
+    # live and archive tables are listed together, like the totals and the export
+    models = [ledger_model(semester_id)]
+    if not semester_id and any(sem.archived_at for sem in refdata.semesters()):
+        models.append(TransactionArchive)
+    sources = []
+    for model in models:
+        query = model.query.filter(*report_filters(project_id, semester_id, model))
+        if with_project:
+            query = query.options(joinedload(model.project))
+        sources.append((query, model, model.date))
+    return keyset_pages(sources, cursor, descending)
+
+def report_filters(project_id, semester_id, model=Transaction):
+    # Shared by the treasury, the report page and its CSV/XLSX export
+    filters = [model.status == 'approved']
+    if project_id:
+        filters.append(model.project_id == int(project_id))
+    if semester_id:
+        filters.append(model.semester_id == int(semester_id))
+    return filters
+
+def report_subtotals(project_id, semester_id):
+    # Archived semesters are totalled from their snapshot, never from their rows;
+    # "all semesters" adds every snapshot to the live totals
+    project_id = int(project_id) if project_id else None
+    if semester_id:
+        snapshot = refdata.snapshot(int(semester_id))
+        if snapshot:
+            return snapshot.subtotals(project_id)
+        return ledger.subtotals(*report_filters(project_id, semester_id))
+    rows = list(ledger.subtotals(*report_filters(project_id, None)).rows)
+    for sem in refdata.semesters():
+        snapshot = refdata.snapshot(sem.id) if sem.archived_at else None
+        if snapshot:
+            rows += snapshot.subtotals(project_id).rows
+    return ledger.Subtotals(rows)
+
+def report_rows(model, filters):
+    # Column query for the export, with the project name joined in; id is last,
+    # only there to order rows of the same date
+    return db.session.query(
+        model.date.label('date'), model.description, model.type, model.amount_minor, Project.name,
+        model.id.label('id'),
+    ).outerjoin(Project, model.project_id == Project.id).filter(*filters)
 
 @app.route('/admin/report')
 @login_required
@@ -412,24 +732,55 @@ def admin_report():
     project_id = request.args.get('project_id')
     semester_id = request.args.get('semester_id')
     
-    query = Transaction.query.filter(Transaction.status == 'approved')
-    if project_id:
-        query = query.filter(Transaction.project_id == int(project_id))
-    if semester_id:
-        query = query.filter(Transaction.semester_id == int(semester_id))
-        
-    transactions = query.order_by(Transaction.date.asc()).all()
+    page = ledger_page(project_id, semester_id, request.args.get('cursor'), descending=False, with_project=True)
+    
+    # Totals cover the whole filtered range, not just this page: one GROUP BY
+    # type, project, semester gives both the grand totals and per-project subtotals
+    subtotals = report_subtotals(project_id, semester_id)
         
-    projects = Project.query.all()
-    semesters = Semester.query.order_by(Semester.start_date.desc()).all()
+    projects = refdata.projects()
+    semesters = refdata.semesters()
     
     return render_template('admin/report.html', 
-                           transactions=transactions, 
+                           transactions=page.items, 
+                           page=page,
+                           subtotals=subtotals,
+                           project_names={p.id: p.name for p in projects},
                            projects=projects, 
                            semesters=semesters,
                            selected_project=project_id,
                            selected_semester=semester_id)
 
+@app.route('/admin/report/export.<fmt>')
+@login_required
+def export_report(fmt):
+    if current_user.role != 'admin': return redirect(url_for('home'))
+    if fmt not in ('csv', 'xlsx'):
+        return redirect(url_for('admin_report'))
+    project_id = request.args.get('project_id')
+    semester_id = request.args.get('semester_id')
+    
+    # Column query with the project name joined in, streamed in chunks
+    model = ledger_model(semester_id)
+    query = report_rows(model, report_filters(project_id, semester_id, model))
+    if not semester_id:
+        # The full ledger spans the live and archive tables
+        query = query.union_all(report_rows(TransactionArchive, report_filters(project_id, None, TransactionArchive)))
+    query = query.order_by(db.literal_column('date').asc(), db.literal_column('id').asc())
+    
+    filename = f"ghuroba_report_{datetime.utcnow().strftime('%Y%m%d')}.{fmt}"
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    if fmt == 'csv':
+        return Response(stream_with_context(report_export.iter_csv(query)),
+                        mimetype='text/csv; charset=utf-8', headers=headers)
+    try:
+        body = report_export.iter_xlsx(query)
+    except ImportError:
+        flash('XLSX export requires the openpyxl package')
+        return redirect(url_for('admin_report', project_id=project_id, semester_id=semester_id))
+    return Response(stream_with_context(body),
+                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', headers=headers)
+
 @app.route('/admin/news', methods=['GET', 'POST'])
 @login_required
 def admin_news():
@@ -437,19 +788,20 @@ def admin_news():
     if request.method == 'POST':
         title = request.form.get('title')
         content = request.form.get('content')
-        filename = None
-        file = request.files.get('image')
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            filename = f"news_{datetime.now().strftime('%Y%m%d%H%M%S')}_{filename}"
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        try:
+            filename = save_upload(request.files.get('image'))
+        except uploads.UploadRejected as e:
+            flash(str(e))
+            return redirect(url_for('admin_news'))
             
         news = Announcement(title=title, content=content, image_filename=filename)
         db.session.add(news)
+        versions.bump(versions.NEWS)
         db.session.commit()
+        fragments.invalidate('news')
     
-    news_items = Announcement.query.order_by(Announcement.created_at.desc()).all()
-    return render_template('admin/news.html', news_items=news_items)
+    page = keyset_page(Announcement.query, Announcement, request.args.get('cursor'), column=Announcement.created_at)
+    return render_template('admin/news.html', news_items=page.items, page=page)
 
 @app.route('/admin/events', methods=['GET', 'POST'])
 @login_required
@@ -466,11 +818,13 @@ def admin_events():
             
             event = Activity(title=title, description=desc, start_date=start, end_date=end, location=loc)
             db.session.add(event)
+            versions.bump(versions.EVENTS)
             db.session.commit()
+            fragments.invalidate('events')
             flash('Event created')
             
-    events = Activity.query.order_by(Activity.start_date.desc()).all()
-    return render_template('admin/events.html', events=events)
+    page = keyset_page(Activity.query, Activity, request.args.get('cursor'), column=Activity.start_date)
+    return render_template('admin/events.html', events=page.items, page=page)
 
 @app.route('/admin/events/delete', methods=['POST'])
 @login_required
@@ -479,8 +833,11 @@ def delete_event():
     event_id = request.form.get('event_id')
     event = Activity.query.get(event_id)
     if event:
+        db.session.add(DeletedActivity(id=event.id))
         db.session.delete(event)
+        versions.bump(versions.EVENTS)
         db.session.commit()
+        fragments.invalidate('events')
         flash('Event deleted')
     return redirect(url_for('admin_events'))
 
@@ -489,31 +846,77 @@ def delete_event():
 def admin_tracker():
     if current_user.role != 'admin': return redirect(url_for('home'))
     
-    semester = Semester.query.filter_by(is_active=True).first()
+    semester = refdata.active_semester()
     if not semester:
         return render_template('admin/tracker.html', semester=None)
         
+    # Only the header is rendered here; rows are paged in from api_tracker as the table scrolls
     slots = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number).all()
-    members = User.query.filter_by(role='member').all()
+    member_count = User.query.filter_by(role='member').count()
+    departments = [d for (d,) in db.session.query(User.department).filter_by(role='member').distinct().order_by(User.department)]
+        
+    return render_template('admin/tracker.html', semester=semester, slots=slots, departments=departments,
+                           collection_rates=collection_rates(semester.id, slots, member_count))
+
+TRACKER_PAGE_SIZE = 100
+
+def tracker_query(semester_id, department=None, due=None):
+    """Members on the tracker, optionally of one department and (due = started weeks) still owing."""
+    query = db.session.query(User.id, User.real_name, User.department).filter(User.role == 'member')
+    if department:
+        query = query.filter(User.department == department)
+    if due is not None:
+        # Owing means a started week without a payment; future weeks are not due yet
+        paid = paid_weeks_subquery(semester_id, until=date.today())
+        query = query.outerjoin(paid, paid.c.user_id == User.id).filter(db.func.coalesce(paid.c.weeks, 0) < due)
+    return query
+
+def tracker_page(query, after, limit):
+    """The keyset page of tracker_query after user id `after`, with one extra row to tell if more follow."""
+    return query.filter(User.id > after).order_by(User.id).limit(limit + 1)
+
+@app.route('/admin/api/tracker')
+@login_required
+def api_tracker():
+    if current_user.role != 'admin': return {'error': 'forbidden'}, 403
     
-    # Pre-fetch all dues transactions for this semester
-    transactions = Transaction.query.filter_by(semester_id=semester.id, type='income_dues').all()
+    semester = refdata.active_semester()
+    if not semester:
+        return {'semester': None, 'rows': [], 'next_after': None}
     
-    # Build a lookup: (user_id, slot_id) -> status
-    status_map = {}
-    for t in transactions:
-        if t.user_id and t.weekly_slot_id:
-            status_map[(t.user_id, t.weekly_slot_id)] = t.status
-            
-    tracker_data = []
-    for member in members:
-        row = {
-            'user': member,
-            'status_map': {slot.id: status_map.get((member.id, slot.id), 'unpaid') for slot in slots}
-        }
-        tracker_data.append(row)
-        
-    return render_template('admin/tracker.html', semester=semester, slots=slots, tracker_data=tracker_data)
+    after = request.args.get('after', 0, type=int)
+    limit = min(request.args.get('limit', TRACKER_PAGE_SIZE, type=int), 500)
+    department = request.args.get('department')
+    only_unpaid = request.args.get('unpaid') == '1'
+    
+    slots = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number).all()
+    
+    # Filters run in the database; the page is a keyset on user id
+    due = sum(1 for slot in slots if slot.start_date <= date.today()) if only_unpaid else None
+    query = tracker_query(semester.id, department, due)
+    total = query.count() if not after else None
+    members = tracker_page(query, after, limit).all()
+    has_more = len(members) > limit
+    members = members[:limit]
+    
+    matrix = DuesMatrix.load(semester.id, [m.id for m in members], slots=slots)
+    rows = [{
+        'id': m.id,
+        'name': m.real_name,
+        'department': m.department,
+        'status': matrix.status_string(m.id),
+        'arrears': matrix.arrears(m.id)
+    } for m in members]
+    
+    data = {
+        'semester': {'id': semester.id, 'name': semester.name},
+        'weeks': [{'id': slot.id, 'week': slot.week_number, 'start': slot.start_date.isoformat()} for slot in slots],
+        'rows': rows,
+        'next_after': members[-1].id if has_more else None
+    }
+    if total is not None:
+        data['total'] = total
+    return data
 
 @app.route('/admin/semester/edit', methods=['POST'])
 @login_required
@@ -525,17 +928,30 @@ def edit_semester():
     end = datetime.strptime(request.form.get('end_date'), '%Y-%m-%d').date()
     
     sem = Semester.query.get(sem_id)
-    if sem:
+    if sem and sem.archived_at:
+        flash('Archived semesters cannot be changed')
+    elif sem:
+        dates_changed = (sem.start_date, sem.end_date) != (start, end)
         sem.name = name
         sem.start_date = start
         sem.end_date = end
-        # Note: Changing dates might invalidate existing slots. 
-        # For V3.5 Critical, we just update the dates. Advanced logic would regenerate slots.
-        # User prompt asks to "manage Start/End dates", usually implies logic adjustment, 
-        # but regenerating slots destroys payment links if slot_ids change.
-        # Safe approach: Update Semester dates. Slots remain as is unless manually regenerated.
+        refdata.changed(versions.REFDATA)
+        # Regenerating keeps slot ids for surviving weeks, so payment links stay
+        # intact; dues on dropped weeks move to the member's first open week
+        result = None
+        if dates_changed:
+            try:
+                result = slots.regenerate(sem)
+            except ValueError as e:
+                db.session.rollback()
+                flash(str(e))
+                return redirect(url_for('admin_semesters'))
         db.session.commit()
-        flash('Semester updated')
+        if result:
+            flash(f'Semester updated: {result.updated} weeks moved, {result.added} added, '
+                  f'{result.removed} removed, {result.remapped} payments reassigned')
+        else:
+            flash('Semester updated')
     return redirect(url_for('admin_semesters'))
 
 @app.route('/admin/semester/delete', methods=['POST'])
@@ -545,32 +961,202 @@ def delete_semester():
     sem_id = request.form.get('sem_id')
     sem = Semester.query.get(sem_id)
     if sem:
-        # Cascade delete is handled by models.py (slots) but transactions might restrict it or need set null.
-        # Check models: slots = db.relationship(..., cascade="all, delete-orphan")
-        # Transactions link to Semester and Slot.
-        # If we delete Semester -> Slots deleted. 
-        # Transactions linked to Slots -> ? Models: weekly_slot = db.relationship('WeeklySlot', backref='transactions')
-        # By default SQLAlchemy sets FK to Null or restricts.
-        # Prompt says "Associated payment data might be affected". We'll just delete it.
-        # Ideally we should warn.
-        db.session.delete(sem)
+        # Slots (and any archive rows) go; transactions stay, without a semester.
+        # Set-based statements, so nothing is loaded into the session.
+        archive.delete_semester(sem.id)
+        versions.bump(versions.LEDGER)
+        refdata.changed(versions.REFDATA)
         db.session.commit()
         flash('Semester deleted')
     return redirect(url_for('admin_semesters'))
 
-# Init DB
-with app.app_context():
-    db.create_all()
-    if not User.query.filter_by(username='admin').first():
+@app.route('/admin/semester/<int:sem_id>/snapshot')
+@login_required
+def semester_snapshot(sem_id):
+    if current_user.role != 'admin': return redirect(url_for('home'))
+    semester = refdata.semester(sem_id)
+    snapshot = refdata.snapshot(sem_id)
+    if not semester or not snapshot:
+        flash('Semester is not archived')
+        return redirect(url_for('admin_semesters'))
+    names = {row.id: (row.real_name, row.department) for row in db.session.query(
+        User.id, User.real_name, User.department).filter(User.id.in_(list(snapshot.members)))}
+    rows = sorted(
+        ((names.get(user_id, (f'#{user_id}', '')), statuses) for user_id, statuses in snapshot.members.items()),
+        key=lambda row: row[0],
+    )
+    return render_template('admin/semester_snapshot.html', semester=semester, snapshot=snapshot, rows=rows,
+                           subtotals=snapshot.subtotals(),
+                           project_names={p.id: p.name for p in refdata.projects()})
+
+@app.route('/admin/search')
+@read_only
+@login_required
+def admin_search():
+    if current_user.role != 'admin': return redirect(url_for('home'))
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind')
+    if kind in search.KINDS:
+        results = search.search(query, kinds=[kind], limit=50)
+    else:
+        kind = None
+        results = search.search(query)
+    return render_template('admin/search.html', results=results, kind=kind)
+
+@app.cli.command('rebuild-ledger')
+@click.option('--check', is_flag=True, help='Only report differences, do not rewrite the summary.')
+def rebuild_ledger_command(check):
+    """Verify or rebuild the ledger balance summary from the transaction table."""
+    problems = ledger.check()
+    for key, have, want in problems:
+        click.echo(f'{key}: stored {have}, expected {want}')
+    if check:
+        click.echo(f'{len(problems)} mismatched balance rows')
+        raise SystemExit(1 if problems else 0)
+    click.echo(f'Rebuilt {ledger.rebuild()} balance rows')
+
+@app.cli.command('rebuild-arrears')
+@click.option('--check', is_flag=True, help='Only report differences, do not rewrite the table.')
+def rebuild_arrears_command(check):
+    """Verify or rebuild the per-member arrears rows from the dues transactions."""
+    problems = arrears.check()
+    for key, have, want in problems:
+        click.echo(f'{key}: stored {have}, expected {want}')
+    if check:
+        click.echo(f'{len(problems)} mismatched arrears rows')
+        raise SystemExit(1 if problems else 0)
+    count = arrears.rebuild()
+    db.session.commit()
+    click.echo(f'Rebuilt {count} arrears rows')
+
+@app.cli.command('refresh-arrears')
+def refresh_arrears_command():
+    """Count the weeks that started since the last run as owed; run daily (e.g. from cron after midnight)."""
+    semester_ids = arrears.catch_up()
+    db.session.commit()
+    click.echo(f'Arrears counted up to {arrears.counted_until()}; recomputed {len(semester_ids)} semesters')
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    """Rebuild the full-text search index from the indexed tables."""
+    count = search.rebuild()
+    db.session.commit()
+    click.echo(f'Indexed {count} documents')
+
+@app.cli.command('upgrade-db')
+@click.option('--batch-size', default=migrations.DEFAULT_BATCH_SIZE, show_default=True, help='Rows per backfill batch.')
+@click.option('--list', 'list_only', is_flag=True, help='Only list pending migrations.')
+def upgrade_db_command(batch_size, list_only):
+    """Apply pending schema migrations to DATABASE_URL."""
+    if list_only:
+        for version, description, _ in migrations.pending():
+            click.echo(f'{version}  {description}')
+        return
+    migrations.upgrade(echo=click.echo, batch_size=batch_size)
+
+@app.cli.command('build-derivatives')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: one per CPU).')
+def build_derivatives_command(workers):
+    """Generate resized, EXIF-free derivatives for existing uploads."""
+    count = images.backfill(app.config['UPLOAD_FOLDER'], workers=workers, echo=click.echo)
+    click.echo(f'{count} uploads needed derivatives')
+
+@app.cli.command('check-query-plans')
+@click.option('--verbose', is_flag=True, help='Print the plan of every query.')
+def check_query_plans_command(verbose):
+    """Fail if a hot route's query scans a large table end to end (SQLite only)."""
+    import query_plans
+    if db.engine.dialect.name != 'sqlite':
+        click.echo('EXPLAIN QUERY PLAN checks only run against SQLite')
+        return
+    if verbose:
+        for name, stmt in query_plans.route_queries():
+            click.echo(f'{name}:')
+            for detail in query_plans.explain(stmt):
+                click.echo(f'    {detail}')
+    failures = query_plans.check_plans()
+    for name, plan, scanned in failures:
+        click.echo(f'SCAN in {name} on {", ".join(scanned)}:')
+        for detail in plan:
+            click.echo(f'    {detail}')
+    click.echo(f'{len(failures)} queries scan a large table')
+    raise SystemExit(1 if failures else 0)
+
+@app.cli.command('bootstrap')
+def bootstrap_command():
+    """Create tables, apply pending migrations and ensure the admin account exists."""
+    bootstrap_database(echo=click.echo)
+
+@app.cli.command('import-members')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--skip-invalid', is_flag=True, help='Import the valid rows even if others have errors.')
+@click.option('--dry-run', is_flag=True, help='Validate only.')
+@click.option('--workers', type=int, default=None, help='Processes for password hashing (default: one per CPU).')
+@click.option('--passwords-out', type=click.Path(dir_okay=False), help='Write username,password for generated passwords here.')
+def import_members_command(csv_path, skip_invalid, dry_run, workers, passwords_out):
+    """Create member accounts from a CSV with username, real_name, department[, password]."""
+    with open(csv_path, encoding='utf-8-sig') as fh:
+        text = fh.read()
+    result = member_import.import_members(text, skip_invalid=skip_invalid, dry_run=dry_run,
+                                          workers=workers or os.cpu_count())
+    for line, message in result.errors:
+        click.echo(f'line {line}: {message}')
+    generated = [row for row in result.created if row.generated]
+    if passwords_out and generated and not dry_run:
+        with open(passwords_out, 'w', newline='') as fh:
+            writer = csv.writer(fh)
+            writer.writerow(['username', 'password'])
+            writer.writerows((row.username, row.password) for row in generated)
+        click.echo(f'Generated passwords written to {passwords_out}')
+    elif generated and not dry_run:
+        for row in generated:
+            click.echo(f'{row.username},{row.password}')
+    verb = 'would be imported' if dry_run else 'imported'
+    click.echo(f'{len(result.created)} members {verb}, {len(result.errors)} rows with errors')
+    raise SystemExit(1 if result.errors and not skip_invalid else 0)
+
+@app.cli.command('precompile-templates')
+def precompile_templates_command():
+    """Compile every template into the Jinja bytecode cache (JINJA_CACHE_DIR)."""
+    directory = app.config['JINJA_CACHE_DIR']
+    os.makedirs(directory, exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+    names = app.jinja_env.list_templates()
+    for name in names:
+        app.jinja_env.get_template(name)
+    click.echo(f'Compiled {len(names)} templates into {directory}')
+
+def bootstrap_database(echo=print):
+    # Run once per deploy (`flask bootstrap`), not per worker: importing this
+    # module does no database I/O, so gunicorn --preload can fork it safely
+    with app.app_context():
+        db.create_all()
+        migrations.upgrade(echo=echo)
+        if User.query.filter_by(username='admin').first():
+            return
         admin = User(
             username='admin',
-            password=generate_password_hash('admin123', method='scrypt'),
+            password=passwords.hash_password(os.environ.get('ADMIN_PASSWORD', 'admin123')),
             real_name='Administrator',
             department='Admin',
             role='admin'
         )
         db.session.add(admin)
-        db.session.commit()
+        try:
+            db.session.commit()
+            echo('Created admin user')
+        except IntegrityError:
+            # Another bootstrap created it first
+            db.session.rollback()
+
+def create_app():
+    """Application factory for WSGI servers, e.g. gunicorn --preload "app:create_app()".
+
+    Routes are registered on the module-level app and configuration comes from
+    the environment, so this returns that instance; nothing touches the database
+    until the first request.
+    """
+    return app
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,56 @@
+from sqlalchemy import update
+from models import db, Transaction
+import arrears
+import ledger
+import versions
+
+# Review of pending dues slips. A batch of ids is approved or rejected with a
+# single UPDATE ... RETURNING (SQLite 3.35+, PostgreSQL); the returned rows
+# drive one aggregated balance move per (semester, project, type), all in the
+# caller's transaction, as does the move of the members' arrears rows
+# (arrears.py). Only rows still pending are touched, so two admins
+# reviewing the same slips cannot move a balance twice.
+
+ACTIONS = {'approve': 'approved', 'reject': 'rejected'}
+# Ids accepted per request
+MAX_BATCH = 1000
+
+
+def review(txn_ids, action, reason=None):
+    """Approve or reject the pending dues among txn_ids; returns how many changed.
+
+    txn_ids is a list of ids (ints or digit strings, as request.form.getlist gives).
+    Raises ValueError for an unknown action, a malformed id list or an oversized batch.
+    """
+    if action not in ACTIONS:
+        raise ValueError(f'Unknown action: {action}')
+    # A bare string would otherwise be read one character at a time
+    if not isinstance(txn_ids, (list, tuple, set)):
+        raise ValueError('Slip ids must be a list')
+    try:
+        ids = sorted({int(i) for i in txn_ids})
+    except (TypeError, ValueError):
+        raise ValueError('Invalid slip id')
+    if len(ids) > MAX_BATCH:
+        raise ValueError(f'At most {MAX_BATCH} slips per batch')
+    if not ids:
+        return 0
+    new_status = ACTIONS[action]
+    stmt = update(Transaction).where(
+        Transaction.id.in_(ids),
+        Transaction.status == 'pending',
+        Transaction.type == 'income_dues',
+    ).values(
+        status=new_status,
+        rejection_reason=(reason or None) if new_status == 'rejected' else None,
+    ).returning(
+        Transaction.id, Transaction.user_id, Transaction.weekly_slot_id,
+        Transaction.semester_id, Transaction.project_id, Transaction.type, Transaction.amount_minor,
+    ).execution_options(synchronize_session=False)
+    rows = db.session.execute(stmt).all()
+    if rows:
+        ledger.move_status([(r.semester_id, r.project_id, r.type, r.amount_minor) for r in rows],
+                           'pending', new_status)
+        arrears.move_status(rows, 'pending', new_status)
+        versions.bump(versions.LEDGER)
+    return len(rows)
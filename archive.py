@@ -0,0 +1,153 @@
+import json
+from datetime import datetime
+from sqlalchemy import insert, select, update, delete, func, null
+from models import (db, User, Semester, WeeklySlot, Transaction, TransactionArchive,
+                    WeeklySlotArchive, SemesterSnapshot)
+from dues_matrix import DuesMatrix
+import arrears
+import ledger
+import search
+
+# Closing a semester for good.
+#
+# close() freezes the semester's approved totals, per-project subtotals and
+# member x week dues matrix into a SemesterSnapshot, then moves its
+# transactions and weekly slots to the archive tables with one
+# INSERT ... SELECT and one DELETE each. The hot tables keep only open
+# semesters; reports on an archived semester read the snapshot (and the
+# archive table for the row listing). LedgerBalance is untouched: the rows
+# keep their semester, so all-time balances stay the same.
+
+
+class ArchiveError(ValueError):
+    pass
+
+
+class Snapshot:
+    """Decoded SemesterSnapshot; immutable, so it can be cached."""
+
+    def __init__(self, row):
+        self.semester_id = row.semester_id
+        self.closed_at = row.closed_at
+        self.income = row.income_minor
+        self.expense = row.expense_minor
+        self.transaction_count = row.transaction_count
+        self.subtotal_rows = [tuple(r) for r in json.loads(row.subtotal_rows)]
+        matrix = json.loads(row.dues_matrix)
+        self.weeks = [tuple(week) for week in matrix['weeks']]
+        self.members = {int(user_id): statuses for user_id, statuses in matrix['members'].items()}
+
+    @property
+    def balance(self):
+        return self.income - self.expense
+
+    def subtotals(self, project_id=None):
+        """ledger.Subtotals of the frozen approved rows, optionally for one project."""
+        return ledger.Subtotals([
+            (txn_type, row_project, self.semester_id, total, count)
+            for txn_type, row_project, total, count in self.subtotal_rows
+            if project_id is None or row_project == project_id
+        ])
+
+
+def _freeze(semester):
+    subtotals = ledger.subtotals(Transaction.semester_id == semester.id, Transaction.status == 'approved')
+    count = db.session.query(func.count(Transaction.id)).filter(Transaction.semester_id == semester.id).scalar()
+
+    slots = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number).all()
+    members = {user_id for (user_id,) in db.session.query(User.id).filter(User.role == 'member')}
+    members.update(user_id for (user_id,) in db.session.query(Transaction.user_id).filter(
+        Transaction.semester_id == semester.id, Transaction.type == 'income_dues',
+        Transaction.user_id.isnot(None),
+    ).distinct())
+    matrix = DuesMatrix.load(semester.id, sorted(members), slots=slots)
+
+    return SemesterSnapshot(
+        semester_id=semester.id,
+        closed_at=datetime.utcnow(),
+        income_minor=subtotals.income,
+        expense_minor=subtotals.expense,
+        transaction_count=count,
+        subtotal_rows=json.dumps([
+            [txn_type, project_id or 0, int(total or 0), rows]
+            for txn_type, project_id, _, total, rows in subtotals.rows
+        ]),
+        dues_matrix=json.dumps({
+            'weeks': [[s.week_number, s.start_date.isoformat(), s.end_date.isoformat()] for s in slots],
+            'members': {str(user_id): matrix.status_string(user_id) for user_id in matrix.member_ids},
+        }),
+    )
+
+
+def _move(source, target, where, overrides=None):
+    """INSERT INTO target SELECT ... FROM source WHERE where, then delete those rows; returns the row count.
+
+    overrides maps column names to SQL expressions to store instead of the
+    source value; a value of None leaves the column out so the target assigns it.
+    """
+    overrides = overrides or {}
+    columns, values = [], []
+    for column in target.__table__.columns:
+        if column.name in overrides:
+            if overrides[column.name] is None:
+                continue
+            values.append(overrides[column.name])
+        else:
+            values.append(source.__table__.c[column.name])
+        columns.append(column.name)
+    db.session.execute(insert(target).from_select(columns, select(*values).where(where)))
+    return db.session.execute(
+        delete(source).where(where).execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def close(semester):
+    """Snapshot and archive a semester in the current transaction; returns (snapshot row, rows moved).
+
+    Raises ArchiveError if the semester is already archived or still has
+    dues slips waiting for review.
+    """
+    if semester.archived_at:
+        raise ArchiveError('Semester is already archived')
+    pending = db.session.query(func.count(Transaction.id)).filter(
+        Transaction.semester_id == semester.id, Transaction.status == 'pending',
+    ).scalar()
+    if pending:
+        raise ArchiveError(f'Review the {pending} pending slips of this semester before closing it')
+
+    snapshot = _freeze(semester)
+    db.session.add(snapshot)
+    # Transactions first: they reference the slots
+    search.remove(Transaction, Transaction.semester_id == semester.id)
+    moved = _move(Transaction, TransactionArchive, Transaction.semester_id == semester.id)
+    search.index(TransactionArchive, TransactionArchive.semester_id == semester.id)
+    moved += _move(WeeklySlot, WeeklySlotArchive, WeeklySlot.semester_id == semester.id)
+    semester.archived_at = snapshot.closed_at
+    semester.is_active = False
+    return snapshot, moved
+
+
+def delete_semester(semester_id):
+    """Delete a semester with set-based statements; its transactions are kept without a semester.
+
+    Transactions of an archived semester return to the live table (with new
+    ids) so the all-time ledger listing still shows them.
+    """
+    ledger.detach_semester(semester_id)
+    arrears.remove_semester(semester_id)
+    db.session.execute(
+        update(Transaction).where(Transaction.semester_id == semester_id)
+        .values(semester_id=None, weekly_slot_id=None).execution_options(synchronize_session=False)
+    )
+    # They come back under new ids; re-key their search entries too
+    search.remove(TransactionArchive, TransactionArchive.semester_id == semester_id)
+    last_id = db.session.query(func.max(Transaction.id)).scalar() or 0
+    _move(TransactionArchive, Transaction, TransactionArchive.semester_id == semester_id,
+          {'id': None, 'semester_id': null(), 'weekly_slot_id': null()})
+    search.index(Transaction, Transaction.id > last_id)
+    for model in (WeeklySlot, WeeklySlotArchive, SemesterSnapshot):
+        db.session.execute(delete(model).where(model.semester_id == semester_id)
+                           .execution_options(synchronize_session=False))
+    db.session.execute(delete(Semester).where(Semester.id == semester_id)
+                       .execution_options(synchronize_session=False))
+    db.session.expire_all()
@@ -0,0 +1,392 @@
+from datetime import date
+from sqlalchemy import and_, bindparam, case, delete, false, func, insert, update
+from models import db, User, WeeklySlot, WeeklySlotArchive, Transaction, TransactionArchive, MemberArrears, ArrearsDay
+from dues_matrix import UNPAID, PENDING, APPROVED, STATUS_CODES
+
+# Per-member arrears ledger.
+#
+# MemberArrears holds, for every member and every semester with weekly slots,
+# how many weeks are paid (an approved slip), pending (a slip waiting for
+# review) or owed (neither, and started by the ArrearsDay), with the approved
+# and pending amounts; the row with semester_id 0 adds up all of a member's
+# semesters. The dues hot paths apply deltas: a submitted slip, a reviewed
+# batch or a deleted dues transaction works out how the best status of each
+# affected week changed and adds the difference to the semester and total
+# rows in one executemany UPDATE. Rare changes (slots created or regenerated,
+# members added or removed, semesters deleted) recompute the affected rows
+# from that member's or semester's dues and move the total rows by the
+# difference. The daily `flask refresh-arrears` moves the ArrearsDay forward
+# and recomputes the semesters with weeks that started since. Like ledger.py,
+# everything runs in the caller's transaction; `flask rebuild-arrears`
+# recomputes the whole table.
+
+ALL_SEMESTERS = 0
+COUNTERS = ('weeks', 'paid_weeks', 'pending_weeks', 'owed_weeks', 'paid_minor', 'pending_minor')
+# (dues table, slot table); archived semesters live in the second pair
+SOURCES = ((Transaction, WeeklySlot), (TransactionArchive, WeeklySlotArchive))
+# Counter holding the amount of a slip in each status
+AMOUNTS = {'approved': 'paid_minor', 'pending': 'pending_minor'}
+RANKING_SIZE = 50
+BATCH_SIZE = 5000
+
+_table = MemberArrears.__table__
+_add = update(_table).where(
+    _table.c.user_id == bindparam('key_user'), _table.c.semester_id == bindparam('key_semester'),
+).values({name: _table.c[name] + bindparam(f'add_{name}') for name in COUNTERS})
+
+
+def _bucket(code, started):
+    """Counter that a week with this best status counts towards, if any."""
+    if code == APPROVED:
+        return 'paid_weeks'
+    if code == PENDING:
+        return 'pending_weeks'
+    return 'owed_weeks' if started else None
+
+
+def counted_until():
+    """The ArrearsDay, or None before the table was first built; holds off a concurrent refresh."""
+    return db.session.query(ArrearsDay.day).filter(ArrearsDay.id == 1).with_for_update(read=True).scalar()
+
+
+def _started(slot_ids):
+    """The slots among slot_ids that started by the ArrearsDay (none before it exists), in one query
+    that holds off a concurrent refresh like counted_until()."""
+    if not slot_ids:
+        return set()
+    return {slot_id for (slot_id,) in db.session.query(WeeklySlot.id).join(ArrearsDay, ArrearsDay.id == 1).filter(
+        WeeklySlot.id.in_(list(slot_ids)), WeeklySlot.start_date <= ArrearsDay.day,
+    ).with_for_update(read=True, of=ArrearsDay)}
+
+
+def _apply(deltas, semester_rows=True):
+    """Add {(user_id, semester_id): {counter: amount}} to the members' total rows, and to those rows
+    unless semester_rows is False."""
+    merged = {}
+    for (user_id, semester_id), changes in deltas.items():
+        keys = [(user_id, semester_id), (user_id, ALL_SEMESTERS)] if semester_rows else [(user_id, ALL_SEMESTERS)]
+        for key in keys:
+            row = merged.setdefault(key, dict.fromkeys(COUNTERS, 0))
+            for name, amount in changes.items():
+                row[name] += amount
+    params = [
+        dict({f'add_{name}': amount for name, amount in row.items()}, key_user=user_id, key_semester=semester_id)
+        for (user_id, semester_id), row in merged.items() if any(row.values())
+    ]
+    if params:
+        db.session.connection().execute(_add, params)
+
+
+def _week_change(changes, before, after, started):
+    before, after = _bucket(before, started), _bucket(after, started)
+    if before != after:
+        if before:
+            changes[before] = changes.get(before, 0) - 1
+        if after:
+            changes[after] = changes.get(after, 0) + 1
+
+
+def _tracked(txn):
+    return (txn.type == 'income_dues' and txn.user_id is not None and txn.weekly_slot_id is not None
+            and txn.semester_id is not None)
+
+
+def _best(user_id, slot_id, exclude=None):
+    """Best status code among a member's dues for one week."""
+    query = db.session.query(Transaction.status).filter(
+        Transaction.user_id == user_id, Transaction.weekly_slot_id == slot_id, Transaction.type == 'income_dues',
+    )
+    if exclude is not None:
+        query = query.filter(Transaction.id != exclude)
+    return max((STATUS_CODES.get(status, UNPAID) for (status,) in query), default=UNPAID)
+
+
+def record(txn):
+    """Count a dues slip that was just added to the session."""
+    if not _tracked(txn):
+        return
+    # The slip may or may not have been flushed yet (ledger.record flushes it)
+    with db.session.no_autoflush:
+        before = _best(txn.user_id, txn.weekly_slot_id, exclude=txn.id)
+        started = bool(_started([txn.weekly_slot_id]))
+    changes = {}
+    _week_change(changes, before, max(before, STATUS_CODES.get(txn.status, UNPAID)), started)
+    if txn.status in AMOUNTS:
+        changes[AMOUNTS[txn.status]] = txn.amount_minor or 0
+    _apply({(txn.user_id, txn.semester_id): changes})
+
+
+def unrecord(txn):
+    """Take out a dues transaction that is about to be deleted."""
+    if not _tracked(txn):
+        return
+    before = _best(txn.user_id, txn.weekly_slot_id)
+    changes = {}
+    _week_change(changes, before, _best(txn.user_id, txn.weekly_slot_id, exclude=txn.id),
+                 bool(_started([txn.weekly_slot_id])))
+    if txn.status in AMOUNTS:
+        changes[AMOUNTS[txn.status]] = -(txn.amount_minor or 0)
+    _apply({(txn.user_id, txn.semester_id): changes})
+
+
+def move_status(rows, old_status, new_status):
+    """Account for dues whose status was just changed in the database.
+
+    rows are (id, user_id, weekly_slot_id, semester_id, amount_minor) of the
+    transactions that moved, e.g. from approvals' UPDATE ... RETURNING.
+    """
+    rows = [row for row in rows if row.user_id is not None and row.weekly_slot_id is not None
+            and row.semester_id is not None]
+    if not rows or old_status == new_status:
+        return
+    moved = {row.id for row in rows}
+    cells = {(row.user_id, row.weekly_slot_id): row.semester_id for row in rows}
+    before = dict.fromkeys(cells, UNPAID)
+    after = dict.fromkeys(cells, UNPAID)
+    for txn_id, user_id, slot_id, status in db.session.query(
+        Transaction.id, Transaction.user_id, Transaction.weekly_slot_id, Transaction.status,
+    ).filter(
+        Transaction.user_id.in_({user_id for user_id, _ in cells}),
+        Transaction.weekly_slot_id.in_({slot_id for _, slot_id in cells}),
+        Transaction.type == 'income_dues',
+    ):
+        cell = (user_id, slot_id)
+        if cell not in cells:
+            continue
+        code = STATUS_CODES.get(status, UNPAID)
+        after[cell] = max(after[cell], code)
+        before[cell] = max(before[cell], STATUS_CODES.get(old_status, UNPAID) if txn_id in moved else code)
+
+    started = _started({slot_id for _, slot_id in cells})
+    deltas = {}
+    for cell, semester_id in cells.items():
+        _week_change(deltas.setdefault((cell[0], semester_id), {}), before[cell], after[cell], cell[1] in started)
+    for row in rows:
+        changes = deltas[(row.user_id, row.semester_id)]
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            if status in AMOUNTS:
+                changes[AMOUNTS[status]] = changes.get(AMOUNTS[status], 0) + sign * (row.amount_minor or 0)
+    _apply(deltas)
+
+
+# Recomputation, for changes that touch a whole member or semester
+
+def _members(user_ids=None):
+    query = db.session.query(User.id).filter(User.role == 'member')
+    if user_ids is not None:
+        query = query.filter(User.id.in_(list(user_ids)))
+    return [user_id for (user_id,) in query.order_by(User.id)]
+
+
+def _is_started(slot_model, day):
+    return slot_model.start_date <= day if day is not None else false()
+
+
+def _weeks(day, semester_ids=None):
+    """{semester_id: (weekly slots, slots started by day)}, live and archived."""
+    weeks = {}
+    for _, slot_model in SOURCES:
+        query = db.session.query(
+            slot_model.semester_id, func.count(slot_model.id),
+            func.count(case((_is_started(slot_model, day), slot_model.id))),
+        ).group_by(slot_model.semester_id)
+        if semester_ids is not None:
+            query = query.filter(slot_model.semester_id.in_(list(semester_ids)))
+        weeks.update((semester_id, (count, started)) for semester_id, count, started in query)
+    return weeks
+
+
+def _dues(day, user_ids=None, semester_ids=None):
+    """{(user_id, semester_id): (paid weeks, covered weeks, covered weeks started by day, paid_minor,
+    pending_minor)} from the dues rows."""
+    found = {}
+    for model, slot_model in SOURCES:
+        approved = model.status == 'approved'
+        covered = model.status.in_(('pending', 'approved'))
+        query = db.session.query(
+            model.user_id, model.semester_id,
+            func.count(func.distinct(case((approved, model.weekly_slot_id)))),
+            func.count(func.distinct(case((covered, model.weekly_slot_id)))),
+            func.count(func.distinct(case((and_(covered, _is_started(slot_model, day)), model.weekly_slot_id)))),
+            func.sum(case((approved, model.amount_minor), else_=0)),
+            func.sum(case((model.status == 'pending', model.amount_minor), else_=0)),
+        ).outerjoin(slot_model, slot_model.id == model.weekly_slot_id).filter(
+            model.type == 'income_dues', model.user_id.isnot(None), model.weekly_slot_id.isnot(None),
+            model.semester_id.isnot(None),
+        ).group_by(model.user_id, model.semester_id)
+        if user_ids is not None:
+            query = query.filter(model.user_id.in_(list(user_ids)))
+        if semester_ids is not None:
+            query = query.filter(model.semester_id.in_(list(semester_ids)))
+        for user_id, semester_id, *values in query:
+            found[(user_id, semester_id)] = values
+    return found
+
+
+def _expected(day, user_ids=None, semester_ids=None):
+    """Semester rows, as {(user_id, semester_id): counters}, computed from the dues tables with the
+    weeks started by day as owed."""
+    weeks = _weeks(day, semester_ids)
+    dues = _dues(day, user_ids, semester_ids)
+    rows = {}
+    for user_id in _members(user_ids):
+        for semester_id, (count, started) in weeks.items():
+            paid, covered, covered_started, paid_minor, pending_minor = dues.get(
+                (user_id, semester_id), (0, 0, 0, 0, 0))
+            rows[(user_id, semester_id)] = {
+                'weeks': count,
+                'paid_weeks': paid,
+                'pending_weeks': covered - paid,
+                'owed_weeks': max(started - covered_started, 0),
+                'paid_minor': int(paid_minor or 0),
+                'pending_minor': int(pending_minor or 0),
+            }
+    return rows
+
+
+def _insert(rows):
+    values = [dict(counters, user_id=user_id, semester_id=semester_id)
+              for (user_id, semester_id), counters in rows.items()]
+    for start in range(0, len(values), BATCH_SIZE):
+        db.session.execute(insert(MemberArrears), values[start:start + BATCH_SIZE])
+    return len(values)
+
+
+def _delete(*where):
+    db.session.execute(delete(MemberArrears).where(*where).execution_options(synchronize_session=False))
+
+
+def _refresh_totals(user_ids=None):
+    """Rewrite the total rows of the given members (all if None) from their semester rows."""
+    sums = db.session.query(
+        MemberArrears.user_id, *(func.sum(getattr(MemberArrears, name)) for name in COUNTERS),
+    ).filter(MemberArrears.semester_id != ALL_SEMESTERS).group_by(MemberArrears.user_id)
+    where = [MemberArrears.semester_id == ALL_SEMESTERS]
+    if user_ids is not None:
+        sums = sums.filter(MemberArrears.user_id.in_(list(user_ids)))
+        where.append(MemberArrears.user_id.in_(list(user_ids)))
+    found = {user_id: values for user_id, *values in sums}
+    _delete(*where)
+    _insert({
+        (user_id, ALL_SEMESTERS): dict(zip(COUNTERS, (int(v or 0) for v in found.get(user_id, [0] * len(COUNTERS)))))
+        for user_id in _members(user_ids)
+    })
+
+
+def _stored(*where):
+    """{(user_id, semester_id): counters} of the stored rows matching where."""
+    query = db.session.query(MemberArrears.user_id, MemberArrears.semester_id,
+                             *(getattr(MemberArrears, name) for name in COUNTERS)).filter(*where)
+    return {(user_id, semester_id): dict(zip(COUNTERS, values)) for user_id, semester_id, *values in query}
+
+
+def _replace(semester_ids, new):
+    """Swap the rows of these semesters for new, moving the total rows by the difference."""
+    where = MemberArrears.semester_id.in_(list(semester_ids))
+    old = _stored(where)
+    _delete(where)
+    _insert(new)
+    missing = dict.fromkeys(COUNTERS, 0)
+    _apply({
+        key: {name: new.get(key, missing)[name] - old.get(key, missing)[name] for name in COUNTERS}
+        for key in set(old) | set(new)
+    }, semester_rows=False)
+
+
+def refresh_semester(semester_id):
+    """Recompute every member's row for one semester, e.g. after its slots were created or regenerated."""
+    _replace([semester_id], _expected(counted_until(), semester_ids=[semester_id]))
+
+
+def remove_semester(semester_id):
+    """Drop a deleted semester's rows from every member's position."""
+    _replace([semester_id], {})
+
+
+def catch_up(today=None):
+    """Move the ArrearsDay to today, recomputing the semesters with weeks that started since;
+    returns their ids. Builds the whole table if it never was."""
+    today = today or date.today()
+    day = counted_until()
+    if day is None:
+        rebuild(today)
+        return sorted(_weeks(today))
+    if day >= today:
+        return []
+    # Moving the day first makes a concurrent run wait on the row and then find nothing to do
+    moved = db.session.execute(update(ArrearsDay).where(ArrearsDay.id == 1, ArrearsDay.day == day).values(day=today))
+    if not moved.rowcount:
+        return []
+    semester_ids = set()
+    for _, slot_model in SOURCES:
+        semester_ids.update(semester_id for (semester_id,) in db.session.query(slot_model.semester_id).filter(
+            slot_model.start_date > day, slot_model.start_date <= today).distinct())
+    if semester_ids:
+        _replace(semester_ids, _expected(today, semester_ids=semester_ids))
+    return sorted(semester_ids)
+
+
+def add_members(user_ids):
+    """Create the rows of new members (and recompute them, if they already had dues)."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    _delete(MemberArrears.user_id.in_(user_ids))
+    _insert(_expected(counted_until(), user_ids=user_ids))
+    _refresh_totals(user_ids)
+
+
+def remove_member(user_id):
+    """Drop the rows of a member that is about to be deleted."""
+    _delete(MemberArrears.user_id == user_id)
+
+
+def rebuild(today=None):
+    """Recompute the whole table as of today in the current transaction; returns the number of rows."""
+    today = today or date.today()
+    _delete(MemberArrears.user_id.isnot(None))
+    count = _insert(_expected(today))
+    _refresh_totals()
+    db.session.execute(delete(ArrearsDay))
+    db.session.execute(insert(ArrearsDay).values(id=1, day=today))
+    return count + db.session.query(func.count()).filter(MemberArrears.semester_id == ALL_SEMESTERS).scalar()
+
+
+def check():
+    """Compare the stored rows against the dues tables; return [(key, stored, expected)] of mismatches."""
+    expected = _expected(counted_until())
+    for (user_id, _), counters in list(expected.items()):
+        total = expected.setdefault((user_id, ALL_SEMESTERS), dict.fromkeys(COUNTERS, 0))
+        for name, value in counters.items():
+            total[name] += value
+    for user_id in _members():
+        expected.setdefault((user_id, ALL_SEMESTERS), dict.fromkeys(COUNTERS, 0))
+    stored = {
+        (row.user_id, row.semester_id): {name: getattr(row, name) for name in COUNTERS}
+        for row in MemberArrears.query
+    }
+    missing = dict.fromkeys(COUNTERS, 0)
+    return [(key, stored.get(key), expected.get(key))
+            for key in sorted(set(expected) | set(stored))
+            if stored.get(key, missing) != expected.get(key, missing)]
+
+
+# Reads
+
+def position(user_id, semester_id=ALL_SEMESTERS):
+    """A member's MemberArrears row for one semester (default: all of them), or None."""
+    return db.session.get(MemberArrears, (user_id, semester_id))
+
+
+def history(user_id):
+    """A member's semester rows; the caller orders them by semester."""
+    return MemberArrears.query.filter(
+        MemberArrears.user_id == user_id, MemberArrears.semester_id != ALL_SEMESTERS,
+    ).all()
+
+
+def ranking(semester_id=ALL_SEMESTERS, limit=RANKING_SIZE):
+    """[(MemberArrears, User)] of the members owing the most weeks, served by ix_member_arrears_owed."""
+    return db.session.query(MemberArrears, User).join(User, User.id == MemberArrears.user_id).filter(
+        MemberArrears.semester_id == semester_id, MemberArrears.owed_weeks > 0,
+    ).order_by(MemberArrears.owed_weeks.desc(), MemberArrears.user_id.desc()).limit(limit).all()
@@ -0,0 +1,67 @@
+"""Login throughput under concurrency.
+
+Fires bursts of concurrent POST /login requests (a club meeting where everyone
+signs in at once) from a thread pool against the app's test client and reports
+throughput, latency percentiles and how many requests were shed with 503.
+
+    python benchmarks/login.py --concurrency 16 --requests 200
+    PASSWORD_WORKERS=0 python benchmarks/login.py   # hashing inline, for comparison
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ghuroba-login-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ['ADMIN_PASSWORD'] = 'benchmark-password'
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import app as appmod
+    appmod.bootstrap_database(echo=lambda *a: None)
+    app = appmod.create_app()
+
+    def one_login(_):
+        client = app.test_client()
+        started = time.perf_counter()
+        response = client.post('/login', data={'username': 'admin', 'password': 'benchmark-password'})
+        return response.status_code, time.perf_counter() - started
+
+    one_login(0)  # start the pool outside the measurement
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one_login, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    ok = [seconds for status, seconds in results if status == 302]
+    shed = sum(1 for status, _ in results if status == 503)
+    print(f'cost={app.config["SCRYPT_COST"]} workers={app.config["PASSWORD_WORKERS"]} '
+          f'queue={app.config["PASSWORD_QUEUE"]} concurrency={args.concurrency}')
+    print(f'{len(ok)} logins in {elapsed:.2f}s ({len(ok) / elapsed:.1f}/s), {shed} shed with 503')
+    if ok:
+        print('latency ms: p50=%.0f p95=%.0f p99=%.0f mean=%.0f' % (
+            percentile(ok, 50) * 1000, percentile(ok, 95) * 1000, percentile(ok, 99) * 1000,
+            statistics.mean(ok) * 1000))
+    return 0 if len(ok) + shed == args.requests else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
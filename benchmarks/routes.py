@@ -0,0 +1,489 @@
+"""Per-route latency, query count and memory at several dataset sizes.
+
+For each scale a seeded dataset is generated once (benchmarks/seed.py, cached
+in --data-dir) and copied to a scratch file, then every route in app.py is
+driven through the Flask test client: p50/p95/p99 latency, SQL statements
+per request and the peak Python heap growth of one request. Each scale runs
+--runs times on fresh copies and keeps the median; results are compared with
+routes_baseline.json, recorded the same way, and a slower, chattier or
+hungrier route fails the run. With --gunicorn the GET routes are driven over HTTP against a
+local multi-worker gunicorn instead (queries from /metrics, worker peak RSS).
+
+    python benchmarks/routes.py                     # 100 and 10k transactions
+    python benchmarks/routes.py --scale 1m          # a million (seeding takes several minutes)
+    python benchmarks/routes.py --update            # record a new baseline
+    python benchmarks/routes.py --gunicorn --workers 4 --concurrency 8
+"""
+import argparse
+import gc
+import io
+import json
+import math
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, 'routes_baseline.json')
+DATA_DIR = os.path.join(HERE, '.data')
+SCALES = {'100': 100, '10k': 10_000, '1m': 1_000_000}
+DEFAULT_SCALES = ('100', '10k')
+ADMIN_PASSWORD = 'benchmark-admin'
+MEMBER = 'member000000'
+# Start of a JPEG (SOI, JFIF header, start of scan); uploads.ingest keeps it as is
+JFIF_HEADER = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00\xff\xda'
+# A route regresses when its p50 is this much slower than the baseline (its
+# p95 twice as much) and at least LATENCY_SLACK_MS slower, since short routes
+# are noisy; when it runs more SQL statements; or when its peak heap grows
+# past the same factor
+TOLERANCE = 1.5
+TAIL_TOLERANCE = 2 * TOLERANCE
+LATENCY_SLACK_MS = 5.0
+MEMORY_SLACK_KIB = 256
+# Unmeasured requests per route before sampling (caches, compiled templates,
+# SQLite page cache), and runs per scale whose median is compared
+WARMUP_REQUESTS = 3
+RUNS = 3
+
+# path and data may be callables taking the context built by _context();
+# a path of None skips the case (e.g. no archived semester at this scale)
+Case = namedtuple('Case', 'name endpoint role method path data iterations', defaults=('GET', None, None, None))
+
+CASES = [
+    Case('home', 'home', None, path='/'),
+    Case('older_news', 'older_news', None, path=lambda ctx: f'/news/older?cursor={ctx["news_cursor"]}'),
+    Case('api_events', 'api_events', None, path='/api/events'),
+    Case('api_events.since', 'api_events', None, path=lambda ctx: f'/api/events?since={ctx["since"]}'),
+    Case('api_events_ics', 'api_events_ics', None, path='/api/events.ics'),
+    Case('login.form', 'login', None, path='/login'),
+    Case('login', 'login', None, 'POST', '/login', lambda ctx: {'username': MEMBER, 'password': ctx['member_password']}),
+    Case('register.form', 'register', None, path='/register'),
+    Case('transparency', 'transparency', None, path='/transparency'),
+    Case('profile', 'profile', 'member', path='/profile'),
+    Case('dues', 'dues', 'member', path='/dues'),
+    Case('dues_history', 'dues_history', 'member', path='/dues/history'),
+    Case('pay_dues', 'pay_dues', 'member', 'POST', lambda ctx: f'/pay_dues/{ctx["next_slot"]()}',
+         lambda ctx: {'amount': '10', 'slip': (io.BytesIO(ctx['next_slip']()), 'slip.jpg')}),
+    Case('admin_dashboard', 'admin_dashboard', 'admin', path='/admin'),
+    Case('admin_approvals', 'admin_approvals', 'admin', path='/admin/approvals'),
+    Case('admin_approvals.review', 'admin_approvals', 'admin', 'POST', '/admin/approvals',
+         lambda ctx: {'txn_id': ctx['next_pending'](), 'action': 'approve'}),
+    Case('api_approvals', 'api_approvals', 'admin', path='/admin/api/approvals'),
+    Case('admin_semesters', 'admin_semesters', 'admin', path='/admin/semesters'),
+    Case('admin_projects', 'admin_projects', 'admin', path='/admin/projects'),
+    Case('admin_members', 'admin_members', 'admin', path='/admin/members'),
+    Case('admin_members.owed', 'admin_members', 'admin', path='/admin/members?sort=owed'),
+    Case('admin_member_history', 'admin_member_history', 'admin',
+         path=lambda ctx: ctx['member_id'] and f'/admin/members/{ctx["member_id"]}/history'),
+    Case('admin_arrears', 'admin_arrears', 'admin', path='/admin/arrears'),
+    Case('admin_arrears.semester', 'admin_arrears', 'admin',
+         path=lambda ctx: f'/admin/arrears?semester_id={ctx["active_semester"]}'),
+    Case('import_members.form', 'import_members', 'admin', path='/admin/members/import'),
+    Case('admin_treasury', 'admin_treasury', 'admin', path='/admin/treasury'),
+    Case('admin_treasury.semester', 'admin_treasury', 'admin',
+         path=lambda ctx: f'/admin/treasury?semester_id={ctx["active_semester"]}'),
+    Case('admin_treasury.archived', 'admin_treasury', 'admin',
+         path=lambda ctx: ctx['archived_semester'] and f'/admin/treasury?semester_id={ctx["archived_semester"]}'),
+    Case('admin_report', 'admin_report', 'admin', path='/admin/report'),
+    Case('admin_report.archived', 'admin_report', 'admin',
+         path=lambda ctx: ctx['archived_semester'] and f'/admin/report?semester_id={ctx["archived_semester"]}'),
+    Case('export_report.csv', 'export_report', 'admin', path='/admin/report/export.csv', iterations=3),
+    Case('export_report.xlsx', 'export_report', 'admin', path='/admin/report/export.xlsx', iterations=3),
+    Case('admin_news', 'admin_news', 'admin', path='/admin/news'),
+    Case('admin_events', 'admin_events', 'admin', path='/admin/events'),
+    Case('admin_tracker', 'admin_tracker', 'admin', path='/admin/tracker'),
+    Case('api_tracker', 'api_tracker', 'admin', path='/admin/api/tracker'),
+    Case('api_tracker.unpaid', 'api_tracker', 'admin', path='/admin/api/tracker?unpaid=1'),
+    Case('admin_search', 'admin_search', 'admin', path='/admin/search?q=dues'),
+    Case('admin_search.thai', 'admin_search', 'admin', path='/admin/search?q=%E0%B8%AD%E0%B8%B2%E0%B8%AB%E0%B8%A1%E0%B8%B1%E0%B8%94'),
+    Case('admin_search.kind', 'admin_search', 'admin', path='/admin/search?q=week+dues&kind=transaction'),
+    Case('semester_snapshot', 'semester_snapshot', 'admin',
+         path=lambda ctx: ctx['archived_semester'] and f'/admin/semester/{ctx["archived_semester"]}/snapshot'),
+]
+
+# Endpoints deliberately left out, with the reason
+SKIPPED = {
+    'static': 'static files are served by the web server',
+    'metrics': 'instrumentation',
+    'set_lang': 'redirect only',
+    'logout': 'ends the benchmark session',
+    'delete_project': 'destructive one-off admin action',
+    'delete_event': 'destructive one-off admin action',
+    'edit_semester': 'one-off admin action',
+    'delete_semester': 'destructive one-off admin action',
+}
+
+
+def percentile(values, pct):
+    # Nearest rank: with 20 samples p95 is the second slowest, so one stray pause doesn't decide it
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(len(ordered) * pct / 100) - 1)]
+
+
+def uncovered(app):
+    """Endpoints of app with neither a case nor a SKIPPED reason."""
+    covered = {case.endpoint for case in CASES} | set(SKIPPED)
+    return sorted({rule.endpoint for rule in app.url_map.iter_rules()} - covered)
+
+
+def ensure_dataset(scale, data_dir, seed):
+    """Path of the seeded SQLite file for scale, generating it on first use."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f'club-{scale}-seed{seed}.db')
+    if not os.path.exists(path):
+        print(f'[{scale}] seeding {SCALES[scale]} transactions into {path}')
+        env = dict(os.environ, ADMIN_PASSWORD=ADMIN_PASSWORD)
+        partial = path + '.partial'
+        if os.path.exists(partial):
+            os.unlink(partial)
+        subprocess.run([sys.executable, os.path.join(HERE, 'seed.py'), '--database', 'sqlite:///' + partial,
+                        '--transactions', str(SCALES[scale]), '--seed', str(seed), '--archive-closed'],
+                       cwd=ROOT, env=env, check=True)
+        os.replace(partial, path)
+    # Datasets cached by an older checkout get the migrations added since
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + path, SECRET_KEY='benchmark', FLASK_APP='app')
+    subprocess.run([sys.executable, '-m', 'flask', 'upgrade-db'], cwd=ROOT, env=env, check=True, capture_output=True)
+    return path
+
+
+def scratch_copy(path):
+    workdir = tempfile.mkdtemp(prefix='ghuroba-routes-')
+    target = os.path.join(workdir, 'bench.db')
+    shutil.copyfile(path, target)
+    if os.path.exists(path + '-wal'):
+        shutil.copyfile(path + '-wal', target + '-wal')
+    return workdir, target
+
+
+# Test-client run (in a child process so each scale gets a fresh app and DATABASE_URL)
+
+def _context(app):
+    import seed
+    from models import db, User, Semester, WeeklySlot, Transaction, Announcement
+    from pagination import keyset_page
+    ctx = {'member_password': seed.MEMBER_PASSWORD, 'since': '2000-01-01T00:00:00Z'}
+    with app.app_context():
+        active = Semester.query.filter_by(is_active=True).first()
+        archived = Semester.query.filter(Semester.archived_at.isnot(None)).order_by(Semester.id.desc()).first()
+        ctx['active_semester'] = active.id if active else ''
+        ctx['archived_semester'] = archived.id if archived else None
+        ctx['member_id'] = db.session.query(User.id).filter_by(username=MEMBER).scalar()
+        slot_ids = [s.id for s in WeeklySlot.query.filter_by(semester_id=ctx['active_semester'])]
+        page = keyset_page(Announcement.query, Announcement, None, per_page=9, column=Announcement.created_at)
+        ctx['news_cursor'] = page.next_cursor or ''
+    counter = iter(range(10 ** 9))
+    ctx['next_slot'] = lambda: slot_ids[next(counter) % len(slot_ids)]
+    ctx['next_slip'] = lambda: JFIF_HEADER + os.urandom(512)
+
+    def next_pending():
+        with app.app_context():
+            row = db.session.query(Transaction.id).filter_by(status='pending', type='income_dues').order_by(
+                Transaction.id).first()
+        return row.id if row else ''
+    ctx['next_pending'] = next_pending
+    return ctx
+
+
+def _resolve(value, ctx):
+    return value(ctx) if callable(value) else value
+
+
+def run_test_client(requests_per_case):
+    import tracemalloc
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    os.chdir(ROOT)
+    import app as appmod
+    app = appmod.create_app()
+    app.config['UPLOAD_FOLDER'] = tempfile.mkdtemp(prefix='ghuroba-uploads-')
+    missing = uncovered(app)
+    ctx = _context(app)
+
+    statements = [0]
+    event.listen(Engine, 'before_cursor_execute', lambda *args: statements.__setitem__(0, statements[0] + 1))
+    clients = {None: app.test_client(), 'member': app.test_client(), 'admin': app.test_client()}
+    clients['member'].post('/login', data={'username': MEMBER, 'password': ctx['member_password']})
+    clients['admin'].post('/login', data={'username': 'admin', 'password': ADMIN_PASSWORD})
+
+    def send(case):
+        path = _resolve(case.path, ctx)
+        data = _resolve(case.data, ctx)
+        before = statements[0]
+        started = time.perf_counter()
+        response = clients[case.role].open(path, method=case.method, data=data)
+        response.get_data()
+        return time.perf_counter() - started, statements[0] - before, response.status_code
+
+    results = {}
+    for case in CASES:
+        if _resolve(case.path, ctx) is None:
+            continue
+        for _ in range(WARMUP_REQUESTS):
+            send(case)
+        # Collector pauses land on random requests; keep them out of the samples
+        gc.collect()
+        gc.disable()
+        try:
+            samples = [send(case) for _ in range(case.iterations or requests_per_case)]
+        finally:
+            gc.enable()
+        seconds = [s[0] for s in samples]
+        results[case.name] = {
+            'p50_ms': round(percentile(seconds, 50) * 1000, 2),
+            'p95_ms': round(percentile(seconds, 95) * 1000, 2),
+            'p99_ms': round(percentile(seconds, 99) * 1000, 2),
+            'queries': max(s[1] for s in samples),
+            'errors': sum(1 for s in samples if s[2] >= 500),
+        }
+
+    # Memory in a separate pass: tracemalloc slows everything down
+    tracemalloc.start()
+    for case in CASES:
+        if case.name not in results:
+            continue
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        send(case)
+        results[case.name]['peak_kib'] = round((tracemalloc.get_traced_memory()[1] - base) / 1024)
+    tracemalloc.stop()
+    return {'routes': results, 'uncovered': missing}
+
+
+# gunicorn run
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _sql_counts(base_url):
+    """{endpoint: (requests, statements)} from /metrics."""
+    text = urllib.request.urlopen(base_url + '/metrics').read().decode()
+    counts = {}
+    for line in text.splitlines():
+        for metric, index in (('ghuroba_request_duration_seconds_count', 0), ('ghuroba_sql_statements_total', 1)):
+            if line.startswith(metric + '{'):
+                endpoint = line.split('endpoint="', 1)[1].split('"', 1)[0]
+                pair = counts.setdefault(endpoint, [0, 0])
+                pair[index] = float(line.rsplit(' ', 1)[1])
+    return counts
+
+
+def _worker_peak_rss_kib(master_pid):
+    """Largest VmHWM among the gunicorn master's children (Linux only)."""
+    peak = None
+    for pid in filter(str.isdigit, os.listdir('/proc') if os.path.isdir('/proc') else []):
+        try:
+            with open(f'/proc/{pid}/stat') as fh:
+                if int(fh.read().rsplit(')', 1)[1].split()[1]) != master_pid:
+                    continue
+            with open(f'/proc/{pid}/status') as fh:
+                for line in fh:
+                    if line.startswith('VmHWM:'):
+                        peak = max(peak or 0, int(line.split()[1]))
+        except (OSError, ValueError, IndexError):
+            continue
+    return peak
+
+
+def _opener(base_url, username, password):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+    if username:
+        body = urllib.parse.urlencode({'username': username, 'password': password}).encode()
+        opener.open(base_url + '/login', body)
+    return opener
+
+
+def run_gunicorn(db_path, workdir, workers, concurrency, requests_per_case):
+    sys.path.insert(0, HERE)
+    import seed
+    port = _free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + db_path, SECRET_KEY='benchmark',
+               METRICS_DIR=os.path.join(workdir, 'metrics'), PYTHONPATH=ROOT)
+    os.makedirs(env['METRICS_DIR'], exist_ok=True)
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--preload', '-w', str(workers),
+                               '-b', f'127.0.0.1:{port}', 'app:create_app()'], cwd=ROOT, env=env)
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(base_url + '/login')
+                break
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.1)
+        else:
+            raise SystemExit('gunicorn did not start')
+        openers = {None: _opener(base_url, None, None),
+                   'member': _opener(base_url, MEMBER, seed.MEMBER_PASSWORD),
+                   'admin': _opener(base_url, 'admin', ADMIN_PASSWORD)}
+        ctx = {'since': '2000-01-01T00:00:00Z', 'news_cursor': '', 'active_semester': '', 'archived_semester': None,
+               'member_id': None}
+
+        def fetch(opener, url):
+            started = time.perf_counter()
+            try:
+                with opener.open(url) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+            return time.perf_counter() - started, status
+
+        results = {}
+        for case in CASES:
+            path = _resolve(case.path, ctx)
+            if case.method != 'GET' or path is None:
+                continue
+            url = base_url + path
+            fetch(openers[case.role], url)
+            before = _sql_counts(base_url).get(case.endpoint, [0, 0])
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                samples = list(pool.map(lambda _: fetch(openers[case.role], url),
+                                        range(case.iterations or requests_per_case)))
+            time.sleep(1.1)  # let every worker flush its counters (METRICS_FLUSH_SECONDS)
+            after = _sql_counts(base_url).get(case.endpoint, [0, 0])
+            seconds = [s[0] for s in samples]
+            handled = after[0] - before[0]
+            results[case.name] = {
+                'p50_ms': round(percentile(seconds, 50) * 1000, 2),
+                'p95_ms': round(percentile(seconds, 95) * 1000, 2),
+                'p99_ms': round(percentile(seconds, 99) * 1000, 2),
+                'queries': round((after[1] - before[1]) / handled, 1) if handled else None,
+                'errors': sum(1 for s in samples if s[1] >= 500),
+                'worker_peak_rss_kib': _worker_peak_rss_kib(server.pid),
+            }
+        return {'routes': results, 'uncovered': []}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+# Reporting
+
+def median_result(results):
+    """One result from several runs of a scale: per route the median latencies
+    and peak memory, the most queries and every error."""
+    routes = {}
+    for name, first in results[0]['routes'].items():
+        rows = [result['routes'][name] for result in results if name in result['routes']]
+        merged = {}
+        for metric in first:
+            values = [row[metric] for row in rows]
+            if metric == 'errors':
+                merged[metric] = sum(values)
+            elif None in values:
+                merged[metric] = None
+            elif metric == 'queries':
+                merged[metric] = max(values)
+            else:
+                merged[metric] = round(statistics.median(values), 2)
+        routes[name] = merged
+    return {'routes': routes, 'uncovered': results[0]['uncovered']}
+
+
+def report(scale, result):
+    print(f'\n[{scale}] {"route":<28} {"p50":>9} {"p95":>9} {"p99":>9} {"queries":>8} {"peak KiB":>9}')
+    for name, row in result['routes'].items():
+        peak = row.get('peak_kib', row.get('worker_peak_rss_kib'))
+        print(f'[{scale}] {name:<28} {row["p50_ms"]:>9} {row["p95_ms"]:>9} {row["p99_ms"]:>9} '
+              f'{row["queries"] if row["queries"] is not None else "-":>8} {peak if peak is not None else "-":>9}')
+
+
+def regressions(scale, result, baseline):
+    failures = [f'{scale}: endpoint {e} has no benchmark case (add one to CASES or SKIPPED)'
+                for e in result['uncovered']]
+    for name, row in result['routes'].items():
+        if row['errors']:
+            failures.append(f'{scale}/{name}: {row["errors"]} responses with a 5xx status')
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        for metric, factor in (('p50_ms', TOLERANCE), ('p95_ms', TAIL_TOLERANCE)):
+            if row[metric] > expected[metric] * factor and row[metric] - expected[metric] > LATENCY_SLACK_MS:
+                failures.append(f'{scale}/{name}: {metric} {row[metric]} is over {factor}x the baseline {expected[metric]}')
+        if row['queries'] is not None and expected.get('queries') is not None and row['queries'] > expected['queries']:
+            failures.append(f'{scale}/{name}: {row["queries"]} queries per request, baseline {expected["queries"]}')
+        peak, expected_peak = row.get('peak_kib'), expected.get('peak_kib')
+        if peak is not None and expected_peak is not None and \
+                peak > expected_peak * TOLERANCE and peak - expected_peak > MEMORY_SLACK_KIB:
+            failures.append(f'{scale}/{name}: peak heap {peak} KiB is over {TOLERANCE}x the baseline {expected_peak}')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', action='append', choices=sorted(SCALES),
+                        help=f'Dataset size(s) to run (default: {", ".join(DEFAULT_SCALES)}).')
+    parser.add_argument('--requests', type=int, default=20, help='Measured requests per route.')
+    parser.add_argument('--runs', type=int, default=RUNS, help='Runs per scale; the median is kept.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--data-dir', default=DATA_DIR, help='Where seeded datasets are cached.')
+    parser.add_argument('--gunicorn', action='store_true', help='Drive a local gunicorn instead of the test client.')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--update', action='store_true', help='Write the results as the new baseline.')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        json.dump(run_test_client(args.requests), sys.stdout)
+        return 0
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as fh:
+            baseline = json.load(fh)
+    failures = []
+    for scale in args.scale or DEFAULT_SCALES:
+        dataset = ensure_dataset(scale, args.data_dir, args.seed)
+        key = f'gunicorn-{scale}' if args.gunicorn else scale
+        runs = []
+        for _ in range(max(args.runs, 1)):
+            # A fresh copy per run: the POST cases use up slots and pending slips
+            workdir, db_path = scratch_copy(dataset)
+            try:
+                if args.gunicorn:
+                    runs.append(run_gunicorn(db_path, workdir, args.workers, args.concurrency, args.requests))
+                else:
+                    env = dict(os.environ, DATABASE_URL='sqlite:///' + db_path, SECRET_KEY='benchmark')
+                    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', scale,
+                                          '--requests', str(args.requests)],
+                                         cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+                    runs.append(json.loads(out))
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+        result = median_result(runs)
+        report(scale, result)
+        if args.update:
+            baseline[key] = result['routes']
+        else:
+            failures += regressions(scale, result, baseline.get(key, {}))
+
+    if args.update:
+        with open(BASELINE, 'w') as fh:
+            json.dump(baseline, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        print(f'\nBaseline written to {BASELINE}')
+        return 0
+    for failure in failures:
+        print('REGRESSION: ' + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
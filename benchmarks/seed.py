@@ -0,0 +1,241 @@
+"""Synthetic club dataset generator.
+
+Creates a reproducible (seeded) club: members, several semesters with their
+weekly slots, dues slips in every status, donations and expenses against
+projects, announcements and activities. Rows are written with multi-row
+inserts in batches and the ledger summary, arrears rows and search index are
+rebuilt once at the end, so a million transactions take minutes, not hours.
+Refuses to touch a database that already has transactions.
+
+    python benchmarks/seed.py --database sqlite:////tmp/bench.db --transactions 10000
+    python benchmarks/seed.py --database sqlite:////tmp/bench.db --transactions 1000000 --archive-closed
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH_SIZE = 5000
+WEEKS_PER_SEMESTER = 17
+# Share of transactions by type; the rest are expenses
+DUES_SHARE = 0.8
+DONATION_SHARE = 0.12
+MEMBER_PASSWORD = 'benchmark-member'
+
+DEPARTMENTS = ['วิศวกรรมศาสตร์', 'วิทยาศาสตร์', 'แพทยศาสตร์', 'บริหารธุรกิจ', 'Engineering', 'Science', 'Economics']
+FIRST_NAMES = ['อาหมัด', 'ฟาติมะห์', 'อิบรอฮีม', 'มัรยัม', 'ยูซุฟ', 'Aisha', 'Omar', 'Hassan', 'Zainab', 'Bilal']
+LAST_NAMES = ['สะมะแอ', 'หะยีดาโอะ', 'เจะมะ', 'ดอเลาะ', 'Abdullah', 'Rahman', 'Salleh', 'Yusof']
+PROJECTS = ['อิฟตาร์รวมใจ', 'ค่ายเยาวชน', 'Qurban 1447', 'ห้องละหมาด', 'Study Circle']
+NEWS_TOPICS = ['ประชุมสมาชิก', 'กิจกรรมรอมฎอน', 'รับสมัครอาสาสมัคร', 'Annual General Meeting', 'Fundraising update',
+               'ผลการดำเนินงานโครงการ', 'Study circle schedule']
+PLACES = ['ห้องประชุม 1', 'มัสยิดกลาง', 'Student Centre', 'Online']
+
+
+def _batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(model, rows, echo, label):
+    from sqlalchemy import insert
+    from models import db
+    written = 0
+    for batch in _batched(rows):
+        db.session.execute(insert(model), batch)
+        db.session.commit()
+        written += len(batch)
+        if written % (BATCH_SIZE * 20) == 0:
+            echo(f'  {label}: {written}')
+    return written
+
+
+def _moment(rng, day, spread_days=7):
+    return datetime.combine(day, datetime.min.time()) + timedelta(
+        days=rng.randrange(spread_days), seconds=rng.randrange(8 * 3600, 22 * 3600))
+
+
+def generate(transactions, members=None, semesters=4, news=None, events=None, seed=1, archive_closed=False,
+             echo=print):
+    """Fill the current app's database; must be called inside an app context. Returns row counts."""
+    from models import db, User, Semester, WeeklySlot, Project, Announcement, Transaction, Activity
+    import archive
+    import arrears
+    import ledger
+    import passwords
+    import search
+    import slots
+    import versions
+
+    if db.session.query(Transaction.id).first() is not None:
+        raise SystemExit('The database already has transactions; seed an empty one')
+    rng = random.Random(seed)
+    n_dues = int(transactions * DUES_SHARE)
+    n_donations = int(transactions * DONATION_SHARE)
+    n_expenses = transactions - n_dues - n_donations
+    # Enough members that about three quarters of the member-weeks are paid
+    members = members or max(20, math.ceil(n_dues / (semesters * WEEKS_PER_SEMESTER * 0.75)))
+    news = news if news is not None else min(5000, max(30, transactions // 1000))
+    events = events if events is not None else min(2000, max(20, transactions // 2000))
+    counts = {}
+
+    # Members share one hash: hashing a million-row club's passwords is not what we measure
+    password = passwords.hash_password(MEMBER_PASSWORD)
+    first_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    counts['members'] = _insert(User, ({
+        'username': f'member{i:06d}',
+        'password': password,
+        'real_name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+        'department': rng.choice(DEPARTMENTS),
+        'role': 'member',
+    } for i in range(members)), echo, 'members')
+    member_ids = list(range(first_id, first_id + members))
+
+    # Semesters back to back, the newest one active and in progress
+    today = date.today()
+    length = timedelta(weeks=WEEKS_PER_SEMESTER) - timedelta(days=1)
+    start = today - timedelta(weeks=WEEKS_PER_SEMESTER // 2)
+    starts = [start - timedelta(weeks=(WEEKS_PER_SEMESTER + 3) * i) for i in reversed(range(semesters))]
+    semester_rows = []
+    for i, sem_start in enumerate(starts):
+        sem = Semester(name=f'{i + 1}/{sem_start.year + 543}', start_date=sem_start, end_date=sem_start + length,
+                       is_active=i == semesters - 1)
+        db.session.add(sem)
+        db.session.flush()
+        slots.create(sem.id, sem.start_date, sem.end_date)
+        semester_rows.append(sem)
+    projects = [Project(name=name, description=f'{name} ({seed})', status=rng.choice(['Active', 'Active', 'Completed']))
+                for name in PROJECTS]
+    db.session.add_all(projects)
+    db.session.commit()
+    counts['semesters'] = semesters
+    project_ids = [p.id for p in projects]
+    slots_by_semester = {
+        sem.id: WeeklySlot.query.filter_by(semester_id=sem.id).order_by(WeeklySlot.week_number).all()
+        for sem in semester_rows
+    }
+
+    def dues():
+        per_semester = [n_dues // semesters + (1 if i < n_dues % semesters else 0) for i in range(semesters)]
+        for sem, wanted in zip(semester_rows, per_semester):
+            sem_slots = slots_by_semester[sem.id]
+            cells = len(sem_slots) * members
+            # Distinct (member, week) pairs while they last, repeats (re-submitted slips) after that
+            picks = rng.sample(range(cells), min(wanted, cells)) + [rng.randrange(cells) for _ in range(wanted - cells)]
+            for cell in picks:
+                slot = sem_slots[cell % len(sem_slots)]
+                roll = rng.random()
+                if sem.is_active:
+                    status = 'approved' if roll < 0.7 else 'pending' if roll < 0.9 else 'rejected'
+                else:
+                    status = 'approved' if roll < 0.96 else 'rejected'
+                yield {
+                    'type': 'income_dues',
+                    'amount_minor': rng.choice((1000, 1000, 1000, 2000)),
+                    'description': f'Week {slot.week_number} Dues',
+                    'date': _moment(rng, slot.start_date),
+                    'user_id': member_ids[cell // len(sem_slots)],
+                    'slip_filename': f'{cell % 256:02x}/{rng.getrandbits(128):032x}.jpg',
+                    'weekly_slot_id': slot.id,
+                    'status': status,
+                    'rejection_reason': 'Slip unreadable' if status == 'rejected' else None,
+                    'semester_id': sem.id,
+                }
+
+    def ledger_entries(count, txn_type):
+        for _ in range(count):
+            sem = rng.choice(semester_rows)
+            yield {
+                'type': txn_type,
+                'amount_minor': rng.randrange(100, 5000) * 100,
+                'description': rng.choice(PROJECTS) if txn_type == 'expense' else f'Donation from {rng.choice(FIRST_NAMES)}',
+                'date': _moment(rng, sem.start_date, spread_days=WEEKS_PER_SEMESTER * 7),
+                'project_id': rng.choice(project_ids + [None]),
+                'status': 'approved',
+                'semester_id': sem.id,
+            }
+
+    counts['dues'] = _insert(Transaction, dues(), echo, 'dues')
+    counts['donations'] = _insert(Transaction, ledger_entries(n_donations, 'income_donation'), echo, 'donations')
+    counts['expenses'] = _insert(Transaction, ledger_entries(n_expenses, 'expense'), echo, 'expenses')
+
+    first_day = starts[0]
+    span_days = (today - first_day).days + 1
+    counts['announcements'] = _insert(Announcement, ({
+        'title': f'{rng.choice(NEWS_TOPICS)} #{i + 1}',
+        'content': ' '.join(rng.choice(NEWS_TOPICS) for _ in range(40)),
+        'created_at': _moment(rng, first_day, spread_days=span_days),
+    } for i in range(news)), echo, 'announcements')
+
+    def activities():
+        for i in range(events):
+            begins = _moment(rng, first_day, spread_days=span_days + 120)
+            yield {
+                'title': f'{rng.choice(NEWS_TOPICS)} ({i + 1})',
+                'description': rng.choice(NEWS_TOPICS),
+                'start_date': begins,
+                'end_date': begins + timedelta(hours=rng.choice((1, 2, 3, 24))),
+                'location': rng.choice(PLACES),
+                'created_at': begins - timedelta(days=14),
+                'updated_at': begins - timedelta(days=14),
+            }
+    counts['activities'] = _insert(Activity, activities(), echo, 'activities')
+
+    echo(f'  rebuilt {ledger.rebuild()} balance rows')
+    echo(f'  rebuilt {arrears.rebuild()} arrears rows')
+    echo(f'  indexed {search.rebuild()} search documents')
+    if archive_closed:
+        for sem in semester_rows[:-1]:
+            _, moved = archive.close(db.session.get(Semester, sem.id))
+            db.session.commit()
+            echo(f'  archived {sem.name}: {moved} rows')
+    versions.bump(versions.LEDGER, versions.NEWS, versions.EVENTS, versions.USERS, versions.REFDATA)
+    db.session.commit()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', required=True, help='SQLAlchemy URL of an empty (or new) database.')
+    parser.add_argument('--transactions', type=int, default=10000)
+    parser.add_argument('--members', type=int, help='Default: enough to pay about 75%% of member-weeks.')
+    parser.add_argument('--semesters', type=int, default=4)
+    parser.add_argument('--news', type=int)
+    parser.add_argument('--events', type=int)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--archive-closed', action='store_true', help='Close and archive every semester but the last.')
+    args = parser.parse_args()
+
+    os.environ['DATABASE_URL'] = args.database
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import app as appmod
+    appmod.bootstrap_database(echo=lambda *a: None)
+    started = time.perf_counter()
+    with appmod.app.app_context():
+        counts = generate(args.transactions, members=args.members, semesters=args.semesters, news=args.news,
+                          events=args.events, seed=args.seed, archive_closed=args.archive_closed)
+        # Fold the WAL into the main file so the database can be copied as one file
+        if appmod.db.engine.dialect.name == 'sqlite':
+            with appmod.db.engine.connect() as conn:
+                conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+        appmod.db.session.remove()
+        for engine in appmod.db.engines.values():
+            engine.dispose()
+    print(', '.join(f'{name}={count}' for name, count in counts.items()) +
+          f' in {time.perf_counter() - started:.1f}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
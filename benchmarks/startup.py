@@ -0,0 +1,105 @@
+"""Worker startup benchmark.
+
+Measures, in fresh interpreter processes, how long `import app` takes, how many
+database connections the import opens (must be zero so gunicorn --preload can
+fork safely) and how long the first request to the home page takes (template
+compilation dominates it). Results are compared with startup_baseline.json.
+
+    python benchmarks/startup.py              # compare with the baseline
+    python benchmarks/startup.py --update     # record a new baseline
+    python benchmarks/startup.py --bytecode   # with a warm Jinja bytecode cache
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_baseline.json')
+# A run fails when a median is this much slower than the baseline
+TOLERANCE = 1.5
+
+CHILD = r'''
+import json, sys, time
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+connections = []
+event.listen(Pool, 'connect', lambda *args: connections.append(1))
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+connections_at_import = len(connections)
+response = app.create_app().test_client().get('/')
+first_request = time.perf_counter()
+assert response.status_code == 200, response.status_code
+json.dump({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (first_request - imported) * 1000,
+    'connections_at_import': connections_at_import,
+}, sys.stdout)
+'''
+
+
+def run_child(env):
+    out = subprocess.run([sys.executable, '-c', CHILD], cwd=ROOT, env=env,
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--update', action='store_true', help='Write the results as the new baseline.')
+    parser.add_argument('--bytecode', action='store_true', help='Precompile templates into a bytecode cache first.')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ghuroba-startup-')
+    env = dict(os.environ,
+               DATABASE_URL='sqlite:///' + os.path.join(workdir, 'bench.db'),
+               SECRET_KEY=os.environ.get('SECRET_KEY', 'benchmark'),
+               JINJA_CACHE_DIR=os.path.join(workdir, 'jinja_cache'),
+               FLASK_APP='app')
+    subprocess.run([sys.executable, '-m', 'flask', 'bootstrap'], cwd=ROOT, env=env, check=True, capture_output=True)
+    if args.bytecode:
+        subprocess.run([sys.executable, '-m', 'flask', 'precompile-templates'], cwd=ROOT, env=env,
+                       check=True, capture_output=True)
+
+    samples = [run_child(env) for _ in range(args.runs)]
+    result = {
+        'import_ms': round(statistics.median(s['import_ms'] for s in samples), 1),
+        'first_request_ms': round(statistics.median(s['first_request_ms'] for s in samples), 1),
+        'connections_at_import': max(s['connections_at_import'] for s in samples),
+    }
+    key = 'bytecode' if args.bytecode else 'cold'
+    print(f'{key}: ' + ', '.join(f'{k}={v}' for k, v in result.items()))
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as fh:
+            baseline = json.load(fh)
+    if args.update:
+        baseline[key] = result
+        with open(BASELINE, 'w') as fh:
+            json.dump(baseline, fh, indent=2, sort_keys=True)
+            fh.write('\n')
+        print(f'Baseline written to {BASELINE}')
+        return 0
+
+    failures = []
+    if result['connections_at_import']:
+        failures.append(f'importing app opened {result["connections_at_import"]} database connections')
+    for metric in ('import_ms', 'first_request_ms'):
+        expected = baseline.get(key, {}).get(metric)
+        if expected and result[metric] > expected * TOLERANCE:
+            failures.append(f'{metric} {result[metric]} is over {TOLERANCE}x the baseline {expected}')
+    for failure in failures:
+        print('REGRESSION: ' + failure)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+
+# In-process caches for rendered output.
+#
+# FragmentCache holds rendered HTML fragments (the home page's announcement and
+# event sections) keyed by (name, *parts), where the parts include the language
+# and the data-version stamp the fragment was rendered from. A write bumps the
+# stamp, so other workers stop reading the old entry on their next request;
+# the worker that handled the write also drops it at once with invalidate().
+# The first miss on a key starts a render that later misses wait for and
+# share, value or exception, so concurrent requests cause one render even
+# when it fails; the next miss after it finishes renders afresh.
+#
+# TTLCache is a plain LRU whose entries also expire after `ttl` seconds; it
+# backs the reference-data snapshots in refdata.py.
+
+
+class _Render:
+    """A render in progress, shared by every request waiting for its key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class FragmentCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._rendering = {}
+
+    def _lookup(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def get_or_render(self, key, render):
+        """Cached value for key, calling render() once on a miss."""
+        value = self._lookup(key)
+        if value is not None:
+            return value
+        with self._lock:
+            # A render may have finished since the lookup
+            value = self._entries.get(key)
+            if value is not None:
+                return value
+            pending = self._rendering.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._rendering[key] = _Render()
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+        try:
+            pending.value = render()
+        except BaseException as error:
+            pending.error = error
+            raise
+        finally:
+            with self._lock:
+                if pending.error is None:
+                    self._entries[key] = pending.value
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                del self._rendering[key]
+            pending.done.set()
+        return pending.value
+
+    def invalidate(self, *names):
+        """Drop every entry for the given fragment names (all if none given)."""
+        with self._lock:
+            if not names:
+                self._entries.clear()
+                return
+            for key in [k for k in self._entries if k[0] in names]:
+                del self._entries[key]
+
+
+class TTLCache:
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key, load):
+        """Cached value for key (None is a valid value), calling load() when missing or expired."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+        value = load()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+fragments = FragmentCache()
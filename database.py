@@ -0,0 +1,120 @@
+import os
+from functools import partial, wraps
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Engine configuration and read/write routing.
+#
+# SQLite connections are tuned on connect: WAL lets readers run alongside a
+# writer, busy_timeout makes a second writer wait instead of failing with
+# "database is locked", synchronous=NORMAL is durable enough under WAL and
+# mmap_size serves hot pages from the page cache. Routes decorated with
+# @read_only send their SELECTs to a separate 'readonly' engine (a mode=ro
+# connection to the same SQLite file, or READ_DATABASE_URL for a server
+# database), so public pages never queue behind pay_dues or approvals for a
+# pooled connection. Writes go to the primary engine, except inside a
+# @read_only view, where a flush or DML statement raises ReadOnlyError rather
+# than quietly taking a write connection.
+
+READONLY_BIND = 'readonly'
+
+
+class ReadOnlyError(RuntimeError):
+    pass
+
+
+def _sqlite_file(url, instance_path):
+    """Absolute path of a file-backed SQLite URL, or None."""
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    path = url.database[5:] if url.query.get('uri') else url.database
+    if path.startswith('file:'):
+        path = path[5:]
+    return path if os.path.isabs(path) else os.path.join(instance_path, path)
+
+
+def configure(app):
+    """Fill in pool options and the read-only bind; call before db.init_app(app)."""
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)))
+    app.config.setdefault('SQLITE_MMAP_SIZE', int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)))
+    app.config.setdefault('READ_DATABASE_URL', os.environ.get('READ_DATABASE_URL'))
+
+    primary = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if not primary:
+        return
+    url = make_url(primary)
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    if url.get_backend_name() == 'sqlite':
+        # One file, one writer at a time: a small pool is enough and waiting
+        # for a connection is cheaper than contending for the write lock
+        options.setdefault('pool_size', int(os.environ.get('DB_POOL_SIZE', 5)))
+        options.setdefault('max_overflow', int(os.environ.get('DB_MAX_OVERFLOW', 5)))
+        options.setdefault('pool_timeout', 10)
+    else:
+        options.setdefault('pool_size', int(os.environ.get('DB_POOL_SIZE', 10)))
+        options.setdefault('max_overflow', int(os.environ.get('DB_MAX_OVERFLOW', 10)))
+        options.setdefault('pool_pre_ping', True)
+        options.setdefault('pool_recycle', 1800)
+
+    read_url = app.config['READ_DATABASE_URL']
+    if not read_url:
+        path = _sqlite_file(url, app.instance_path)
+        if path is None:
+            return
+        read_url = f'sqlite:///file:{path}?mode=ro&uri=true'
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.setdefault(READONLY_BIND, dict(options, url=read_url))
+
+
+def _tune_sqlite(dbapi_connection, connection_record, writer, busy_timeout, mmap_size):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f'PRAGMA busy_timeout = {int(busy_timeout)}')
+        if writer:
+            # journal_mode is stored in the file; only a writer can switch it
+            cursor.execute('PRAGMA journal_mode = WAL')
+        else:
+            cursor.execute('PRAGMA query_only = ON')
+        cursor.execute('PRAGMA synchronous = NORMAL')
+        cursor.execute(f'PRAGMA mmap_size = {int(mmap_size)}')
+    finally:
+        cursor.close()
+
+
+def init_app(app, db):
+    """Tune every SQLite engine on connect; call after db.init_app(app)."""
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name != 'sqlite':
+                continue
+            event.listen(engine, 'connect', partial(
+                _tune_sqlite, writer=key != READONLY_BIND,
+                busy_timeout=app.config['SQLITE_BUSY_TIMEOUT_MS'], mmap_size=app.config['SQLITE_MMAP_SIZE'],
+            ))
+
+
+class RoutingSession(Session):
+    """db.session that sends SELECTs of @read_only requests to the read-only engine and refuses their writes."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context() and g.get('db_read_only'):
+            if self._flushing or getattr(clause, 'is_dml', False) or getattr(clause, 'is_ddl', False):
+                raise ReadOnlyError('write inside a @read_only view')
+            engine = self._db.engines.get(READONLY_BIND)
+            if engine is not None and getattr(clause, 'is_select', False):
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(view):
+    """Route a view's queries to the read-only engine; a write in the view raises ReadOnlyError."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.db_read_only = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.db_read_only = False
+    return wrapper
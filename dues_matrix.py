@@ -0,0 +1,169 @@
+from datetime import date
+from sqlalchemy import and_, func
+from models import db, WeeklySlot, Transaction
+
+# Member x week dues status for one semester, loaded with a single query.
+# Cells are one byte each in a flat bytearray (row-major by member), so a
+# semester of a few thousand members costs tens of kilobytes.
+
+# Ordered worst to best; a week shows the best status among its payments
+UNPAID, REJECTED, PENDING, APPROVED = 0, 1, 2, 3
+STATUS_NAMES = {UNPAID: 'unpaid', REJECTED: 'rejected', PENDING: 'pending', APPROVED: 'approved'}
+STATUS_CODES = {name: code for code, name in STATUS_NAMES.items()}
+# One character per cell for compact encodings (e.g. JSON rows)
+STATUS_CHARS = {UNPAID: '-', REJECTED: 'x', PENDING: '?', APPROVED: 'P'}
+# Above this many members the whole semester is read instead of an IN (...) list
+PAGE_FILTER_LIMIT = 500
+
+
+class DuesMatrix:
+    def __init__(self, slots, member_ids):
+        self.slots = list(slots)
+        self.member_ids = list(member_ids)
+        self._col = {slot.id: i for i, slot in enumerate(self.slots)}
+        self._row = {member_id: i for i, member_id in enumerate(self.member_ids)}
+        self.cells = bytearray(len(self.slots) * len(self.member_ids))
+
+    @classmethod
+    def load(cls, semester_id, member_ids, slots=None):
+        """Build the matrix for member_ids with one query over the semester's dues."""
+        if slots is None:
+            slots = WeeklySlot.query.filter_by(semester_id=semester_id).order_by(WeeklySlot.week_number).all()
+        matrix = cls(slots, member_ids)
+        if not matrix.slots or not matrix.member_ids:
+            return matrix
+        member_ids = matrix.member_ids if len(matrix.member_ids) <= PAGE_FILTER_LIMIT else None
+        for user_id, slot_id, status in cells_query(semester_id, member_ids):
+            matrix._mark(user_id, slot_id, STATUS_CODES.get(status, UNPAID))
+        return matrix
+
+    @classmethod
+    def for_member(cls, semester_id, user_id):
+        """Load one member's row plus the matching transactions in a single query.
+
+        Returns (matrix, transactions) where transactions maps slot id to the
+        Transaction shown for that week (the approved one if there are several).
+        """
+        rows = member_weeks_query(semester_id, user_id).all()
+
+        slots, transactions = [], {}
+        for slot, txn in rows:
+            if not slots or slots[-1].id != slot.id:
+                slots.append(slot)
+        matrix = cls(slots, [user_id])
+        for slot, txn in rows:
+            if txn is not None and matrix._mark(user_id, slot.id, STATUS_CODES.get(txn.status, UNPAID)):
+                transactions[slot.id] = txn
+        return matrix, transactions
+
+    def _mark(self, user_id, slot_id, code):
+        # Keep the best status when a member has several dues rows for one week
+        row = self._row.get(user_id)
+        col = self._col.get(slot_id)
+        if row is None or col is None:
+            return False
+        i = row * len(self.slots) + col
+        if code < self.cells[i]:
+            return False
+        self.cells[i] = code
+        return True
+
+    def row(self, user_id):
+        """Status codes for one member, in week order."""
+        width = len(self.slots)
+        start = self._row[user_id] * width
+        return self.cells[start:start + width]
+
+    def status(self, user_id, slot_id):
+        return STATUS_NAMES[self.cells[self._row[user_id] * len(self.slots) + self._col[slot_id]]]
+
+    def status_map(self, user_id):
+        """{slot_id: status name} for one member."""
+        return {slot.id: STATUS_NAMES[code] for slot, code in zip(self.slots, self.row(user_id))}
+
+    def status_string(self, user_id):
+        """One character per week, e.g. 'PP?-', for compact transfer."""
+        return ''.join(STATUS_CHARS[code] for code in self.row(user_id))
+
+    def due_weeks(self, as_of=None):
+        """Number of weeks that have started by as_of (default today); later weeks are not owed yet."""
+        as_of = as_of or date.today()
+        return sum(1 for slot in self.slots if slot.start_date <= as_of)
+
+    def arrears(self, user_id, as_of=None):
+        """Number of started weeks with no pending or approved payment."""
+        as_of = as_of or date.today()
+        return sum(1 for slot, code in zip(self.slots, self.row(user_id))
+                   if slot.start_date <= as_of and code < PENDING)
+
+    def collection_rates(self):
+        """Fraction of members with an approved payment, per week."""
+        members = len(self.member_ids)
+        width = len(self.slots)
+        if not members:
+            return [0.0] * width
+        return [self.cells[col::width].count(APPROVED) / members for col in range(width)]
+
+
+def cells_query(semester_id, member_ids=None):
+    """(user_id, weekly_slot_id, status) of a semester's dues, for member_ids or (None) everyone."""
+    query = db.session.query(
+        Transaction.user_id, Transaction.weekly_slot_id, Transaction.status,
+    ).filter(
+        Transaction.semester_id == semester_id,
+        Transaction.type == 'income_dues',
+        Transaction.weekly_slot_id.isnot(None),
+    )
+    if member_ids is not None:
+        # A page of members: let the (user_id, ...) index narrow the scan
+        query = query.filter(Transaction.user_id.in_(member_ids))
+    return query
+
+
+def member_weeks_query(semester_id, user_id):
+    """(WeeklySlot, Transaction or None) rows of one member's semester, in week order."""
+    return db.session.query(WeeklySlot, Transaction).outerjoin(
+        Transaction, and_(
+            Transaction.weekly_slot_id == WeeklySlot.id,
+            Transaction.user_id == user_id,
+            Transaction.type == 'income_dues',
+        )
+    ).filter(
+        WeeklySlot.semester_id == semester_id,
+    ).order_by(WeeklySlot.week_number, WeeklySlot.id)
+
+
+def paid_weeks_subquery(semester_id, until=None):
+    """Per-member count of weeks (started by until, if given) with a pending or approved payment."""
+    query = db.session.query(
+        Transaction.user_id.label('user_id'),
+        func.count(func.distinct(Transaction.weekly_slot_id)).label('weeks'),
+    ).filter(
+        Transaction.semester_id == semester_id,
+        Transaction.type == 'income_dues',
+        Transaction.status.in_(('pending', 'approved')),
+        Transaction.weekly_slot_id.isnot(None),
+    )
+    if until is not None:
+        query = query.join(WeeklySlot, WeeklySlot.id == Transaction.weekly_slot_id).filter(
+            WeeklySlot.start_date <= until)
+    return query.group_by(Transaction.user_id).subquery()
+
+
+def collection_rates(semester_id, slots, member_count):
+    """Per-week approved fraction computed in the database, for callers without a full matrix."""
+    counts = dict(approved_counts_query(semester_id).all())
+    if not member_count:
+        return [0.0] * len(slots)
+    return [counts.get(slot.id, 0) / member_count for slot in slots]
+
+
+def approved_counts_query(semester_id):
+    """(weekly_slot_id, members with an approved payment) per week of a semester."""
+    return db.session.query(
+        Transaction.weekly_slot_id, func.count(func.distinct(Transaction.user_id)),
+    ).filter(
+        Transaction.semester_id == semester_id,
+        Transaction.type == 'income_dues',
+        Transaction.status == 'approved',
+    ).group_by(Transaction.weekly_slot_id)
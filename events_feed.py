@@ -0,0 +1,158 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from models import db, Activity, DeletedActivity
+
+# Event feed shared by /api/events (JSON) and /api/events.ics.
+#
+# Both read a time window of activities (start_date is indexed) and cache the
+# serialized result in-process, keyed by the window and the 'events'
+# data-version stamp, so a new stamp simply makes old entries unreachable.
+# `since` feeds return only rows whose updated_at moved, plus tombstones.
+
+DEFAULT_PAST = timedelta(days=31)
+DEFAULT_FUTURE = timedelta(days=366)
+MAX_WINDOW = timedelta(days=3 * 366)
+CACHE_SIZE = 64
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def parse_timestamp(value, wall_clock=True):
+    """Parse an ISO date/datetime query parameter; None if missing or invalid.
+
+    Event times are stored as naive local wall-clock times, so window bounds
+    drop their offset. `since` is compared with updated_at (naive UTC), so it
+    is converted to UTC instead (wall_clock=False).
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace(' ', '+').replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        if not wall_clock:
+            parsed = parsed.astimezone(timezone.utc)
+        parsed = parsed.replace(tzinfo=None)
+    return parsed
+
+
+def window(start=None, end=None, now=None):
+    """Clamp a requested window to sane defaults and a maximum length."""
+    # Defaults are whole days so repeated default requests share a cache entry
+    now = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+    start = start or (now - DEFAULT_PAST)
+    end = end or (now + DEFAULT_FUTURE)
+    if end <= start:
+        end = start + timedelta(days=1)
+    if end - start > MAX_WINDOW:
+        end = start + MAX_WINDOW
+    return start, end
+
+
+def _serialize(event):
+    return {
+        'id': event.id,
+        'title': event.title,
+        'start': event.start_date.isoformat(),
+        'end': event.end_date.isoformat(),
+        'description': event.description,
+        'location': event.location,
+        'updated_at': event.updated_at.isoformat() if event.updated_at else None,
+    }
+
+
+def _query_window(start, end):
+    return Activity.query.filter(
+        Activity.start_date < end,
+        Activity.end_date >= start,
+    ).order_by(Activity.start_date.asc())
+
+
+def events_in_window(start, end, stamp):
+    """Serialized events overlapping [start, end), cached per data-version stamp."""
+    key = (start.isoformat(), end.isoformat(), stamp)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is not None:
+            _cache.move_to_end(key)
+            return cached
+    events = [_serialize(e) for e in _query_window(start, end)]
+    with _cache_lock:
+        _cache[key] = events
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return events
+
+
+def changes_since(since, start, end):
+    """(changed events in the window, deleted ids) since the given UTC timestamp."""
+    changed = [
+        _serialize(e)
+        for e in _query_window(start, end).filter(Activity.updated_at > since)
+    ]
+    deleted = [
+        row.id for row in
+        db.session.query(DeletedActivity.id).filter(DeletedActivity.deleted_at > since)
+    ]
+    return changed, deleted
+
+
+# iCalendar
+
+def _ics_escape(text):
+    return (text or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n')
+
+
+def _ics_fold(line):
+    # RFC 5545: lines longer than 75 octets continue on the next line after a space
+    raw = line.encode('utf-8')
+    if len(raw) <= 75:
+        return line
+    parts = []
+    while raw:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(raw))
+        # Don't split a UTF-8 sequence (Thai text)
+        while cut < len(raw) and (raw[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(raw[:cut].decode('utf-8'))
+        raw = raw[cut:]
+    return '\r\n '.join(parts)
+
+
+def _ics_time(value):
+    # Floating local time, matching how events are entered and shown
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def to_ics(events, host):
+    """Render serialized events as an iCalendar document."""
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Ghuroba Club//Events//EN',
+        'CALSCALE:GREGORIAN',
+        'X-WR-CALNAME:Ghuroba Club',
+    ]
+    for event in events:
+        lines += [
+            'BEGIN:VEVENT',
+            f'UID:activity-{event["id"]}@{host}',
+            f'DTSTAMP:{stamp}',
+            f'DTSTART:{_ics_time(datetime.fromisoformat(event["start"]))}',
+            f'DTEND:{_ics_time(datetime.fromisoformat(event["end"]))}',
+            f'SUMMARY:{_ics_escape(event["title"])}',
+        ]
+        if event['description']:
+            lines.append(f'DESCRIPTION:{_ics_escape(event["description"])}')
+        if event['location']:
+            lines.append(f'LOCATION:{_ics_escape(event["location"])}')
+        if event['updated_at']:
+            lines.append(f'LAST-MODIFIED:{datetime.fromisoformat(event["updated_at"]).strftime("%Y%m%dT%H%M%SZ")}')
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_ics_fold(line) for line in lines) + '\r\n'
@@ -0,0 +1,11 @@
+import metrics
+
+# Picked up automatically by `gunicorn` run from the repository root.
+
+
+def child_exit(server, worker):
+    # Runs in the master after a worker exits: fold its /metrics counters into
+    # exited.json so the shared directory holds one file per live worker
+    directory = server.app.wsgi().config['METRICS_DIR']
+    if directory:
+        metrics.mark_process_dead(worker.pid, directory)
@@ -0,0 +1,103 @@
+import hashlib
+import os
+import re
+import time
+from functools import wraps
+from flask import g, request, session, make_response
+import versions
+
+# HTTP caching:
+#   * static URLs carry a content fingerprint (?v=...) and are then served with
+#     a one-year immutable Cache-Control; content-addressed uploads (see
+#     uploads.py) are immutable by name. Werkzeug's send_file already answers
+#     If-None-Match / If-Modified-Since with 304 using a strong ETag and
+#     Last-Modified.
+#   * @conditional(...) gives read-mostly pages an ETag/Last-Modified derived
+#     from data-version stamps, so a revalidating client or proxy gets a 304
+#     without the view running or the data being queried.
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+UPLOAD_MAX_AGE = 86400
+_CONTENT_ADDRESSED = re.compile(r'^uploads/(?:derived/)?[0-9a-f]{2}/[0-9a-f]{64}[^/]*$')
+
+# (path, mtime) -> short content hash
+_fingerprints = {}
+
+
+def fingerprint(path):
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    key = (path, mtime)
+    digest = _fingerprints.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as fh:
+            for chunk in iter(lambda: fh.read(64 * 1024), b''):
+                sha.update(chunk)
+        digest = _fingerprints[key] = sha.hexdigest()[:12]
+    return digest
+
+
+def init_app(app):
+    @app.url_defaults
+    def fingerprint_static(endpoint, values):
+        if endpoint != 'static' or 'v' in values:
+            return
+        filename = values.get('filename', '')
+        if filename.startswith('uploads/') and _CONTENT_ADDRESSED.match(filename):
+            return  # the name already is the fingerprint
+        digest = fingerprint(os.path.join(app.static_folder, filename))
+        if digest:
+            values['v'] = digest
+
+    @app.after_request
+    def static_cache_headers(response):
+        if request.endpoint != 'static' or response.status_code not in (200, 304):
+            return response
+        filename = (request.view_args or {}).get('filename', '')
+        if 'v' in request.args or _CONTENT_ADDRESSED.match(filename):
+            response.headers['Cache-Control'] = IMMUTABLE
+        elif filename.startswith('uploads/'):
+            response.headers['Cache-Control'] = f'public, max-age={UPLOAD_MAX_AGE}'
+        return response
+
+
+def conditional(*stamps, time_bucket=None, renders_user=False):
+    """Serve 304 Not Modified when none of the given data-version stamps changed.
+
+    The validator also covers the query string, UI language and logged-in user,
+    since those change the rendered page. `time_bucket` (seconds) additionally
+    expires the validator for pages that depend on the clock. Pages that show
+    the signed-in user (the navbar in base.html) pass renders_user=True, which
+    adds the USERS stamp for signed-in visitors so a profile change shows up.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if session.get('_flashes'):
+                # One-off flash messages must be rendered, never revalidated away
+                return view(*args, **kwargs)
+            user_id = session.get('_user_id')
+            current = g.data_versions = versions.get(*stamps, *((versions.USERS,) if renders_user and user_id else ()))
+            parts = [request.endpoint, request.query_string.decode(), session.get('lang', 'TH'), str(user_id)]
+            parts += [f'{name}:{version}' for name, (version, _) in sorted(current.items())]
+            if time_bucket:
+                parts.append(str(int(time.time() // time_bucket)))
+            etag = hashlib.sha1('|'.join(parts).encode()).hexdigest()[:24]
+            modified = [updated for _, updated in current.values() if updated]
+            last_modified = max(modified) if modified else None
+
+            if etag in request.if_none_match:
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers['Cache-Control'] = ('private' if user_id else 'public') + ', no-cache'
+            response.vary.add('Cookie')
+            return response
+        return wrapper
+    return decorator
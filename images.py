@@ -0,0 +1,132 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app, url_for
+
+# Resized derivatives of uploaded slips and announcement images.
+#
+# Every upload gets thumb/card/full variants in WebP and JPEG under
+# static/uploads/derived/, re-encoded from the EXIF-rotated pixels so no EXIF
+# survives (the stored original has already lost its metadata, see uploads.py).
+# New uploads are processed on a small process pool (created lazily, after
+# gunicorn has forked, like the one in passwords.py) so resizing never holds
+# the web worker's GIL; `flask build-derivatives` backfills existing uploads on
+# a process pool of its own. Pillow is optional: without it nothing is
+# generated and templates keep pointing at the original file.
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+DERIVED_DIR = 'derived'
+# name: (width, height, crop) - crop fills the box exactly, otherwise fit inside it
+SIZES = {
+    'thumb': (160, 160, True),
+    'card': (640, 400, True),
+    'full': (1600, 1600, False),
+}
+FORMATS = {'webp': ('WEBP', {'quality': 80, 'method': 4}), 'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True})}
+
+_executor = None
+_executor_lock = threading.Lock()
+# Derivatives confirmed on disk; they never change once written
+_known = set()
+
+
+def derivative_name(filename, size, fmt):
+    """Path of a derivative relative to the upload folder."""
+    stem = os.path.splitext(filename)[0]
+    return f'{DERIVED_DIR}/{stem}_{size}.{fmt}'
+
+
+def build_derivatives(upload_folder, filename):
+    """Write every size/format of filename; returns the number of files written."""
+    if Image is None:
+        return 0
+    source = os.path.join(upload_folder, filename)
+    written = 0
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        for size, (width, height, crop) in SIZES.items():
+            if crop:
+                resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            else:
+                resized = image.copy()
+                resized.thumbnail((width, height), Image.LANCZOS)
+            for fmt, (pil_format, options) in FORMATS.items():
+                target = os.path.join(upload_folder, derivative_name(filename, size, fmt))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                tmp = target + '.tmp'
+                # No exif= argument: the re-encoded file carries no metadata
+                resized.save(tmp, pil_format, **options)
+                os.replace(tmp, target)
+                written += 1
+    return written
+
+
+def _safe_build(upload_folder, filename):
+    try:
+        return build_derivatives(upload_folder, filename)
+    except Exception:
+        # A corrupt upload must not take the pool down; the original is still served
+        return 0
+
+
+def submit(app, filename):
+    """Queue derivative generation for a freshly saved upload."""
+    global _executor
+    if Image is None or not filename:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=app.config.get('IMAGE_WORKERS', 2))
+    return _executor.submit(_safe_build, app.config['UPLOAD_FOLDER'], filename)
+
+
+def pending_uploads(upload_folder):
+    """Uploads that are missing at least one derivative."""
+    for root, dirs, files in os.walk(upload_folder):
+        rel_root = os.path.relpath(root, upload_folder)
+        if rel_root.split(os.sep)[0] == DERIVED_DIR:
+            dirs[:] = []
+            continue
+        for name in files:
+            if name.startswith('.') or name.endswith('.tmp'):
+                continue
+            filename = name if rel_root == '.' else f'{rel_root.replace(os.sep, "/")}/{name}'
+            missing = any(
+                not os.path.exists(os.path.join(upload_folder, derivative_name(filename, size, fmt)))
+                for size in SIZES for fmt in FORMATS
+            )
+            if missing:
+                yield filename
+
+
+def backfill(upload_folder, workers=None, echo=print):
+    """Generate derivatives for every existing upload on a process pool."""
+    if Image is None:
+        echo('Pillow is not installed; nothing to do')
+        return 0
+    todo = list(pending_uploads(upload_folder))
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for filename, written in zip(todo, pool.map(_safe_build, [upload_folder] * len(todo), todo, chunksize=8)):
+            done += 1
+            if not written:
+                echo(f'  skipped {filename} (not a readable image)')
+            if done % 50 == 0 or done == len(todo):
+                echo(f'  {done}/{len(todo)} uploads processed')
+    return len(todo)
+
+
+def upload_url(filename, size=None, fmt='jpg'):
+    """URL of the smallest adequate derivative, falling back to the original upload."""
+    if size is not None:
+        derived = derivative_name(filename, size, fmt)
+        if derived in _known or os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], derived)):
+            _known.add(derived)
+            return url_for('static', filename=f'uploads/{derived}')
+    return url_for('static', filename=f'uploads/{filename}')
@@ -0,0 +1,197 @@
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, LedgerBalance, Transaction, TransactionArchive
+
+# Balance summary: one row per (semester, project, type, status) holding the sum
+# and count of matching transactions. Every route that inserts, deletes or
+# changes the status of a Transaction calls into this module inside the same
+# db.session transaction, so the summary commits (or rolls back) with the write.
+# All amounts are integer satang (see money.py). Archived semesters keep their
+# balance rows, so rebuilds and checks count the archive table too.
+
+SOURCES = (Transaction, TransactionArchive)
+
+
+def _key(semester_id, project_id, txn_type, status):
+    return {
+        'semester_id': int(semester_id or 0),
+        'project_id': int(project_id or 0),
+        'type': txn_type,
+        'status': status or 'approved',
+    }
+
+
+def _add(key, amount, count):
+    """Atomically add amount/count to the summary row for key, creating it if needed."""
+    values = dict(key, total_minor=amount, count=count)
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = insert(LedgerBalance).values(**values)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['semester_id', 'project_id', 'type', 'status'],
+            set_={
+                'total_minor': LedgerBalance.total_minor + stmt.excluded.total_minor,
+                'count': LedgerBalance.count + stmt.excluded.count,
+            },
+        )
+        db.session.execute(stmt)
+        return
+
+    updated = LedgerBalance.query.filter_by(**key).update({
+        LedgerBalance.total_minor: LedgerBalance.total_minor + amount,
+        LedgerBalance.count: LedgerBalance.count + count,
+    }, synchronize_session=False)
+    if not updated:
+        db.session.add(LedgerBalance(**values))
+        db.session.flush()
+
+
+def record(txn):
+    """Add a newly created transaction to the summary."""
+    _add(_key(txn.semester_id, txn.project_id, txn.type, txn.status), txn.amount_minor or 0, 1)
+
+
+def unrecord(txn):
+    """Remove a transaction that is about to be deleted from the summary."""
+    _add(_key(txn.semester_id, txn.project_id, txn.type, txn.status), -(txn.amount_minor or 0), -1)
+
+
+def change_status(txn, old_status, new_status):
+    """Move a transaction's amount from one status bucket to another."""
+    if old_status == new_status:
+        return
+    amount = txn.amount_minor or 0
+    _add(_key(txn.semester_id, txn.project_id, txn.type, old_status), -amount, -1)
+    _add(_key(txn.semester_id, txn.project_id, txn.type, new_status), amount, 1)
+
+
+def move_status(rows, old_status, new_status):
+    """change_status for many transactions at once.
+
+    rows are (semester_id, project_id, type, amount_minor) of the transactions
+    that moved; they are aggregated first so each balance row is written once.
+    """
+    if old_status == new_status:
+        return
+    groups = {}
+    for semester_id, project_id, txn_type, amount in rows:
+        key = (semester_id or 0, project_id or 0, txn_type)
+        total, count = groups.get(key, (0, 0))
+        groups[key] = (total + (amount or 0), count + 1)
+    for (semester_id, project_id, txn_type), (total, count) in groups.items():
+        _add(_key(semester_id, project_id, txn_type, old_status), -total, -count)
+        _add(_key(semester_id, project_id, txn_type, new_status), total, count)
+
+
+def detach_semester(semester_id):
+    """Fold a deleted semester's rows into the "no semester" bucket.
+
+    Deleting a Semester nulls Transaction.semester_id, so its totals move to
+    semester 0 rather than disappearing from the balance.
+    """
+    rows = LedgerBalance.query.filter_by(semester_id=semester_id).all()
+    for row in rows:
+        _add(_key(0, row.project_id, row.type, row.status), row.total_minor, row.count)
+        db.session.delete(row)
+
+
+def detach_project(project_id):
+    """Fold a deleted project's rows into the "no project" bucket.
+
+    Deleting a Project nulls Transaction.project_id; without this its rows
+    would linger under an id that SQLite may hand to the next new project.
+    """
+    rows = LedgerBalance.query.filter_by(project_id=project_id).all()
+    for row in rows:
+        _add(_key(row.semester_id, 0, row.type, row.status), row.total_minor, row.count)
+        db.session.delete(row)
+
+
+def totals():
+    """Return (income, expense) in satang across the whole ledger, excluding rejected slips."""
+    counted = LedgerBalance.status != 'rejected'
+    income = db.session.query(func.sum(LedgerBalance.total_minor)).filter(
+        counted, LedgerBalance.type.like('income%')).scalar() or 0
+    expense = db.session.query(func.sum(LedgerBalance.total_minor)).filter(
+        counted, LedgerBalance.type == 'expense').scalar() or 0
+    return int(income), int(expense)
+
+
+class Subtotals:
+    """Totals of a filtered set of transactions, from one GROUP BY type, project, semester."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.by_type = {}
+        # project_id (0 for no project, as in LedgerBalance) -> [income, expense]
+        self.by_project = {}
+        for txn_type, project_id, semester_id, total, count in rows:
+            total = int(total or 0)
+            self.by_type[txn_type] = self.by_type.get(txn_type, 0) + total
+            bucket = self.by_project.setdefault(project_id or 0, [0, 0])
+            bucket[1 if txn_type == 'expense' else 0] += total
+        self.expense = self.by_type.get('expense', 0)
+        self.income = sum(self.by_type.values()) - self.expense
+
+    @property
+    def balance(self):
+        return self.income - self.expense
+
+
+def subtotals(*filters):
+    """Sum transactions matching filters in the database, grouped by type, project and semester."""
+    rows = db.session.query(
+        Transaction.type, Transaction.project_id, Transaction.semester_id,
+        func.sum(Transaction.amount_minor), func.count(Transaction.id),
+    ).filter(*filters).group_by(
+        Transaction.type, Transaction.project_id, Transaction.semester_id,
+    ).all()
+    return Subtotals(rows)
+
+
+def _scan(sources=SOURCES):
+    """Compute the summary from scratch with one GROUP BY per ledger table."""
+    rows = []
+    for model in sources:
+        rows += db.session.query(
+            model.semester_id, model.project_id, model.type, model.status,
+            func.sum(model.amount_minor), func.count(model.id),
+        ).group_by(
+            model.semester_id, model.project_id, model.type, model.status,
+        ).all()
+    expected = {}
+    for semester_id, project_id, txn_type, status, total, count in rows:
+        key = tuple(_key(semester_id, project_id, txn_type, status).values())
+        prev_total, prev_count = expected.get(key, (0, 0))
+        expected[key] = (prev_total + int(total or 0), prev_count + count)
+    return expected
+
+
+def check():
+    """Compare the stored summary against the ledger; return a list of mismatched keys."""
+    expected = _scan()
+    stored = {
+        (r.semester_id, r.project_id, r.type, r.status): (r.total_minor, r.count)
+        for r in LedgerBalance.query.all()
+    }
+    problems = []
+    for key in set(expected) | set(stored):
+        want_total, want_count = expected.get(key, (0, 0))
+        have_total, have_count = stored.get(key, (0, 0))
+        if have_count != want_count or have_total != want_total:
+            problems.append((key, (have_total, have_count), (want_total, want_count)))
+    return problems
+
+
+def rebuild(sources=SOURCES):
+    """Replace the summary with a fresh aggregate of the transaction tables."""
+    expected = _scan(sources)
+    LedgerBalance.query.delete(synchronize_session=False)
+    for (semester_id, project_id, txn_type, status), (total, count) in expected.items():
+        db.session.add(LedgerBalance(
+            semester_id=semester_id, project_id=project_id, type=txn_type,
+            status=status, total_minor=total, count=count,
+        ))
+    db.session.commit()
+    return len(expected)
@@ -0,0 +1,113 @@
+import csv
+import io
+import secrets
+from collections import namedtuple
+from sqlalchemy import insert
+from models import db, User
+import arrears
+import passwords
+import search
+
+# Bulk member onboarding from CSV (admin page and `flask import-members`).
+#
+# Every row is validated before anything is written: required columns, field
+# lengths, duplicates inside the file and, with one IN query, usernames that
+# already exist. Passwords (given, or generated when the column is blank) are
+# hashed in parallel on the password pool, then users are inserted with
+# executemany in batches of INSERT_BATCH, and added to the search index, all
+# in one transaction.
+#
+# The admin page accepts at most WEB_MAX_ROWS rows: at the default scrypt cost
+# on the shared two-process pool that many hashes finish well inside
+# gunicorn's 30 s request timeout. Larger files go through the CLI, which
+# hashes on a pool of its own sized to the host.
+
+REQUIRED = ('username', 'real_name', 'department')
+COLUMNS = REQUIRED + ('password',)
+MAX_LENGTH = 255
+INSERT_BATCH = 500
+MAX_ROWS = 5000
+WEB_MAX_ROWS = 200
+
+ImportRow = namedtuple('ImportRow', 'line username real_name department password generated')
+ImportResult = namedtuple('ImportResult', 'created errors')
+
+
+def parse(text, max_rows=MAX_ROWS):
+    """(rows, errors) from CSV text; errors are (line, message) pairs."""
+    if text.startswith('\ufeff'):
+        text = text[1:]
+    reader = csv.DictReader(io.StringIO(text))
+    header = [(name or '').strip().lower() for name in (reader.fieldnames or [])]
+    missing = [name for name in REQUIRED if name not in header]
+    if missing:
+        return [], [(1, f'Missing column(s): {", ".join(missing)}')]
+    reader.fieldnames = header
+
+    rows, errors, seen = [], [], {}
+    for record in reader:
+        line = reader.line_num
+        if len(rows) + len(errors) >= max_rows:
+            hint = 'split the file' if max_rows >= MAX_ROWS else 'import it with flask import-members'
+            errors.append((line, f'More than {max_rows} rows; {hint}'))
+            break
+        values = {name: (record.get(name) or '').strip() for name in COLUMNS}
+        if not any(values.values()):
+            continue
+        problems = [f'{name} is required' for name in REQUIRED if not values[name]]
+        problems += [f'{name} is longer than {MAX_LENGTH} characters'
+                     for name in COLUMNS if len(values[name]) > MAX_LENGTH]
+        username = values['username']
+        if username and username in seen:
+            problems.append(f'username {username} repeats line {seen[username]}')
+        if problems:
+            errors.append((line, '; '.join(problems)))
+            continue
+        seen[username] = line
+        generated = not values['password']
+        rows.append(ImportRow(line, username, values['real_name'], values['department'],
+                              values['password'] or secrets.token_urlsafe(8), generated))
+    return rows, errors
+
+
+def conflicts(rows):
+    """(line, message) for rows whose username is already taken, in one query."""
+    usernames = [row.username for row in rows]
+    if not usernames:
+        return []
+    taken = {name for (name,) in db.session.query(User.username).filter(User.username.in_(usernames))}
+    return [(row.line, f'username {row.username} already exists') for row in rows if row.username in taken]
+
+
+def import_members(text, skip_invalid=False, dry_run=False, workers=None, max_rows=MAX_ROWS):
+    """Validate and insert the members in a CSV document; returns ImportResult.
+
+    created lists the imported ImportRows (with any generated passwords), or
+    the rows that would be imported for a dry run. With errors and not
+    skip_invalid, nothing is written.
+    """
+    rows, errors = parse(text, max_rows)
+    errors += conflicts(rows)
+    errors.sort()
+    bad_lines = {line for line, _ in errors}
+    valid = [row for row in rows if row.line not in bad_lines]
+    if (errors and not skip_invalid) or dry_run or not valid:
+        return ImportResult([] if not dry_run else valid, errors)
+
+    hashes = passwords.hash_many([row.password for row in valid], workers=workers)
+    values = [{
+        'username': row.username,
+        'password': pwhash,
+        'real_name': row.real_name,
+        'department': row.department,
+        'role': 'member',
+    } for row, pwhash in zip(valid, hashes)]
+    for start in range(0, len(values), INSERT_BATCH):
+        batch = values[start:start + INSERT_BATCH]
+        db.session.execute(insert(User), batch)
+        # Core inserts skip the ORM hook that keeps the search index current
+        search.index(User, User.username.in_([value['username'] for value in batch]))
+        arrears.add_members(user_id for (user_id,) in db.session.query(User.id).filter(
+            User.username.in_([value['username'] for value in batch])))
+    db.session.commit()
+    return ImportResult(valid, errors)
@@ -0,0 +1,240 @@
+import atexit
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from flask import g, request, has_request_context, Response, abort
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-endpoint request instrumentation:
+#   * latency histogram, SQL statement count and SQL time per endpoint
+#   * a Server-Timing header on every response
+#   * a warning log line for any statement slower than SLOW_QUERY_MS
+#   * /metrics in Prometheus text format
+#
+# Each process keeps its own counters and dumps them to METRICS_DIR/<pid>_<token>.json
+# (at most once per METRICS_FLUSH_SECONDS and at exit); METRICS_DIR defaults to
+# instance/metrics. /metrics sums all the files, so the numbers are correct no
+# matter which gunicorn worker serves the scrape. When gunicorn reaps a worker,
+# gunicorn.conf.py calls mark_process_dead, which folds the worker's files into
+# exited.json and deletes them, so counters never go backwards and the directory
+# does not grow with every worker restart.
+#
+# /metrics answers only requests from METRICS_ALLOW_IPS (loopback by default) or
+# ones carrying "Authorization: Bearer <METRICS_TOKEN>" when a token is set.
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger('ghuroba.sql')
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reset()
+
+    def _reset(self):
+        # Called lazily in each process so forked workers never share a file name
+        self._pid = os.getpid()
+        self.token = f'{self._pid}_{uuid.uuid4().hex[:8]}'
+        self.endpoints = {}
+        self._last_flush = 0.0
+
+    def _stats(self, endpoint):
+        if self._pid != os.getpid():
+            self._reset()
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = {
+                'buckets': [0] * len(BUCKETS),
+                'count': 0,
+                'sum': 0.0,
+                'sql_count': 0,
+                'sql_seconds': 0.0,
+                'slow_queries': 0,
+            }
+        return stats
+
+    def observe(self, endpoint, seconds, sql_count, sql_seconds, slow_queries):
+        with self._lock:
+            stats = self._stats(endpoint)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    stats['buckets'][i] += 1
+            stats['count'] += 1
+            stats['sum'] += seconds
+            stats['sql_count'] += sql_count
+            stats['sql_seconds'] += sql_seconds
+            stats['slow_queries'] += slow_queries
+
+    def snapshot(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._reset()
+            return json.loads(json.dumps(self.endpoints))
+
+    def flush(self, directory, force=False, interval=1.0):
+        """Write this process's counters to directory (atomically)."""
+        now = time.monotonic()
+        if not force and now - self._last_flush < interval:
+            return
+        self._last_flush = now
+        data = self.snapshot()
+        if not data:
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{self.token}.json')
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as fh:
+            json.dump(data, fh)
+        os.replace(tmp, path)
+
+
+registry = Registry()
+
+
+def _merge(into, endpoints):
+    for endpoint, stats in endpoints.items():
+        target = into.setdefault(endpoint, {
+            'buckets': [0] * len(BUCKETS), 'count': 0, 'sum': 0.0,
+            'sql_count': 0, 'sql_seconds': 0.0, 'slow_queries': 0,
+        })
+        target['buckets'] = [a + b for a, b in zip(target['buckets'], stats['buckets'])]
+        for key in ('count', 'sum', 'sql_count', 'sql_seconds', 'slow_queries'):
+            target[key] += stats[key]
+
+
+def mark_process_dead(pid, directory):
+    """Fold the files of an exited worker into exited.json (called from the gunicorn master only)."""
+    paths = glob.glob(os.path.join(directory, f'{pid}_*.json'))
+    if not paths:
+        return
+    exited = os.path.join(directory, 'exited.json')
+    merged = {}
+    for path in [exited] + paths:
+        try:
+            with open(path) as fh:
+                _merge(merged, json.load(fh))
+        except (OSError, ValueError):
+            continue
+    tmp = exited + '.tmp'
+    with open(tmp, 'w') as fh:
+        json.dump(merged, fh)
+    os.replace(tmp, exited)
+    for path in paths:
+        os.remove(path)
+
+
+def collect(directory=None):
+    """Counters for every process (or just this one when directory is None)."""
+    if not directory:
+        return registry.snapshot()
+    registry.flush(directory, force=True)
+    merged = {}
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as fh:
+                _merge(merged, json.load(fh))
+        except (OSError, ValueError):
+            continue
+    return merged
+
+
+def render_prometheus(endpoints):
+    lines = [
+        '# HELP ghuroba_request_duration_seconds Request latency by endpoint.',
+        '# TYPE ghuroba_request_duration_seconds histogram',
+    ]
+    for endpoint, stats in sorted(endpoints.items()):
+        label = endpoint.replace('\\', '\\\\').replace('"', '\\"')
+        for bound, count in zip(BUCKETS, stats['buckets']):
+            lines.append(f'ghuroba_request_duration_seconds_bucket{{endpoint="{label}",le="{bound}"}} {count}')
+        lines.append(f'ghuroba_request_duration_seconds_bucket{{endpoint="{label}",le="+Inf"}} {stats["count"]}')
+        lines.append(f'ghuroba_request_duration_seconds_sum{{endpoint="{label}"}} {stats["sum"]:.6f}')
+        lines.append(f'ghuroba_request_duration_seconds_count{{endpoint="{label}"}} {stats["count"]}')
+    counters = (
+        ('ghuroba_sql_statements_total', 'SQL statements executed while serving the endpoint.', 'sql_count', '{}'),
+        ('ghuroba_sql_seconds_total', 'Time spent in SQL while serving the endpoint.', 'sql_seconds', '{:.6f}'),
+        ('ghuroba_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS.', 'slow_queries', '{}'),
+    )
+    for name, help_text, key, fmt in counters:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for endpoint, stats in sorted(endpoints.items()):
+            label = endpoint.replace('\\', '\\\\').replace('"', '\\"')
+            lines.append(f'{name}{{endpoint="{label}"}} ' + fmt.format(stats[key]))
+    return '\n'.join(lines) + '\n'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info['query_start'].pop()
+    if not has_request_context():
+        return
+    current = getattr(g, 'metrics', None)
+    if current is None:
+        return
+    current['sql_count'] += 1
+    current['sql_seconds'] += elapsed
+    if elapsed * 1000 >= current['slow_ms']:
+        current['slow_queries'] += 1
+        logger.warning('slow query (%.1f ms) in %s: %s', elapsed * 1000, request.endpoint, statement[:500])
+
+
+def init_app(app):
+    app.config.setdefault('SLOW_QUERY_MS', 200)
+    app.config.setdefault('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+    app.config.setdefault('METRICS_FLUSH_SECONDS', 1.0)
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.config.setdefault('METRICS_ALLOW_IPS', ('127.0.0.1', '::1'))
+
+    @app.before_request
+    def start_timer():
+        g.metrics = {
+            'start': time.perf_counter(),
+            'sql_count': 0,
+            'sql_seconds': 0.0,
+            'slow_queries': 0,
+            'slow_ms': app.config['SLOW_QUERY_MS'],
+        }
+
+    @app.after_request
+    def record_request(response):
+        current = g.pop('metrics', None)
+        if current is None:
+            return response
+        elapsed = time.perf_counter() - current['start']
+        registry.observe(request.endpoint or 'unknown', elapsed,
+                         current['sql_count'], current['sql_seconds'], current['slow_queries'])
+        response.headers.add('Server-Timing', 'app;dur=%.1f' % (elapsed * 1000))
+        response.headers.add('Server-Timing', 'db;dur=%.1f;desc="%d queries"' % (
+            current['sql_seconds'] * 1000, current['sql_count']))
+        directory = app.config['METRICS_DIR']
+        if directory:
+            registry.flush(directory, interval=app.config['METRICS_FLUSH_SECONDS'])
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        token = app.config['METRICS_TOKEN']
+        supplied = request.headers.get('Authorization', '')
+        if not (request.remote_addr in app.config['METRICS_ALLOW_IPS']
+                or token and hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())):
+            abort(403)
+        body = render_prometheus(collect(app.config['METRICS_DIR']))
+        return Response(body, mimetype='text/plain; version=0.0.4')
+
+    directory = app.config['METRICS_DIR']
+    if directory:
+        atexit.register(lambda: os.path.isdir(directory) and registry.flush(directory, force=True))
@@ -0,0 +1,414 @@
+# Versioned schema migrations.
+#
+# Each migration is a function registered with @migration(version, description).
+# `flask upgrade-db` (or `python migrations.py`) applies the pending ones in order
+# against whatever DATABASE_URL points at and records them in schema_version.
+#
+# Migrations must be safe to re-run: DDL checks the live schema first, and
+# backfills only touch rows that still need them, in bounded batches that each
+# commit on their own so the write lock is released between batches.
+#
+# A released migration is never edited; changes go into a new one. Data
+# backfills are written in SQL, or as a frozen copy of the logic of their
+# version, never by calling the application's rebuild() functions, which
+# follow the current models and would break old migrations as those change.
+
+import re
+from datetime import date, datetime
+from sqlalchemy import inspect, text
+from models import (db, SchemaVersion, LedgerBalance, DataVersion, DeletedActivity, User, WeeklySlot, Announcement, Transaction, Activity,
+                    TransactionArchive, WeeklySlotArchive, SemesterSnapshot, MemberArrears, ArrearsDay)
+
+MIGRATIONS = []
+DEFAULT_BATCH_SIZE = 5000
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+
+class MigrationContext:
+    def __init__(self, engine, echo, batch_size):
+        self.engine = engine
+        self.echo = echo
+        self.batch_size = batch_size
+
+    @property
+    def dialect(self):
+        return self.engine.dialect.name
+
+    def has_column(self, table, column):
+        return column in {c['name'] for c in inspect(self.engine).get_columns(table)}
+
+    def has_table(self, table):
+        return inspect(self.engine).has_table(table)
+
+    def execute(self, sql, **params):
+        with self.engine.begin() as conn:
+            return conn.execute(text(sql), params)
+
+    def add_column(self, table, column, ddl):
+        """ALTER TABLE ... ADD COLUMN unless the column is already there."""
+        if self.has_column(table, column):
+            self.echo(f'  {table}.{column} already present')
+            return False
+        self.execute(f'ALTER TABLE "{table}" ADD COLUMN {column} {ddl}')
+        self.echo(f'  added {table}.{column}')
+        return True
+
+    def drop_column(self, table, column):
+        """ALTER TABLE ... DROP COLUMN if the column is still there (SQLite 3.35+)."""
+        if not self.has_column(table, column):
+            return False
+        self.execute(f'ALTER TABLE "{table}" DROP COLUMN {column}')
+        self.echo(f'  dropped {table}.{column}')
+        return True
+
+    def create_table(self, model):
+        model.__table__.create(self.engine, checkfirst=True)
+
+    def create_indexes(self, model):
+        """Create any index declared on the model that the live table lacks.
+
+        Indexes on columns a later migration adds are left for that migration.
+        """
+        existing = {ix['name'] for ix in inspect(self.engine).get_indexes(model.__tablename__)}
+        columns = {c['name'] for c in inspect(self.engine).get_columns(model.__tablename__)}
+        for index in model.__table__.indexes:
+            if index.name not in existing and {c.name for c in index.columns} <= columns:
+                index.create(self.engine)
+                self.echo(f'  created index {index.name}')
+
+    def backfill(self, table, assignments, where, **params):
+        """Run a set-based UPDATE over id ranges of batch_size rows.
+
+        `assignments` and `where` are SQL fragments; `where` must stop matching a
+        row once it has been updated so an interrupted backfill can be resumed.
+        """
+        with self.engine.connect() as conn:
+            low, high = conn.execute(
+                text(f'SELECT MIN(id), MAX(id) FROM "{table}" WHERE {where}'), params
+            ).one()
+        if low is None:
+            self.echo(f'  {table}: nothing to backfill')
+            return 0
+
+        updated = 0
+        start = low
+        while start <= high:
+            stop = start + self.batch_size
+            with self.engine.begin() as conn:
+                result = conn.execute(
+                    text(f'UPDATE "{table}" SET {assignments} WHERE id >= :_lo AND id < :_hi AND ({where})'),
+                    dict(params, _lo=start, _hi=stop),
+                )
+                updated += result.rowcount
+            done = min(stop, high + 1) - low
+            self.echo(f'  {table}: {done}/{high - low + 1} ids scanned, {updated} rows updated')
+            start = stop
+        return updated
+
+
+def _fill_ledger_balance(ctx, tables):
+    """ledger.rebuild() in SQL: replace ledger_balance with a GROUP BY over the given transaction tables.
+
+    Works in whichever money columns the database has at that point (float
+    amount/total before 0006, satang amount_minor/total_minor after it).
+    """
+    if ctx.has_column('ledger_balance', 'total_minor'):
+        target = 'total_minor'
+        amount = 'amount_minor' if ctx.has_column('transaction', 'amount_minor') else 'CAST(ROUND(amount * 100) AS BIGINT)'
+    else:
+        target = 'total'
+        amount = 'amount' if ctx.has_column('transaction', 'amount') else 'amount_minor / 100.0'
+    rows = ' UNION ALL '.join(
+        f'SELECT id, semester_id, project_id, type, status, {amount} AS amount FROM "{table}"' for table in tables)
+    key = "COALESCE(semester_id, 0), COALESCE(project_id, 0), type, COALESCE(NULLIF(status, ''), 'approved')"
+    with ctx.engine.begin() as conn:
+        conn.execute(text('DELETE FROM ledger_balance'))
+        result = conn.execute(text(
+            f'INSERT INTO ledger_balance (semester_id, project_id, type, status, {target}, count) '
+            f'SELECT {key}, COALESCE(SUM(amount), 0), COUNT(id) FROM ({rows}) t GROUP BY {key}'))
+    ctx.echo(f'  rebuilt {result.rowcount} balance rows')
+
+
+def applied_versions():
+    SchemaVersion.__table__.create(db.engine, checkfirst=True)
+    return {row.version for row in SchemaVersion.query.all()}
+
+
+def pending():
+    done = applied_versions()
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def upgrade(echo=print, batch_size=DEFAULT_BATCH_SIZE):
+    """Apply every pending migration; must be called inside an app context."""
+    todo = pending()
+    if not todo:
+        echo('Database is up to date')
+        return []
+    ctx = MigrationContext(db.engine, echo, batch_size)
+    for version, description, fn in todo:
+        echo(f'Applying {version}: {description}')
+        fn(ctx)
+        db.session.add(SchemaVersion(version=version, description=description, applied_at=datetime.utcnow()))
+        db.session.commit()
+    return [m[0] for m in todo]
+
+
+# Migrations
+
+@migration('0001', 'Transaction status and semester_id (v3.5)')
+def add_transaction_status_and_semester(ctx):
+    ctx.add_column('transaction', 'status', "VARCHAR(20) DEFAULT 'approved'")
+    ctx.add_column('transaction', 'semester_id', 'INTEGER REFERENCES semester(id)')
+
+    # Dues take the semester of their weekly slot
+    ctx.backfill(
+        'transaction',
+        'semester_id = (SELECT w.semester_id FROM weekly_slot w WHERE w.id = "transaction".weekly_slot_id)',
+        "type = 'income_dues' AND semester_id IS NULL AND weekly_slot_id IS NOT NULL",
+    )
+
+    # Everything else defaults to the active semester, if there is one
+    with ctx.engine.connect() as conn:
+        active = conn.execute(text('SELECT id FROM semester WHERE is_active = :yes ORDER BY id'), {'yes': True}).first()
+    if active:
+        ctx.backfill('transaction', 'semester_id = :sem', 'semester_id IS NULL', sem=active[0])
+
+
+@migration('0002', 'Ledger balance summary')
+def create_ledger_balance(ctx):
+    ctx.create_table(LedgerBalance)
+    _fill_ledger_balance(ctx, ('transaction',))
+
+
+@migration('0003', 'Indexes for hot Transaction, slot, announcement and activity queries')
+def create_hot_path_indexes(ctx):
+    for model in (User, WeeklySlot, Announcement, Transaction, Activity):
+        ctx.create_indexes(model)
+
+
+@migration('0004', 'Data-version stamps for HTTP caching')
+def create_data_version(ctx):
+    ctx.create_table(DataVersion)
+
+
+@migration('0005', 'Activity.updated_at and deletion tombstones for incremental event feeds')
+def add_activity_updated_at(ctx):
+    ctx.add_column('activity', 'updated_at', 'DATETIME')
+    ctx.backfill('activity', 'updated_at = COALESCE(created_at, start_date)', 'updated_at IS NULL')
+    ctx.create_indexes(Activity)
+    ctx.create_table(DeletedActivity)
+
+
+@migration('0006', 'Money as integer minor units (satang)')
+def money_minor_units(ctx):
+    ctx.add_column('transaction', 'amount_minor', 'BIGINT')
+    if ctx.has_column('transaction', 'amount'):
+        ctx.backfill('transaction', 'amount_minor = CAST(ROUND(amount * 100) AS BIGINT)', 'amount_minor IS NULL')
+        ctx.drop_column('transaction', 'amount')
+    ctx.add_column('ledger_balance', 'total_minor', 'BIGINT NOT NULL DEFAULT 0')
+    ctx.drop_column('ledger_balance', 'total')
+    # The archive table only arrives in 0008
+    _fill_ledger_balance(ctx, ('transaction',))
+
+
+@migration('0007', 'Rejection reason for reviewed dues slips')
+def add_rejection_reason(ctx):
+    ctx.add_column('transaction', 'rejection_reason', 'VARCHAR(255)')
+
+
+@migration('0008', 'Semester snapshots and archive tables for closed semesters')
+def add_semester_archive(ctx):
+    ctx.add_column('semester', 'archived_at', 'DATETIME')
+    for model in (TransactionArchive, WeeklySlotArchive, SemesterSnapshot):
+        ctx.create_table(model)
+        ctx.create_indexes(model)
+
+
+# Search documents as search.py built them at 0009: (index table, source
+# table, rowid code, title columns, body columns); rowid = id * 8 + code
+_SEARCH_0009 = (
+    ('search_member', 'user', 1, ('real_name',), ('username', 'department')),
+    ('search_transaction', 'transaction', 2, ('description',), ()),
+    ('search_transaction', 'transaction_archive', 5, ('description',), ()),
+    ('search_announcement', 'announcement', 3, ('title',), ('content',)),
+    ('search_activity', 'activity', 4, ('title',), ()),
+)
+_THAI_RUN_0009 = re.compile('[ก-๛]+')
+_TOKENCHARS_0009 = ''.join(chr(c) for c in range(0x0e01, 0x0e5c))
+
+
+def _segment_0009(value):
+    def bigrams(match):
+        run = match.group()
+        return ' '.join(run[i:i + 2] for i in range(max(1, len(run) - 1)))
+    return _THAI_RUN_0009.sub(bigrams, value or '')
+
+
+@migration('0009', 'Full-text search index')
+def add_search_index(ctx):
+    for name in sorted({index_table for index_table, _, _, _, _ in _SEARCH_0009}):
+        if ctx.has_table(name):
+            continue
+        if ctx.dialect == 'sqlite':
+            ctx.execute(f"CREATE VIRTUAL TABLE {name} USING fts5(title, body, prefix = '1 2', "
+                        f'tokenize = "unicode61 remove_diacritics 2 tokenchars \'{_TOKENCHARS_0009}\'")')
+        elif ctx.dialect == 'postgresql':
+            ctx.execute(f'CREATE TABLE {name} (rowid BIGINT PRIMARY KEY, title TEXT, body TEXT, '
+                        "document tsvector GENERATED ALWAYS AS ("
+                        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+                        "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED)")
+            ctx.execute(f'CREATE INDEX ix_{name}_document ON {name} USING gin (document)')
+        else:
+            ctx.execute(f'CREATE TABLE {name} (rowid BIGINT PRIMARY KEY, title TEXT, body TEXT)')
+    indexed = 0
+    for index_table, _, _, _, _ in _SEARCH_0009:
+        ctx.execute(f'DELETE FROM {index_table}')
+    for index_table, source, code, title, body in _SEARCH_0009:
+        columns = ', '.join(f'"{name}"' for name in title + body)
+        last = 0
+        while True:
+            with ctx.engine.connect() as conn:
+                rows = conn.execute(text(f'SELECT id, {columns} FROM "{source}" WHERE id > :last ORDER BY id LIMIT :n'),
+                                    {'last': last, 'n': ctx.batch_size}).all()
+            if not rows:
+                break
+            documents = [{
+                'rowid': row[0] * 8 + code,
+                'title': _segment_0009(' '.join(value or '' for value in row[1:1 + len(title)])),
+                'body': _segment_0009(' '.join(value or '' for value in row[1 + len(title):])),
+            } for row in rows]
+            with ctx.engine.begin() as conn:
+                conn.execute(text(f'INSERT INTO {index_table} (rowid, title, body) VALUES (:rowid, :title, :body)'),
+                             documents)
+            indexed += len(rows)
+            last = rows[-1][0]
+    ctx.echo(f'  indexed {indexed} documents')
+
+
+# arrears.rebuild() as of 0010: every member x every semester with slots,
+# plus a semester 0 row adding up each member's semesters
+_MEMBER_ARREARS_0010 = """
+INSERT INTO member_arrears (user_id, semester_id, weeks, paid_weeks, pending_weeks, owed_weeks, paid_minor, pending_minor)
+SELECT u.id, w.semester_id, w.weeks,
+       COALESCE(d.paid, 0),
+       COALESCE(d.covered, 0) - COALESCE(d.paid, 0),
+       CASE WHEN w.weeks > COALESCE(d.covered, 0) THEN w.weeks - COALESCE(d.covered, 0) ELSE 0 END,
+       COALESCE(d.paid_minor, 0),
+       COALESCE(d.pending_minor, 0)
+FROM "user" u
+CROSS JOIN (
+    SELECT semester_id, COUNT(*) AS weeks
+    FROM (SELECT semester_id FROM weekly_slot UNION ALL SELECT semester_id FROM weekly_slot_archive) s
+    GROUP BY semester_id
+) w
+LEFT JOIN (
+    SELECT user_id, semester_id,
+           COUNT(DISTINCT CASE WHEN status = 'approved' THEN weekly_slot_id END) AS paid,
+           COUNT(DISTINCT CASE WHEN status IN ('pending', 'approved') THEN weekly_slot_id END) AS covered,
+           SUM(CASE WHEN status = 'approved' THEN amount_minor ELSE 0 END) AS paid_minor,
+           SUM(CASE WHEN status = 'pending' THEN amount_minor ELSE 0 END) AS pending_minor
+    FROM (
+        SELECT user_id, semester_id, weekly_slot_id, status, amount_minor FROM "transaction"
+        WHERE type = 'income_dues' AND user_id IS NOT NULL AND weekly_slot_id IS NOT NULL AND semester_id IS NOT NULL
+        UNION ALL
+        SELECT user_id, semester_id, weekly_slot_id, status, amount_minor FROM transaction_archive
+        WHERE type = 'income_dues' AND user_id IS NOT NULL AND weekly_slot_id IS NOT NULL AND semester_id IS NOT NULL
+    ) t
+    GROUP BY user_id, semester_id
+) d ON d.user_id = u.id AND d.semester_id = w.semester_id
+WHERE u.role = 'member'
+"""
+_MEMBER_ARREARS_TOTALS_0010 = """
+INSERT INTO member_arrears (user_id, semester_id, weeks, paid_weeks, pending_weeks, owed_weeks, paid_minor, pending_minor)
+SELECT u.id, 0, COALESCE(SUM(a.weeks), 0), COALESCE(SUM(a.paid_weeks), 0), COALESCE(SUM(a.pending_weeks), 0),
+       COALESCE(SUM(a.owed_weeks), 0), COALESCE(SUM(a.paid_minor), 0), COALESCE(SUM(a.pending_minor), 0)
+FROM "user" u
+LEFT JOIN member_arrears a ON a.user_id = u.id AND a.semester_id != 0
+WHERE u.role = 'member'
+GROUP BY u.id
+"""
+
+
+@migration('0010', 'Per-member arrears ledger')
+def add_member_arrears(ctx):
+    ctx.create_table(MemberArrears)
+    ctx.create_indexes(MemberArrears)
+    with ctx.engine.begin() as conn:
+        conn.execute(text('DELETE FROM member_arrears'))
+        rows = conn.execute(text(_MEMBER_ARREARS_0010)).rowcount
+        rows += conn.execute(text(_MEMBER_ARREARS_TOTALS_0010)).rowcount
+    ctx.echo(f'  rebuilt {rows} arrears rows')
+
+
+
+@migration('0011', 'Archive (status, date) index for listing live and archived rows together')
+def add_archive_status_date_index(ctx):
+    ctx.create_indexes(TransactionArchive)
+
+
+# arrears.rebuild() as of 0012: owed_weeks only counts the weeks that have
+# started by :today; the totals are summed as in 0010
+_MEMBER_ARREARS_0012 = """
+INSERT INTO member_arrears (user_id, semester_id, weeks, paid_weeks, pending_weeks, owed_weeks, paid_minor, pending_minor)
+SELECT u.id, w.semester_id, w.weeks,
+       COALESCE(d.paid, 0),
+       COALESCE(d.covered, 0) - COALESCE(d.paid, 0),
+       CASE WHEN w.started > COALESCE(d.covered_started, 0) THEN w.started - COALESCE(d.covered_started, 0) ELSE 0 END,
+       COALESCE(d.paid_minor, 0),
+       COALESCE(d.pending_minor, 0)
+FROM "user" u
+CROSS JOIN (
+    SELECT semester_id, COUNT(*) AS weeks, SUM(CASE WHEN start_date <= :today THEN 1 ELSE 0 END) AS started
+    FROM (SELECT semester_id, start_date FROM weekly_slot UNION ALL SELECT semester_id, start_date FROM weekly_slot_archive) s
+    GROUP BY semester_id
+) w
+LEFT JOIN (
+    SELECT user_id, semester_id,
+           COUNT(DISTINCT CASE WHEN status = 'approved' THEN weekly_slot_id END) AS paid,
+           COUNT(DISTINCT CASE WHEN status IN ('pending', 'approved') THEN weekly_slot_id END) AS covered,
+           COUNT(DISTINCT CASE WHEN status IN ('pending', 'approved') AND start_date <= :today THEN weekly_slot_id END)
+               AS covered_started,
+           SUM(CASE WHEN status = 'approved' THEN amount_minor ELSE 0 END) AS paid_minor,
+           SUM(CASE WHEN status = 'pending' THEN amount_minor ELSE 0 END) AS pending_minor
+    FROM (
+        SELECT t.user_id, t.semester_id, t.weekly_slot_id, t.status, t.amount_minor, s.start_date
+        FROM "transaction" t LEFT JOIN weekly_slot s ON s.id = t.weekly_slot_id
+        WHERE t.type = 'income_dues' AND t.user_id IS NOT NULL AND t.weekly_slot_id IS NOT NULL
+          AND t.semester_id IS NOT NULL
+        UNION ALL
+        SELECT t.user_id, t.semester_id, t.weekly_slot_id, t.status, t.amount_minor, s.start_date
+        FROM transaction_archive t LEFT JOIN weekly_slot_archive s ON s.id = t.weekly_slot_id
+        WHERE t.type = 'income_dues' AND t.user_id IS NOT NULL AND t.weekly_slot_id IS NOT NULL
+          AND t.semester_id IS NOT NULL
+    ) t
+    GROUP BY user_id, semester_id
+) d ON d.user_id = u.id AND d.semester_id = w.semester_id
+WHERE u.role = 'member'
+"""
+
+
+@migration('0012', 'Arrears count only the weeks that have started')
+def arrears_started_weeks(ctx):
+    ctx.create_table(ArrearsDay)
+    today = date.today().isoformat()
+    with ctx.engine.begin() as conn:
+        conn.execute(text('DELETE FROM member_arrears'))
+        rows = conn.execute(text(_MEMBER_ARREARS_0012), {'today': today}).rowcount
+        rows += conn.execute(text(_MEMBER_ARREARS_TOTALS_0010)).rowcount
+        conn.execute(text('DELETE FROM arrears_day'))
+        conn.execute(text('INSERT INTO arrears_day (id, day) VALUES (1, :today)'), {'today': today})
+    ctx.echo(f'  rebuilt {rows} arrears rows')
+
+
+if __name__ == '__main__':
+    from app import app
+    with app.app_context():
+        upgrade()
@@ -1,8 +1,10 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
+import money
+from database import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -12,12 +14,18 @@ class User(UserMixin, db.Model):
     department = db.Column(db.String(255), nullable=False)
     role = db.Column(db.String(50), default='member')  # 'admin' or 'member'
 
+    __table_args__ = (
+        db.Index('ix_user_role', 'role'),
+    )
+
 class Semester(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
     is_active = db.Column(db.Boolean, default=True)
+    # Set once the semester is closed and its rows moved to the archive tables (see archive.py)
+    archived_at = db.Column(db.DateTime, nullable=True)
     slots = db.relationship('WeeklySlot', backref='semester', lazy=True, cascade="all, delete-orphan")
 
 class WeeklySlot(db.Model):
@@ -27,6 +35,10 @@ class WeeklySlot(db.Model):
     start_date = db.Column(db.Date, nullable=False)
     end_date = db.Column(db.Date, nullable=False)
 
+    __table_args__ = (
+        db.Index('ix_weekly_slot_semester_week', 'semester_id', 'week_number'),
+    )
+
 class Project(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
@@ -39,12 +51,13 @@ class Announcement(db.Model):
     title = db.Column(db.String(200), nullable=False)
     content = db.Column(db.Text, nullable=False)
     image_filename = db.Column(db.String(200), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     type = db.Column(db.String(50), nullable=False)  # 'income_dues', 'income_donation', 'expense'
-    amount = db.Column(db.Float, nullable=False)
+    # Satang (1/100 baht); use the `amount` property for baht
+    amount_minor = db.Column(db.BigInteger, nullable=False)
     description = db.Column(db.String(255), nullable=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -61,16 +74,155 @@ class Transaction(db.Model):
     user = db.relationship('User', backref='transactions')
     
     # New columns for V3.5 critical update
-    status = db.Column(db.String(20), default='approved') # 'pending', 'approved'
+    status = db.Column(db.String(20), default='approved') # 'pending', 'approved', 'rejected'
+    # Shown to the member when a dues slip is rejected
+    rejection_reason = db.Column(db.String(255), nullable=True)
     semester_id = db.Column(db.Integer, db.ForeignKey('semester.id'), nullable=True)
     semester = db.relationship('Semester', backref='transactions')
+    # Listings that mix live and archived rows tell them apart by this
+    archived = False
+
+    @property
+    def amount(self):
+        return money.from_minor(self.amount_minor)
+
+    @amount.setter
+    def amount(self, value):
+        self.amount_minor = money.to_minor(value)
+
+    # Access paths of the hot routes (see query_plans.py)
+    __table_args__ = (
+        db.Index('ix_transaction_status_date', 'status', 'date'),  # treasury, report
+        db.Index('ix_transaction_semester_type', 'semester_id', 'type', 'user_id'),  # tracker
+        db.Index('ix_transaction_user_slot_type', 'user_id', 'weekly_slot_id', 'type'),  # member dues
+        db.Index('ix_transaction_project', 'project_id'),
+        db.Index('ix_transaction_date', 'date'),
+        # Approval queue: only the (small) set of pending dues
+        db.Index('ix_transaction_pending_dues', 'date',
+                 sqlite_where=db.text("status = 'pending' AND type = 'income_dues'"),
+                 postgresql_where=db.text("status = 'pending' AND type = 'income_dues'")),
+    )
+
+class TransactionArchive(db.Model):
+    # Transactions of archived semesters, moved here verbatim (same ids and
+    # columns) so the hot transaction table only holds open semesters
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(50), nullable=False)
+    amount_minor = db.Column(db.BigInteger, nullable=False)
+    description = db.Column(db.String(255), nullable=True)
+    date = db.Column(db.DateTime)
+    project_id = db.Column(db.Integer, db.ForeignKey('project.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    slip_filename = db.Column(db.String(200), nullable=True)
+    weekly_slot_id = db.Column(db.Integer, nullable=True)  # WeeklySlotArchive.id
+    status = db.Column(db.String(20))
+    rejection_reason = db.Column(db.String(255), nullable=True)
+    semester_id = db.Column(db.Integer, db.ForeignKey('semester.id'), nullable=True)
+    project = db.relationship('Project')
+    user = db.relationship('User')
+    archived = True
+
+    @property
+    def amount(self):
+        return money.from_minor(self.amount_minor)
+
+    __table_args__ = (
+        db.Index('ix_transaction_archive_semester_status_date', 'semester_id', 'status', 'date'),  # treasury, report
+        db.Index('ix_transaction_archive_status_date', 'status', 'date'),  # all-semesters treasury, report
+        db.Index('ix_transaction_archive_project', 'project_id'),
+        db.Index('ix_transaction_archive_user', 'user_id'),
+    )
+
+class WeeklySlotArchive(db.Model):
+    # Weekly slots of archived semesters, same ids as they had in weekly_slot
+    id = db.Column(db.Integer, primary_key=True)
+    semester_id = db.Column(db.Integer, db.ForeignKey('semester.id'), nullable=False)
+    week_number = db.Column(db.Integer, nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_weekly_slot_archive_semester_week', 'semester_id', 'week_number'),
+    )
+
+class SemesterSnapshot(db.Model):
+    # Figures of an archived semester frozen at close time; never updated.
+    # JSON columns are decoded by archive.Snapshot.
+    semester_id = db.Column(db.Integer, db.ForeignKey('semester.id'), primary_key=True)
+    closed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    income_minor = db.Column(db.BigInteger, nullable=False, default=0)
+    expense_minor = db.Column(db.BigInteger, nullable=False, default=0)
+    transaction_count = db.Column(db.Integer, nullable=False, default=0)
+    # [[type, project_id or 0, total_minor, count]] of approved transactions
+    subtotal_rows = db.Column(db.Text, nullable=False)
+    # {"weeks": [[week_number, start, end]], "members": {user_id: "PP?-"}}
+    dues_matrix = db.Column(db.Text, nullable=False)
 
 class Activity(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=True)
-    start_date = db.Column(db.DateTime, nullable=False)
+    start_date = db.Column(db.DateTime, nullable=False, index=True)
     end_date = db.Column(db.DateTime, nullable=False)
     location = db.Column(db.String(200), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Drives incremental /api/events?since=... feeds
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+class DeletedActivity(db.Model):
+    # Tombstones so incremental event feeds can report deletions
+    id = db.Column(db.Integer, primary_key=True)  # id of the deleted Activity
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+class LedgerBalance(db.Model):
+    # Running totals of Transaction.amount_minor, kept in step with every write to the
+    # transaction table so balance pages never have to scan the ledger.
+    # semester_id / project_id use 0 for "none" so the unique key also covers them.
+    id = db.Column(db.Integer, primary_key=True)
+    semester_id = db.Column(db.Integer, nullable=False, default=0)
+    project_id = db.Column(db.Integer, nullable=False, default=0)
+    type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    total_minor = db.Column(db.BigInteger, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('semester_id', 'project_id', 'type', 'status', name='uq_ledger_balance_key'),
+    )
+
+class MemberArrears(db.Model):
+    # Dues position of one member in one semester (semester_id 0: all semesters
+    # together), kept in step with every dues write by arrears.py so history
+    # pages and arrears rankings never have to scan the ledger
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    semester_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    weeks = db.Column(db.Integer, nullable=False, default=0)
+    paid_weeks = db.Column(db.Integer, nullable=False, default=0)  # an approved payment
+    pending_weeks = db.Column(db.Integer, nullable=False, default=0)  # a pending payment, none approved
+    owed_weeks = db.Column(db.Integer, nullable=False, default=0)  # neither
+    paid_minor = db.Column(db.BigInteger, nullable=False, default=0)
+    pending_minor = db.Column(db.BigInteger, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_member_arrears_owed', 'semester_id', 'owed_weeks', 'user_id'),  # who owes most
+    )
+
+class ArrearsDay(db.Model):
+    # The day whose started weeks MemberArrears.owed_weeks counts (a single
+    # row), moved forward by the daily `flask refresh-arrears`
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+
+class SchemaVersion(db.Model):
+    # One row per migration applied by migrations.py
+    version = db.Column(db.String(20), primary_key=True)
+    description = db.Column(db.String(255), nullable=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class DataVersion(db.Model):
+    # Change counters for groups of data (see versions.py), bumped by every
+    # write so caches and conditional GETs can validate with one cheap lookup
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,29 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Money is stored and summed as integer minor units (satang, 1/100 baht) so
+# totals are exact; it only becomes a Decimal or a "1234.50" string at the edges
+# (form input, templates, exports).
+
+MINOR_PER_UNIT = 100
+_ONE = Decimal(1)
+
+
+def to_minor(value):
+    """Baht as a form string, Decimal, int or float -> satang (int), rounding half up."""
+    try:
+        amount = Decimal(str(value).strip().replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f'Invalid amount: {value!r}')
+    if not amount.is_finite():
+        raise ValueError(f'Invalid amount: {value!r}')
+    return int((amount * MINOR_PER_UNIT).quantize(_ONE, rounding=ROUND_HALF_UP))
+
+
+def from_minor(minor):
+    """Satang -> Decimal baht with two places."""
+    return Decimal(int(minor or 0)).scaleb(-2)
+
+
+def format_minor(minor):
+    """Satang -> '1234.50' (the format templates and exports used for float amounts)."""
+    return f'{from_minor(minor):.2f}'
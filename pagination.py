@@ -0,0 +1,118 @@
+import base64
+import operator
+from datetime import datetime
+from models import db
+
+# Keyset (cursor) pagination over (date, id). A page is fetched with
+# "WHERE (date, id) < (:date, :id) ORDER BY date DESC, id DESC LIMIT n", which
+# the (status, date) index serves directly, so every page costs the same no
+# matter how large the ledger is. Cursors are opaque url-safe strings.
+# Models without a `date` column pass their own (e.g. Announcement.created_at).
+#
+# Rows whose column is NULL cannot be compared in the tuple filter, so they are
+# listed after the dated ones, by id alone ("date IS NULL ORDER BY id"), with a
+# cursor that carries an empty date. A page that crosses from one part to the
+# other is filled by a second query; both stay on the same index.
+#
+# keyset_pages() lists several tables as one (live and archived transactions):
+# each source is paged as above and the pages are merged on (date, id, source),
+# the source number breaking ties between rows of different tables that share
+# an id. Cursors of a merged listing carry the source of their row.
+
+PAGE_SIZE = 50
+
+
+def encode_cursor(date, row_id, source=0):
+    raw = f'{date.isoformat() if date is not None else ""}|{row_id}' + (f'|{source}' if source else '')
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (date, id, source), with date None for an undated row, or None for a missing or malformed cursor."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        date, row_id, *source = raw.split('|')
+        if len(source) > 1:
+            return None
+        return (datetime.fromisoformat(date) if date else None), int(row_id), int(source[0]) if source else 0
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, cursor):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.cursor = cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def is_first(self):
+        return not self.cursor
+
+
+def keyset_query(query, model, cursor=None, descending=True, per_page=PAGE_SIZE, column=None, undated=False,
+                 source=0):
+    """One part of a page with a one-row look-ahead limit.
+
+    The dated rows ordered by (column, model.id) after the cursor, or with
+    undated=True the rows whose column is NULL, ordered by model.id. source is
+    the query's number in a merged listing: a row that ties with the cursor on
+    (column, id) still follows it when its source comes after the cursor's.
+    """
+    column = model.date if column is None else column
+    position = decode_cursor(cursor)
+    inclusive = position is not None and (source < position[2] if descending else source > position[2])
+    after = {(True, False): operator.lt, (True, True): operator.le,
+             (False, False): operator.gt, (False, True): operator.ge}[descending, inclusive]
+    if undated:
+        query = query.filter(column.is_(None))
+        if position is not None and position[0] is None:
+            query = query.filter(after(model.id, position[1]))
+        order = [model.id]
+    else:
+        query = query.filter(column.isnot(None))
+        if position is not None:
+            query = query.filter(after(db.tuple_(column, model.id), db.tuple_(*position[:2])))
+        order = [column, model.id]
+    return query.order_by(*(c.desc() if descending else c.asc() for c in order)).limit(per_page + 1)
+
+
+def keyset_pages(sources, cursor=None, descending=True, per_page=PAGE_SIZE):
+    """Fetch one page of several (query, model, column) sources listed as one.
+
+    Rows are ordered by (column, id, source), undated rows last.
+    """
+    position = decode_cursor(cursor)
+    in_undated = position is not None and position[0] is None
+    keyed = []
+    if not in_undated:
+        for source, (query, model, column) in enumerate(sources):
+            keyed += [((getattr(row, column.key), row.id, source), row)
+                      for row in keyset_query(query, model, cursor, descending, per_page, column, source=source)]
+        keyed.sort(key=lambda item: item[0], reverse=descending)
+        keyed = keyed[:per_page + 1]
+    if len(keyed) <= per_page:
+        # Top the page up (and look one row ahead) from the undated rows
+        undated = []
+        for source, (query, model, column) in enumerate(sources):
+            undated += [((None, row.id, source), row)
+                        for row in keyset_query(query, model, cursor if in_undated else None, descending,
+                                                per_page - len(keyed), column, undated=True, source=source)]
+        undated.sort(key=lambda item: item[0][1:], reverse=descending)
+        keyed += undated[:per_page + 1 - len(keyed)]
+    next_cursor = None
+    if len(keyed) > per_page:
+        keyed = keyed[:per_page]
+        next_cursor = encode_cursor(*keyed[-1][0])
+    return KeysetPage([row for _, row in keyed], next_cursor, cursor if position is not None else None)
+
+
+def keyset_page(query, model, cursor=None, descending=True, per_page=PAGE_SIZE, column=None):
+    """Fetch one page of query ordered by (column, model.id), undated rows last; column defaults to model.date."""
+    return keyset_pages([(query, model, model.date if column is None else column)], cursor, descending, per_page)
@@ -0,0 +1,111 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from werkzeug.security import generate_password_hash, check_password_hash
+
+# Password hashing off the request thread.
+#
+# scrypt is deliberately expensive, so hashes are computed on a small process
+# pool (created lazily, after gunicorn has forked). A semaphore bounds how many
+# hashes a worker may have queued or running; past that, HashingBusy is raised
+# and the request gets a 503 instead of piling up behind a burst of logins.
+# SCRYPT_COST is the werkzeug method string ("scrypt:N:r:p"); hashes made with
+# another cost are upgraded on the next successful login (see needs_rehash).
+# With PASSWORD_WORKERS=0 hashing runs inline.
+#
+# The request still waits for its own hash: a sync gunicorn worker is busy for
+# the whole scrypt call either way. What the pool buys is a CPU bound per worker
+# (PASSWORD_WORKERS processes) and fast 503s under a burst; with threaded
+# workers (--threads) the other requests of that worker keep running. Both
+# PASSWORD_WORKERS and PASSWORD_QUEUE are per gunicorn worker, so a server can
+# run up to workers x PASSWORD_WORKERS hashes at once and hold workers x
+# PASSWORD_QUEUE in flight; size them for the host's cores.
+
+DEFAULT_COST = 'scrypt:32768:8:1'
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def init_app(app):
+    app.config.setdefault('SCRYPT_COST', os.environ.get('SCRYPT_COST', DEFAULT_COST))
+    app.config.setdefault('PASSWORD_WORKERS', int(os.environ.get('PASSWORD_WORKERS', 2)))
+    # Hashes a worker may have in flight (queued + running) before shedding load
+    app.config.setdefault('PASSWORD_QUEUE', int(os.environ.get('PASSWORD_QUEUE', 16)))
+    # Seconds a request waits for a free queue slot before HashingBusy
+    app.config.setdefault('PASSWORD_WAIT', float(os.environ.get('PASSWORD_WAIT', 0.5)))
+
+
+def _pool():
+    global _executor, _slots
+    with _lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(current_app.config['PASSWORD_QUEUE'])
+        workers = current_app.config['PASSWORD_WORKERS']
+        if _executor is None and workers:
+            _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor, _slots
+
+
+def _run(fn, *args):
+    executor, slots = _pool()
+    if not slots.acquire(timeout=current_app.config['PASSWORD_WAIT']):
+        raise HashingBusy()
+    try:
+        if executor is None:
+            return fn(*args)
+        return executor.submit(fn, *args).result()
+    finally:
+        slots.release()
+
+
+def hash_password(password):
+    return _run(generate_password_hash, password, current_app.config['SCRYPT_COST'])
+
+
+def verify_password(pwhash, password):
+    return _run(check_password_hash, pwhash, password)
+
+
+def _method_params(method):
+    """Normalised parameters of a werkzeug method string; bare "scrypt" means werkzeug's defaults."""
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        try:
+            return (name,) + (tuple(map(int, args)) if args else (2 ** 15, 8, 1))
+        except ValueError:
+            return None
+    return (name,) + tuple(args)
+
+
+def needs_rehash(pwhash):
+    """True if pwhash was made with a different method or cost than SCRYPT_COST."""
+    return _method_params(pwhash.split('$', 1)[0]) != _method_params(current_app.config['SCRYPT_COST'])
+
+
+def hash_many(passwords, workers=None):
+    """Hash a batch (member import) in parallel.
+
+    Uses the shared pool, holding one queue slot for the whole batch, or a
+    dedicated pool of `workers` processes (the CLI import).
+    """
+    cost = current_app.config['SCRYPT_COST']
+    costs = [cost] * len(passwords)
+    if workers:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(generate_password_hash, passwords, costs, chunksize=4))
+    executor, slots = _pool()
+    if not slots.acquire(timeout=current_app.config['PASSWORD_WAIT']):
+        raise HashingBusy()
+    try:
+        if executor is None:
+            return [generate_password_hash(p, cost) for p in passwords]
+        return list(executor.map(generate_password_hash, passwords, costs, chunksize=4))
+    finally:
+        slots.release()
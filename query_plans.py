@@ -0,0 +1,139 @@
+import re
+from datetime import datetime
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import Executable, ClauseElement
+from models import (db, User, WeeklySlot, Announcement, Transaction, TransactionArchive, Activity, MemberArrears,
+                    ArrearsDay)
+from dues_matrix import approved_counts_query, cells_query, member_weeks_query
+from pagination import encode_cursor, keyset_query
+
+# Query-plan regression check for the hot routes (`flask check-query-plans`,
+# also run by tests/test_query_plans.py). Each entry rebuilds the query a route
+# issues, through the same helpers the route uses, and asserts via SQLite's
+# EXPLAIN QUERY PLAN that no large table is walked end to end: neither a plain
+# "SCAN <table>" nor a "SCAN <table> USING INDEX", which reads every index entry.
+
+# Tables that grow with club activity; any SCAN of these fails the check
+HOT_TABLES = {'transaction', 'weekly_slot', 'announcement', 'activity', 'user', 'transaction_archive',
+              'member_arrears'}
+
+# Queries that walk a table on purpose, with the reason
+ALLOWED_SCANS = {
+    'home.announcements': 'first page of news: the index is read newest first and LIMIT stops it after one page',
+}
+
+_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX \w+)?$')
+
+
+class ExplainQueryPlan(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, stmt):
+        self.stmt = stmt
+
+
+@compiles(ExplainQueryPlan, 'sqlite')
+def _compile_explain(element, compiler, **kw):
+    return 'EXPLAIN QUERY PLAN ' + compiler.process(element.stmt, **kw)
+
+
+def route_queries():
+    """(name, statement) for the queries each hot route runs, with representative parameters."""
+    from app import (NEWS_PAGE_SIZE, TRACKER_PAGE_SIZE, members_query, pending_dues_query, report_filters,
+                     tracker_page, tracker_query)
+    now = datetime.utcnow()
+    # Listings are checked on a later page, so the keyset cursor filter is in the plan;
+    # the ".undated" entries are the part of a listing whose date is NULL
+    cursor = encode_cursor(now, 100)
+    undated_cursor = encode_cursor(None, 100)
+
+    def news(cursor):
+        return keyset_query(Announcement.query, Announcement, cursor, per_page=NEWS_PAGE_SIZE,
+                            column=Announcement.created_at)
+
+    # The treasury/report listing of one table (app.ledger_page merges live and archived)
+    def listing(model, project_id, semester_id, descending, undated=False):
+        return keyset_query(model.query.filter(*report_filters(project_id, semester_id, model)), model,
+                            undated_cursor if undated else cursor, descending=descending, undated=undated)
+
+    # The tracker's second page of members still owing some of 17 started weeks
+    def tracker(department=None):
+        return tracker_page(tracker_query(1, department, due=17), 100, TRACKER_PAGE_SIZE)
+
+    queries = [
+        ('home.announcements', news(None)),
+        ('older_news', news(cursor)),
+        ('older_news.undated', keyset_query(Announcement.query, Announcement, undated_cursor, per_page=NEWS_PAGE_SIZE,
+                                            column=Announcement.created_at, undated=True)),
+        ('home.events', Activity.query.filter(Activity.start_date >= now).order_by(Activity.start_date.asc()).limit(5)),
+        ('api_events', Activity.query.filter(
+            Activity.start_date < now, Activity.end_date >= now).order_by(Activity.start_date.asc())),
+        ('api_events.since', Activity.query.filter(
+            Activity.start_date < now, Activity.end_date >= now, Activity.updated_at > now)),
+        ('login', User.query.filter_by(username='admin')),
+        ('dues.slots', WeeklySlot.query.filter_by(semester_id=1).order_by(WeeklySlot.week_number)),
+        ('dues.matrix', member_weeks_query(1, 1)),
+        ('pay_dues.slot', WeeklySlot.query.filter_by(id=1)),
+        ('pay_dues.arrears_week', db.session.query(Transaction.status).filter(
+            Transaction.user_id == 1, Transaction.weekly_slot_id == 1, Transaction.type == 'income_dues')),
+        ('pay_dues.arrears_started', db.session.query(WeeklySlot.id).join(ArrearsDay, ArrearsDay.id == 1).filter(
+            WeeklySlot.id.in_([1, 2]), WeeklySlot.start_date <= ArrearsDay.day)),
+        ('dues_history', MemberArrears.query.filter(MemberArrears.user_id == 1, MemberArrears.semester_id != 0)),
+        ('edit_semester.orphaned_dues', db.session.query(Transaction.id, Transaction.user_id).filter(
+            Transaction.semester_id == 1, Transaction.weekly_slot_id.in_([1, 2]))),
+        ('admin_dashboard.pending_count',
+         db.session.query(db.func.count(Transaction.id)).filter_by(status='pending', type='income_dues')),
+        ('admin_approvals.arrears_weeks', db.session.query(
+            Transaction.id, Transaction.user_id, Transaction.weekly_slot_id, Transaction.status,
+        ).filter(Transaction.user_id.in_([1, 2]), Transaction.weekly_slot_id.in_([1, 2]),
+                 Transaction.type == 'income_dues')),
+        ('admin_arrears.ranking', db.session.query(MemberArrears, User).join(User, User.id == MemberArrears.user_id).filter(
+            MemberArrears.semester_id == 0, MemberArrears.owed_weeks > 0,
+        ).order_by(MemberArrears.owed_weeks.desc(), MemberArrears.user_id.desc()).limit(50)),
+        ('admin_approvals.pending', keyset_query(pending_dues_query(), Transaction, cursor, descending=False)),
+        ('admin_approvals.pending.undated', keyset_query(pending_dues_query(), Transaction, undated_cursor,
+                                                         descending=False, undated=True)),
+        ('admin_treasury.list', listing(Transaction, None, None, descending=True)),
+        ('admin_treasury.list.undated', listing(Transaction, None, None, descending=True, undated=True)),
+        ('admin_treasury.list.archived', listing(TransactionArchive, None, None, descending=True)),
+        ('admin_treasury.semester', listing(Transaction, None, 1, descending=True)),
+        ('admin_treasury.archived_semester', listing(TransactionArchive, None, 1, descending=True)),
+        ('delete_semester.detach', db.session.query(Transaction.id).filter(Transaction.semester_id == 1)),
+        ('admin_report.project', listing(Transaction, 1, None, descending=False)),
+        ('admin_report.project.undated', listing(Transaction, 1, None, descending=False, undated=True)),
+        ('admin_report.project.archived', listing(TransactionArchive, 1, None, descending=False)),
+        ('admin_tracker.page', tracker()),
+        ('admin_tracker.page.department', tracker('Engineering')),
+        ('admin_tracker.matrix', cells_query(1, list(range(1, TRACKER_PAGE_SIZE + 1)))),
+        ('admin_tracker.semester_matrix', cells_query(1)),
+        ('admin_tracker.collection_rates', approved_counts_query(1)),
+        ('admin_members.owed', members_query('owed')),
+        ('admin_news.list', keyset_query(Announcement.query, Announcement, cursor, column=Announcement.created_at)),
+        ('admin_events.list', keyset_query(Activity.query, Activity, cursor, column=Activity.start_date)),
+    ]
+    return [(name, getattr(q, 'statement', q)) for name, q in queries]
+
+
+def explain(stmt):
+    return [row[-1] for row in db.session.execute(ExplainQueryPlan(stmt))]
+
+
+def full_scans(plan):
+    """Hot tables the plan reads end to end, with or without an index."""
+    scanned = []
+    for detail in plan:
+        match = _SCAN.match(detail.strip())
+        if match and match.group(1) in HOT_TABLES:
+            scanned.append(match.group(1))
+    return scanned
+
+
+def check_plans():
+    """Return [(name, plan, scanned_tables)] for every query that scans a hot table and is not allowed to."""
+    failures = []
+    for name, stmt in route_queries():
+        plan = explain(stmt)
+        scanned = full_scans(plan)
+        if scanned and name not in ALLOWED_SCANS:
+            failures.append((name, plan, scanned))
+    return failures
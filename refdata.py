@@ -0,0 +1,98 @@
+from collections import namedtuple
+from flask import g
+from flask_login import UserMixin
+from models import User, Semester, Project, SemesterSnapshot
+from cache import TTLCache
+import versions
+import archive
+
+# Cached snapshots of data read on nearly every request: the logged-in user,
+# the active semester, the semester/project dropdowns and the (immutable)
+# snapshots of archived semesters.
+#
+# Entries are plain values detached from the session, keyed by the 'users' or
+# 'refdata' data-version stamp they were loaded under. Routes that change these
+# rows call changed() in the same transaction; every worker sees the new stamp
+# on its next request (one primary-key read per request) and reloads, and the
+# TTL bounds how long anything can live regardless.
+
+CachedSemester = namedtuple('CachedSemester', 'id name start_date end_date is_active archived_at')
+CachedProject = namedtuple('CachedProject', 'id name description status')
+
+_cache = TTLCache(max_entries=2048, ttl=300)
+
+
+class CachedUser(UserMixin):
+    """Read-only stand-in for User as current_user; re-fetch the User row to modify it."""
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.real_name = user.real_name
+        self.department = user.department
+        self.role = user.role
+
+
+def _stamps():
+    stamps = g.get('refdata_versions')
+    if stamps is None:
+        current = versions.get(versions.USERS, versions.REFDATA)
+        stamps = g.refdata_versions = {name: version for name, (version, _) in current.items()}
+    return stamps
+
+
+def _cached(stamp, key, load):
+    return _cache.get_or_load((stamp, _stamps()[stamp]) + key, load)
+
+
+def changed(*names):
+    """Bump the given stamps (versions.USERS / versions.REFDATA) in the current transaction."""
+    versions.bump(*names)
+    g.pop('refdata_versions', None)
+
+
+def get_user(user_id):
+    def load():
+        user = User.query.get(user_id)
+        return CachedUser(user) if user else None
+    return _cached(versions.USERS, ('user', user_id), load)
+
+
+def _semester(sem):
+    return CachedSemester(sem.id, sem.name, sem.start_date, sem.end_date, sem.is_active, sem.archived_at)
+
+
+def active_semester():
+    def load():
+        sem = Semester.query.filter_by(is_active=True).first()
+        return _semester(sem) if sem else None
+    return _cached(versions.REFDATA, ('active_semester',), load)
+
+
+def semesters():
+    """Every semester, newest first."""
+    def load():
+        return [_semester(s) for s in Semester.query.order_by(Semester.start_date.desc())]
+    return _cached(versions.REFDATA, ('semesters',), load)
+
+
+def semester(semester_id):
+    """One semester from the cached list, or None."""
+    return next((s for s in semesters() if s.id == semester_id), None)
+
+
+def snapshot(semester_id):
+    """archive.Snapshot of an archived semester, or None."""
+    def load():
+        row = SemesterSnapshot.query.get(semester_id)
+        return archive.Snapshot(row) if row else None
+    return _cached(versions.REFDATA, ('snapshot', semester_id), load)
+
+
+def projects(include_cancelled=True):
+    def load():
+        query = Project.query
+        if not include_cancelled:
+            query = query.filter(Project.status != 'Cancelled')
+        return [CachedProject(p.id, p.name, p.description, p.status) for p in query.order_by(Project.id)]
+    return _cached(versions.REFDATA, ('projects', include_cancelled), load)
@@ -0,0 +1,206 @@
+import re
+from collections import namedtuple
+from sqlalchemy import event, select, delete, insert, text, table, column, inspect
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import joinedload
+from models import db, User, Transaction, TransactionArchive, Announcement, Activity
+from database import RoutingSession
+
+# Full-text search over members, transactions, announcements and activities
+# (the admin search page).
+#
+# Each kind of result has its own index table holding a (title, body)
+# document per searchable row, so a common word in a million dues slips does
+# not slow down a member search. The rowid encodes the source row as
+# id * STRIDE + table code, so a row is replaced or removed by primary key.
+# On SQLite the tables are FTS5 virtual tables ranked with bm25 (their
+# unicode61 tokenizer keeps Thai vowel and tone marks inside tokens); on
+# PostgreSQL they are plain tables with a generated tsvector column under a GIN
+# index, ranked with ts_rank; migration 0009 creates them. Every match is
+# ranked (newest first among equals), so an old strong match still comes
+# first; only the final list is cut to the page size.
+#
+# Thai is written without spaces between words, so runs of Thai characters
+# are indexed as overlapping character bigrams ("สมาชิก" -> "สม มา าช ชิ ิก")
+# and a Thai search term becomes a phrase of its bigrams: substring matching
+# without a word-segmentation dictionary. Other scripts use the normal word
+# tokenizer; every term matches as a prefix.
+#
+# ORM inserts, updates and deletes of indexed rows update the index in the
+# same transaction (after_flush hook). Bulk Core statements bypass the hook
+# and call index()/remove() themselves; `flask rebuild-search-index` rebuilds
+# everything.
+
+# kind: (models, title columns, body columns); transactions of archived
+# semesters stay searchable
+KINDS = {
+    'member': ((User,), ('real_name',), ('username', 'department')),
+    'transaction': ((Transaction, TransactionArchive), ('description',), ()),
+    'announcement': ((Announcement,), ('title',), ('content',)),
+    'activity': ((Activity,), ('title',), ()),
+}
+# The archive keeps transaction ids that the live table may hand out again,
+# so the two tables are indexed under different codes
+CODES = {User: 1, Transaction: 2, Announcement: 3, Activity: 4, TransactionArchive: 5}
+MODELS = {code: model for model, code in CODES.items()}
+MODEL_KINDS = {model: kind for kind, (models, _, _) in KINDS.items() for model in models}
+STRIDE = 8
+TABLES = {kind: table(f'search_{kind}', column('rowid'), column('title'), column('body')) for kind in KINDS}
+MAX_TERMS = 8
+BATCH_SIZE = 5000
+
+_THAI = 'ก-๛'
+_THAI_RUN = re.compile(f'[{_THAI}]+')
+_TERM = re.compile(f'[{_THAI}]+|[^\\W_{_THAI}]+')
+
+Results = namedtuple('Results', 'query hits more')
+
+
+def _bigrams(run):
+    return [run[i:i + 2] for i in range(max(1, len(run) - 1))]
+
+
+def segment(value):
+    """Text as stored in the index: Thai runs replaced by their bigrams."""
+    return _THAI_RUN.sub(lambda m: ' '.join(_bigrams(m.group())), value or '')
+
+
+def terms(query):
+    """Phrases (lists of index tokens) of a search box query; all of them must match."""
+    return [_bigrams(word) if _THAI_RUN.fullmatch(word) else [word.lower()]
+            for word in _TERM.findall(query or '')][:MAX_TERMS]
+
+
+def _document(model, row):
+    _, title, body = KINDS[MODEL_KINDS[model]]
+    return {
+        'rowid': row.id * STRIDE + CODES[model],
+        'title': segment(' '.join(getattr(row, name) or '' for name in title)),
+        'body': segment(' '.join(getattr(row, name) or '' for name in body)),
+    }
+
+
+def _write(conn, model, rows):
+    documents = [_document(model, row) for row in rows]
+    if not documents:
+        return 0
+    index_table = TABLES[MODEL_KINDS[model]]
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        # FTS5 tables take no ON CONFLICT clause, but do honour OR REPLACE on the rowid
+        conn.execute(insert(index_table).prefix_with('OR REPLACE'), documents)
+    elif dialect == 'postgresql':
+        stmt = postgresql.insert(index_table)
+        conn.execute(stmt.on_conflict_do_update(
+            index_elements=['rowid'], set_={'title': stmt.excluded.title, 'body': stmt.excluded.body},
+        ), documents)
+    else:
+        conn.execute(delete(index_table).where(index_table.c.rowid.in_([d['rowid'] for d in documents])))
+        conn.execute(insert(index_table), documents)
+    return len(documents)
+
+
+def index(model, where=None):
+    """(Re)index the rows of model matching where, in the current transaction; returns the row count."""
+    _, title, body = KINDS[MODEL_KINDS[model]]
+    stmt = select(model.id, *(getattr(model, name) for name in title + body)).order_by(model.id)
+    if where is not None:
+        stmt = stmt.where(where)
+    conn = db.session.connection()
+    written, last = 0, None
+    # Keyset batches, so a million rows are never held in memory at once
+    while True:
+        batch = conn.execute((stmt if last is None else stmt.where(model.id > last)).limit(BATCH_SIZE)).all()
+        if not batch:
+            return written
+        written += _write(conn, model, batch)
+        last = batch[-1].id
+
+
+def remove(model, where):
+    """Drop the index entries of the rows of model matching where (before they are deleted or re-keyed)."""
+    index_table = TABLES[MODEL_KINDS[model]]
+    rowids = select(model.id * STRIDE + CODES[model]).where(where)
+    db.session.execute(delete(index_table).where(index_table.c.rowid.in_(rowids)))
+
+
+def rebuild():
+    """Rewrite every index table in the current transaction; returns the number of documents."""
+    for index_table in TABLES.values():
+        db.session.execute(delete(index_table))
+    return sum(index(model) for model in CODES)
+
+
+def _changed(obj):
+    _, title, body = KINDS[MODEL_KINDS[type(obj)]]
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in title + body)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _after_flush(session, flush_context):
+    changed, gone = {}, {}
+    for obj in list(session.new) + list(session.dirty):
+        if type(obj) in CODES and (obj in session.new or _changed(obj)):
+            changed.setdefault(type(obj), []).append(obj)
+    for obj in session.deleted:
+        if type(obj) in CODES:
+            gone.setdefault(MODEL_KINDS[type(obj)], []).append(obj.id * STRIDE + CODES[type(obj)])
+    if not changed and not gone:
+        return
+    conn = session.connection()
+    for kind, rowids in gone.items():
+        conn.execute(delete(TABLES[kind]).where(TABLES[kind].c.rowid.in_(rowids)))
+    for model, objs in changed.items():
+        _write(conn, model, objs)
+
+
+def _matches(phrases, kind, limit):
+    """Statement for the rowids of one kind matching every phrase, best first."""
+    dialect = db.session.get_bind().dialect.name
+    name = TABLES[kind].name
+    params = {'limit': limit}
+    if dialect == 'sqlite':
+        params['q'] = ' '.join('"%s"*' % ' '.join(phrase) for phrase in phrases)
+        # FTS5's rank column, with the title weighted over the body
+        sql = (f"SELECT rowid FROM {name} WHERE {name} MATCH :q AND rank MATCH 'bm25(10.0, 1.0)' "
+               'ORDER BY rank, rowid DESC LIMIT :limit')
+    elif dialect == 'postgresql':
+        params['q'] = ' & '.join(' <-> '.join(f"'{token}'" for token in phrase) + ':*' for phrase in phrases)
+        sql = (f"SELECT rowid FROM {name}, to_tsquery('simple', :q) query WHERE document @@ query "
+               'ORDER BY ts_rank(document, query) DESC, rowid DESC LIMIT :limit')
+    else:
+        likes = []
+        for i, phrase in enumerate(phrases):
+            params[f'p{i}'] = '%' + ' '.join(phrase) + '%'
+            likes.append(f'(title LIKE :p{i} OR body LIKE :p{i})')
+        sql = f'SELECT rowid FROM {name} WHERE {" AND ".join(likes)} ORDER BY rowid DESC LIMIT :limit'
+    # A TextualSelect, so @read_only views run it on the read-only engine
+    return text(sql).bindparams(**params).columns(column('rowid'))
+
+
+def _load(rowids):
+    """Indexed rows for the given rowids, in the order given."""
+    wanted = {}
+    for rowid in rowids:
+        wanted.setdefault(MODELS[rowid % STRIDE], []).append(rowid // STRIDE)
+    found = {}
+    for model, ids in wanted.items():
+        query = model.query.filter(model.id.in_(ids))
+        if MODEL_KINDS[model] == 'transaction':
+            query = query.options(joinedload(model.user), joinedload(model.project))
+        found.update((row.id * STRIDE + CODES[model], row) for row in query)
+    return [found[rowid] for rowid in rowids if rowid in found]
+
+
+def search(query, kinds=None, limit=10):
+    """Ranked matches for a search box query; Results.hits maps kind to rows, Results.more to a bool."""
+    phrases = terms(query)
+    hits, more = {}, {}
+    if not phrases:
+        return Results(query, hits, more)
+    for kind in kinds or KINDS:
+        rowids = db.session.execute(_matches(phrases, kind, limit + 1)).scalars().all()
+        more[kind] = len(rowids) > limit
+        hits[kind] = _load(rowids[:limit])
+    return Results(query, hits, more)
@@ -0,0 +1,157 @@
+from collections import namedtuple
+from datetime import timedelta
+from sqlalchemy import bindparam, insert, update, delete
+from models import db, WeeklySlot, Transaction
+import arrears
+import search
+
+# Weekly dues slots of a semester.
+#
+# plan_weeks() is the calendar: 7-day weeks from the start date, the last one
+# cut at the end date. When a semester's dates change, regenerate() matches
+# each planned week to the existing slot it overlaps most (the nearer start
+# breaks ties), so a payment stays on the calendar week it was made for even
+# when the start moves by a few days: matched weeks are updated in place
+# (their ids, and so every payment link, survive; a week that moved in the
+# order is renumbered, along with its dues' "Week N Dues" text), weeks that
+# overlap no slot are bulk-inserted and slots left over are deleted. Dues on a deleted week move to that
+# member's earliest week without a pending or approved payment, or to the last
+# week if every week is covered. The rewritten descriptions are reindexed for
+# search (bulk updates skip its ORM hook). Nothing is committed here; the route
+# commits once, after all reads are done.
+
+RegenerateResult = namedtuple('RegenerateResult', 'updated added removed remapped')
+
+_COVERING = ('pending', 'approved')
+
+
+def plan_weeks(start, end):
+    """[(week_number, start_date, end_date)] covering start..end."""
+    weeks = []
+    current = start
+    while current < end:
+        week_end = min(current + timedelta(days=6), end)
+        weeks.append((len(weeks) + 1, current, week_end))
+        current = week_end + timedelta(days=1)
+    return weeks
+
+
+def _dues_description(week_number):
+    return f'Week {week_number} Dues'
+
+
+def create(semester_id, start, end):
+    """Bulk-insert the slots of a new semester; returns how many."""
+    values = [{'semester_id': semester_id, 'week_number': number, 'start_date': first, 'end_date': last}
+              for number, first, last in plan_weeks(start, end)]
+    if values:
+        db.session.execute(insert(WeeklySlot), values)
+        arrears.refresh_semester(semester_id)
+    return len(values)
+
+
+def regenerate(semester):
+    """Bring semester's slots in line with its dates; returns RegenerateResult.
+
+    Raises ValueError if the new dates leave no week to move payments to.
+    """
+    planned = plan_weeks(semester.start_date, semester.end_date)
+    if not planned:
+        raise ValueError('A semester needs at least one week')
+    existing = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(
+        WeeklySlot.week_number, WeeklySlot.id).all()
+    matches = _match(planned, existing)
+
+    changed, added, renumbered = [], [], []
+    for number, first, last in planned:
+        slot = matches.get(number)
+        if slot is None:
+            added.append({'semester_id': semester.id, 'week_number': number, 'start_date': first, 'end_date': last})
+            continue
+        if (slot.week_number, slot.start_date, slot.end_date) != (number, first, last):
+            changed.append({'id': slot.id, 'week_number': number, 'start_date': first, 'end_date': last})
+        if slot.week_number != number:
+            renumbered.append({'slot_id': slot.id, 'old': _dues_description(slot.week_number),
+                               'new': _dues_description(number)})
+    kept = {slot.id for slot in matches.values()}
+    # Slots left over, including duplicates of a matched week, are folded away
+    removed = [slot for slot in existing if slot.id not in kept]
+
+    # Writes
+    if changed:
+        db.session.execute(update(WeeklySlot), changed)
+    if renumbered:
+        dues = Transaction.__table__.c
+        db.session.execute(update(Transaction.__table__).where(
+            dues.weekly_slot_id == bindparam('slot_id'),
+            dues.type == 'income_dues',
+            dues.description == bindparam('old'),
+        ).values(description=bindparam('new')), renumbered)
+    if added:
+        db.session.execute(insert(WeeklySlot), added)
+    moved = []
+    if removed:
+        db.session.flush()
+        moved = _remap_dues(semester.id, [slot.id for slot in removed])
+        db.session.execute(delete(WeeklySlot).where(WeeklySlot.id.in_([slot.id for slot in removed])))
+    if renumbered or moved:
+        search.index(Transaction, db.or_(Transaction.id.in_(moved), db.and_(
+            Transaction.weekly_slot_id.in_([row['slot_id'] for row in renumbered]),
+            Transaction.type == 'income_dues')))
+    # The ORM objects loaded above no longer match the table
+    db.session.expire_all()
+    if changed or added or removed:
+        arrears.refresh_semester(semester.id)
+    return RegenerateResult(len(changed), len(added), len(removed), len(moved))
+
+
+def _match(planned, existing):
+    """{week_number: existing slot} pairing each planned week with the slot it overlaps most.
+
+    Pairs are taken greedily, most shared days first, then the nearer start
+    and the earlier week; every slot serves one week at most.
+    """
+    pairs = []
+    for number, first, last in planned:
+        for slot in existing:
+            shared = (min(last, slot.end_date) - max(first, slot.start_date)).days + 1
+            if shared > 0:
+                pairs.append((-shared, abs((slot.start_date - first).days), number, slot.week_number, slot.id, slot))
+    matches, used = {}, set()
+    for _, _, number, _, slot_id, slot in sorted(pairs, key=lambda pair: pair[:5]):
+        if number not in matches and slot_id not in used:
+            matches[number] = slot
+            used.add(slot_id)
+    return matches
+
+
+def _remap_dues(semester_id, removed_ids):
+    """Point dues on removed slots at kept weeks; returns the ids of the moved transactions."""
+    removed_week = dict(db.session.query(WeeklySlot.id, WeeklySlot.week_number).filter(WeeklySlot.id.in_(removed_ids)))
+    orphans = db.session.query(
+        Transaction.id, Transaction.user_id, Transaction.status, Transaction.weekly_slot_id,
+    ).filter(Transaction.semester_id == semester_id, Transaction.weekly_slot_id.in_(removed_ids)).all()
+    if not orphans:
+        return []
+    orphans.sort(key=lambda row: (removed_week[row.weekly_slot_id], row.id))
+
+    kept = db.session.query(WeeklySlot.id, WeeklySlot.week_number).filter(
+        WeeklySlot.semester_id == semester_id, WeeklySlot.id.notin_(removed_ids),
+    ).order_by(WeeklySlot.week_number).all()
+    user_ids = {row.user_id for row in orphans}
+    covered = set(db.session.query(Transaction.user_id, Transaction.weekly_slot_id).filter(
+        Transaction.semester_id == semester_id,
+        Transaction.type == 'income_dues',
+        Transaction.status.in_(_COVERING),
+        Transaction.user_id.in_(user_ids),
+        Transaction.weekly_slot_id.notin_(removed_ids),
+    ))
+
+    moves = []
+    for row in orphans:
+        target = next((slot for slot in kept if (row.user_id, slot.id) not in covered), kept[-1])
+        if row.status in _COVERING:
+            covered.add((row.user_id, target.id))
+        moves.append({'id': row.id, 'weekly_slot_id': target.id, 'description': _dues_description(target.week_number)})
+    db.session.execute(update(Transaction), moves)
+    return [move['id'] for move in moves]
@@ -0,0 +1,64 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its configuration from the environment at import time, so the
+# test database has to be chosen before the first `import app`.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_TMP = tempfile.mkdtemp(prefix='ghuroba-tests-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_TMP, 'test.db')
+os.environ.setdefault('SECRET_KEY', 'test')
+os.environ['METRICS_DIR'] = os.path.join(_TMP, 'metrics')
+# Cheap hashes: the tests are not about password strength
+os.environ.setdefault('SCRYPT_COST', 'scrypt:1024:8:1')
+sys.path.insert(0, ROOT)
+
+import app as appmod  # noqa: E402
+from models import db  # noqa: E402
+import search  # noqa: E402
+import refdata  # noqa: E402
+from cache import fragments  # noqa: E402
+
+ADMIN_PASSWORD = 'admin123'
+# SOI, a JFIF header and the start of a scan: enough structure for uploads.strip_jpeg
+JPEG = b'\xff\xd8\xff\xe0\x00\x10JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00\xff\xda' + b'0' * 100
+
+
+@pytest.fixture(scope='session')
+def app():
+    appmod.app.config.update(TESTING=True, UPLOAD_FOLDER=os.path.join(_TMP, 'uploads'))
+    appmod.bootstrap_database(echo=lambda *a: None)
+    return appmod.app
+
+
+@pytest.fixture(autouse=True)
+def clean_db(app):
+    """Empty every table after each test, keeping the schema and the admin."""
+    yield
+    with app.app_context():
+        db.session.remove()
+        for table in reversed(db.metadata.sorted_tables):
+            if table.name not in ('schema_version', 'user'):
+                db.session.execute(table.delete())
+        db.session.execute(db.text("DELETE FROM user WHERE username != 'admin'"))
+        for index_table in search.TABLES.values():
+            db.session.execute(index_table.delete())
+        db.session.commit()
+    # Data-version stamps start over with the emptied table; so must the caches keyed by them
+    refdata._cache.clear()
+    fragments.invalidate()
+
+
+@pytest.fixture
+def ctx(app):
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def admin(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': ADMIN_PASSWORD})
+    return client
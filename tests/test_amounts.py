@@ -0,0 +1,21 @@
+import io
+
+from models import Transaction
+from conftest import JPEG
+
+
+def test_pay_dues_with_an_invalid_amount_is_rejected(app, admin, ctx):
+    for amount in ('', 'ten'):
+        response = admin.post('/pay_dues/1', data={'amount': amount, 'slip': (io.BytesIO(JPEG), 'slip.jpg')},
+                              content_type='multipart/form-data')
+        assert response.status_code == 302
+    assert Transaction.query.count() == 0
+
+
+def test_treasury_entry_with_an_invalid_amount_is_rejected(app, admin, ctx):
+    response = admin.post('/admin/treasury', data={'type': 'expense', 'amount': '', 'description': 'Rice'},
+                          follow_redirects=True)
+
+    assert response.status_code == 200
+    assert b'Invalid amount' in response.data
+    assert Transaction.query.count() == 0
@@ -0,0 +1,45 @@
+import pytest
+
+from models import db, Transaction
+import approvals
+import ledger
+
+
+def _pending():
+    txn = Transaction(type='income_dues', amount_minor=1000, status='pending')
+    db.session.add(txn)
+    ledger.record(txn)
+    db.session.commit()
+    return txn.id
+
+
+def test_review_rejects_a_bare_string_of_ids(app, ctx):
+    with pytest.raises(ValueError):
+        approvals.review('12', 'approve')
+
+
+def test_api_answers_400_for_string_ids(app, admin, ctx):
+    txn_id = _pending()
+
+    response = admin.post('/admin/api/approvals', json={'ids': str(txn_id), 'action': 'approve'})
+
+    assert response.status_code == 400
+    assert db.session.get(Transaction, txn_id).status == 'pending'
+
+
+def test_bulk_submit_without_an_action_approves_nothing(app, admin, ctx):
+    txn_id = _pending()
+
+    admin.post('/admin/approvals', data={'txn_ids': [str(txn_id)], 'reason': 'blurry'})
+
+    db.session.remove()
+    assert db.session.get(Transaction, txn_id).status == 'pending'
+
+
+def test_enter_in_the_reason_field_submits_reject(app, admin, ctx):
+    _pending()
+
+    html = admin.get('/admin/approvals').get_data(as_text=True)
+    form = html[html.index('id="reviewForm"'):]
+
+    assert form.index('type="submit"') == form.index('type="submit" name="action" value="reject"')
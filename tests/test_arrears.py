@@ -0,0 +1,79 @@
+from datetime import date, timedelta
+
+from models import db, User, Semester, WeeklySlot, Transaction
+import arrears
+import slots
+
+
+def _semester(name, start, end):
+    semester = Semester(name=name, start_date=start, end_date=end)
+    db.session.add(semester)
+    db.session.flush()
+    slots.create(semester.id, semester.start_date, semester.end_date)
+    return semester
+
+
+def _member():
+    member = User(username='m1', password='x', real_name='M', department='D', role='member')
+    db.session.add(member)
+    db.session.flush()
+    arrears.add_members([member.id])
+    return member
+
+
+def _pay(member, slot, status='pending'):
+    txn = Transaction(type='income_dues', amount_minor=1000, user_id=member.id, weekly_slot_id=slot.id,
+                      semester_id=slot.semester_id, status=status)
+    db.session.add(txn)
+    arrears.record(txn)
+    return txn
+
+
+def _row(user_id, semester_id=arrears.ALL_SEMESTERS):
+    # The counters move with Core UPDATEs, behind the identity map's back
+    db.session.expire_all()
+    return arrears.position(user_id, semester_id)
+
+
+def test_weeks_are_owed_once_they_have_started(ctx):
+    today = date.today()
+    member = _member()
+    semester = _semester('S', today - timedelta(days=14), today + timedelta(days=20))
+    arrears.rebuild(today)
+    week = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number).all()
+
+    # Weeks 1-3 have started; paying ahead for week 5 does not touch them
+    _pay(member, week[4])
+    row = _row(member.id, semester.id)
+    assert (row.weeks, row.owed_weeks, row.pending_weeks) == (5, 3, 1)
+
+    assert arrears.catch_up(semester.end_date) == [semester.id]
+    assert arrears.counted_until() == semester.end_date
+    assert _row(member.id).owed_weeks == 4
+    # Week 4 started since: owed now, and no longer when it is paid
+    _pay(member, week[3])
+    assert _row(member.id).owed_weeks == 3
+    assert arrears.catch_up(semester.end_date) == []
+    assert arrears.check() == []
+
+
+def test_refreshing_a_semester_moves_the_totals_by_its_difference(ctx):
+    today = date.today()
+    member = _member()
+    first = _semester('A', today - timedelta(days=60), today - timedelta(days=40))
+    second = _semester('B', today - timedelta(days=20), today - timedelta(days=1))
+    arrears.rebuild(today)
+    _pay(member, WeeklySlot.query.filter_by(semester_id=first.id).first(), status='approved')
+    db.session.commit()
+    before = _row(member.id, first.id).owed_weeks
+
+    second.end_date = today - timedelta(days=10)
+    slots.regenerate(second)
+    assert _row(member.id, first.id).owed_weeks == before
+    assert _row(member.id).owed_weeks == before + _row(member.id, second.id).owed_weeks
+    assert arrears.check() == []
+
+    arrears.remove_semester(first.id)
+    assert _row(member.id, first.id) is None
+    assert _row(member.id).owed_weeks == _row(member.id, second.id).owed_weeks
+    assert _row(member.id).paid_minor == 0
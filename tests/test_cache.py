@@ -0,0 +1,75 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+from cache import FragmentCache, fragments
+from models import Activity
+
+
+def _race(cache, render, threads=8):
+    """Call get_or_render from several threads at once; [(value, error)] in thread order."""
+    outcomes = [None] * threads
+
+    def call(i):
+        try:
+            outcomes[i] = (cache.get_or_render(('news', 'TH', 1, None), render), None)
+        except Exception as error:
+            outcomes[i] = (None, error)
+
+    workers = [threading.Thread(target=call, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=5)
+    return outcomes
+
+
+def _slow(result, calls):
+    def render():
+        calls.append(1)
+        time.sleep(0.2)  # long enough for every thread to queue up behind the first
+        if isinstance(result, Exception):
+            raise result
+        return result
+    return render
+
+
+def test_concurrent_misses_share_one_render():
+    cache, calls = FragmentCache(), []
+
+    outcomes = _race(cache, _slow('<ul></ul>', calls))
+
+    assert calls == [1]
+    assert outcomes == [('<ul></ul>', None)] * 8
+
+
+def test_a_failed_render_fails_every_waiter_once_and_is_not_cached():
+    cache, calls = FragmentCache(), []
+
+    outcomes = _race(cache, _slow(RuntimeError('template error'), calls))
+
+    assert calls == [1]
+    assert all(value is None and str(error) == 'template error' for value, error in outcomes)
+    # The failure is not remembered: the next miss renders again
+    assert cache.get_or_render(('news', 'TH', 1, None), lambda: '<ul></ul>') == '<ul></ul>'
+
+
+def test_home_sections_are_rendered_again_after_news_and_event_writes(app, admin):
+    visitor = app.test_client()
+    assert 'Fresh news' not in visitor.get('/').get_data(as_text=True)
+    assert any(key[0] == 'news' for key in fragments._entries)
+
+    admin.post('/admin/news', data={'title': 'Fresh news', 'content': 'Body'})
+    assert not any(key[0] == 'news' for key in fragments._entries)
+    assert 'Fresh news' in visitor.get('/').get_data(as_text=True)
+
+    start = datetime.utcnow() + timedelta(days=1)
+    admin.post('/admin/events', data={'create': '1', 'title': 'Iftar dinner', 'description': '', 'location': 'Hall',
+                                      'start_date': start.strftime('%Y-%m-%dT%H:%M'),
+                                      'end_date': (start + timedelta(hours=2)).strftime('%Y-%m-%dT%H:%M')})
+    assert 'Iftar dinner' in visitor.get('/').get_data(as_text=True)
+
+    with app.app_context():
+        event_id = Activity.query.filter_by(title='Iftar dinner').one().id
+    admin.post('/admin/events/delete', data={'event_id': event_id})
+    assert 'Iftar dinner' not in visitor.get('/').get_data(as_text=True)
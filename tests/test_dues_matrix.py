@@ -0,0 +1,24 @@
+from datetime import date, timedelta
+from models import db, User, Semester, WeeklySlot, Transaction
+from dues_matrix import DuesMatrix
+import slots
+
+
+def test_arrears_only_counts_weeks_that_have_started(ctx):
+    today = date.today()
+    member = User(username='m1', password='x', real_name='M', department='D', role='member')
+    semester = Semester(name='S', start_date=today - timedelta(days=14), end_date=today + timedelta(days=20))
+    db.session.add_all([member, semester])
+    db.session.flush()
+    slots.create(semester.id, semester.start_date, semester.end_date)
+    first = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number).first()
+    db.session.add(Transaction(type='income_dues', amount_minor=1000, user_id=member.id, weekly_slot_id=first.id,
+                               semester_id=semester.id, status='pending'))
+    db.session.commit()
+
+    matrix, _ = DuesMatrix.for_member(semester.id, member.id)
+    assert len(matrix.slots) == 5
+    # Weeks 1-3 have started; week 1 has a pending slip
+    assert matrix.due_weeks() == 3
+    assert matrix.arrears(member.id) == 2
+    assert matrix.arrears(member.id, as_of=semester.end_date) == 4
@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+from models import Activity
+
+
+def _create(admin, title, days, description='', location='Hall'):
+    start = (datetime.utcnow() + timedelta(days=days)).replace(second=0, microsecond=0)
+    admin.post('/admin/events', data={'create': '1', 'title': title, 'description': description, 'location': location,
+                                      'start_date': start.strftime('%Y-%m-%dT%H:%M'),
+                                      'end_date': (start + timedelta(hours=2)).strftime('%Y-%m-%dT%H:%M')})
+    return Activity.query.filter_by(title=title).one().id
+
+
+def test_since_returns_only_changes_and_deletions_after_the_last_poll(app, ctx, admin):
+    visitor = app.test_client()
+    kept = _create(admin, 'Study circle', 2)
+    dropped = _create(admin, 'Picnic', 3)
+    _create(admin, 'Far future camp', 800)
+
+    full = visitor.get('/api/events').get_json()
+    # The default window ends a year ahead
+    assert [event['id'] for event in full['events']] == [kept, dropped]
+
+    admin.post('/admin/events/delete', data={'event_id': dropped})
+    added = _create(admin, 'Iftar dinner', 5)
+    changes = visitor.get('/api/events', query_string={'since': full['now']}).get_json()
+
+    assert [event['id'] for event in changes['events']] == [added]
+    assert changes['deleted'] == [dropped]
+    quiet = visitor.get('/api/events', query_string={'since': changes['now']}).get_json()
+    assert (quiet['events'], quiet['deleted']) == ([], [])
+    assert [event['id'] for event in visitor.get('/api/events').get_json()['events']] == [kept, added]
+
+
+def test_ics_lists_the_window_with_escaped_and_folded_lines(app, ctx, admin):
+    event_id = _create(admin, 'Meeting, then dinner', 2, description='ประชุมประจำเดือน ' * 6, location='Room 3; Hall')
+    _create(admin, 'Far future camp', 800)
+
+    response = app.test_client().get('/api/events.ics')
+    body = response.get_data(as_text=True)
+
+    assert response.mimetype == 'text/calendar'
+    assert body.startswith('BEGIN:VCALENDAR\r\n') and body.endswith('END:VCALENDAR\r\n')
+    assert body.count('BEGIN:VEVENT') == 1
+    assert f'UID:activity-{event_id}@localhost' in body
+    assert 'SUMMARY:Meeting\\, then dinner' in body and 'LOCATION:Room 3\\; Hall' in body
+    lines = body.split('\r\n')
+    assert all(len(line.encode('utf-8')) <= 75 for line in lines)
+    # Unfolding (dropping CRLF + space) gives back the whole Thai description
+    assert 'DESCRIPTION:' + 'ประชุมประจำเดือน ' * 6 in body.replace('\r\n ', '')
@@ -0,0 +1,17 @@
+def test_home_revalidates_after_a_profile_change(app, admin):
+    etag = admin.get('/').headers['ETag'].strip('"')
+    assert admin.get('/', headers={'If-None-Match': etag}).status_code == 304
+
+    admin.post('/profile', data={'real_name': 'Treasurer'})
+    admin.get('/profile')  # consume the flash message
+
+    assert admin.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_anonymous_home_ignores_user_changes(app, admin):
+    anonymous = app.test_client()
+    etag = anonymous.get('/').headers['ETag'].strip('"')
+
+    admin.post('/profile', data={'real_name': 'Treasurer'})
+
+    assert anonymous.get('/', headers={'If-None-Match': etag}).status_code == 304
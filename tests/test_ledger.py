@@ -0,0 +1,20 @@
+from models import db, Project, Transaction
+import ledger
+
+
+def test_deleting_a_project_folds_its_balance_into_no_project(app, admin, ctx):
+    project = Project(name='Iftar')
+    db.session.add(project)
+    db.session.flush()
+    txn = Transaction(type='expense', amount_minor=5000, project_id=project.id, status='approved')
+    db.session.add(txn)
+    ledger.record(txn)
+    db.session.commit()
+    project_id = project.id
+
+    admin.post('/admin/project/delete', data={'project_id': project_id})
+
+    db.session.remove()
+    assert db.session.get(Project, project_id) is None
+    assert ledger.check() == []
+    assert ledger.totals() == (0, 5000)
@@ -0,0 +1,33 @@
+import json
+import os
+
+import metrics
+
+
+def test_metrics_is_only_served_to_allowed_addresses_or_the_token(app):
+    client = app.test_client()
+    remote = {'REMOTE_ADDR': '203.0.113.7'}
+    assert client.get('/metrics').status_code == 200
+    assert client.get('/metrics', environ_base=remote).status_code == 403
+
+    app.config['METRICS_TOKEN'] = 'secret'
+    try:
+        assert client.get('/metrics', environ_base=remote,
+                          headers={'Authorization': 'Bearer wrong'}).status_code == 403
+        assert client.get('/metrics', environ_base=remote,
+                          headers={'Authorization': 'Bearer secret'}).status_code == 200
+    finally:
+        app.config['METRICS_TOKEN'] = None
+
+
+def test_a_dead_workers_counters_are_folded_into_exited(tmp_path):
+    stats = {'buckets': [1] * len(metrics.BUCKETS), 'count': 1, 'sum': 0.5,
+             'sql_count': 3, 'sql_seconds': 0.1, 'slow_queries': 0}
+    for name in ('4242_aaaa.json', '4242_bbbb.json', '77_cccc.json'):
+        (tmp_path / name).write_text(json.dumps({'home': stats}))
+
+    metrics.mark_process_dead(4242, str(tmp_path))
+    metrics.mark_process_dead(4242, str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path)) == ['77_cccc.json', 'exited.json']
+    assert json.loads((tmp_path / 'exited.json').read_text())['home']['sql_count'] == 6
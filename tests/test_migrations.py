@@ -0,0 +1,93 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The schema as the app created it before the migration runner: float amounts,
+# and a transaction table from before the v3.5 status and semester_id columns
+BASELINE = """
+CREATE TABLE user (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR(150) NOT NULL UNIQUE,
+    password VARCHAR(150) NOT NULL, real_name VARCHAR(150) NOT NULL, department VARCHAR(150) NOT NULL,
+    role VARCHAR(50));
+CREATE TABLE semester (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(150) NOT NULL, start_date DATE NOT NULL,
+    end_date DATE NOT NULL, is_active BOOLEAN);
+CREATE TABLE weekly_slot (id INTEGER NOT NULL PRIMARY KEY, semester_id INTEGER NOT NULL REFERENCES semester (id),
+    week_number INTEGER NOT NULL, start_date DATE NOT NULL, end_date DATE NOT NULL);
+CREATE TABLE project (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(150) NOT NULL, description TEXT,
+    status VARCHAR(20));
+CREATE TABLE announcement (id INTEGER NOT NULL PRIMARY KEY, title VARCHAR(200) NOT NULL, content TEXT NOT NULL,
+    image_filename VARCHAR(200), created_at DATETIME);
+CREATE TABLE "transaction" (id INTEGER NOT NULL PRIMARY KEY, type VARCHAR(50) NOT NULL, amount FLOAT NOT NULL,
+    description VARCHAR(255), date DATETIME, project_id INTEGER REFERENCES project (id),
+    user_id INTEGER REFERENCES user (id), slip_filename VARCHAR(200),
+    weekly_slot_id INTEGER REFERENCES weekly_slot (id));
+CREATE TABLE activity (id INTEGER NOT NULL PRIMARY KEY, title VARCHAR(200) NOT NULL, description TEXT,
+    start_date DATETIME NOT NULL, end_date DATETIME NOT NULL, location VARCHAR(200), created_at DATETIME);
+
+INSERT INTO user VALUES (1, 'admin', 'x', 'Administrator', 'Admin', 'admin');
+INSERT INTO user VALUES (2, 'somchai', 'x', 'สมชาย ใจดี', 'Engineering', 'member');
+INSERT INTO semester VALUES (1, 'Old term', '2020-01-06', '2020-01-19', 0);
+INSERT INTO semester VALUES (2, 'This term', '2020-06-01', '2020-06-14', 1);
+INSERT INTO weekly_slot VALUES (1, 1, 1, '2020-01-06', '2020-01-12');
+INSERT INTO weekly_slot VALUES (2, 1, 2, '2020-01-13', '2020-01-19');
+INSERT INTO weekly_slot VALUES (3, 2, 1, '2020-06-01', '2020-06-07');
+INSERT INTO weekly_slot VALUES (4, 2, 2, '2020-06-08', '2020-06-14');
+INSERT INTO project VALUES (1, 'Iftar', NULL, 'Active');
+INSERT INTO "transaction" VALUES (1, 'income_dues', 20.1, 'Week 1 Dues', '2020-01-07', NULL, 2, NULL, 1);
+INSERT INTO "transaction" VALUES (2, 'income_donation', 1000.35, 'ทุนการศึกษา', '2020-06-02', 1, NULL, NULL, NULL);
+INSERT INTO "transaction" VALUES (3, 'expense', 1.15, 'Stamps', '2020-06-03', 1, NULL, NULL, NULL);
+INSERT INTO "transaction" VALUES (4, 'expense', 45.99, 'Snacks', '2020-06-04', NULL, NULL, NULL, NULL);
+INSERT INTO announcement VALUES (1, 'Welcome', 'First meeting', NULL, '2020-01-01');
+INSERT INTO activity VALUES (1, 'Meeting', NULL, '2020-06-05 18:00', '2020-06-05 20:00', 'Hall', '2020-05-01');
+"""
+
+# Run against the upgraded database by a fresh interpreter, like the app after a deploy
+INSPECT = """
+import json
+from app import app
+from models import Transaction, MemberArrears
+import arrears, ledger, search
+with app.app_context():
+    print(json.dumps({
+        'transactions': [[t.id, t.amount_minor, t.status, t.semester_id]
+                         for t in Transaction.query.order_by(Transaction.id)],
+        'totals': ledger.totals(),
+        'ledger_check': ledger.check(),
+        'arrears_check': arrears.check(),
+        'owed': [[a.semester_id, a.owed_weeks, a.paid_minor]
+                 for a in MemberArrears.query.filter_by(user_id=2).order_by(MemberArrears.semester_id)],
+        'search': [hit.id for hit in search.search('ทุน').hits.get('transaction', [])],
+    }))
+"""
+
+
+def _run(db_path, *args):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + str(db_path), FLASK_APP='app')
+    return subprocess.run(args, cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+
+
+def test_upgrade_from_the_baseline_schema_backfills_satang_and_semesters(tmp_path):
+    db_path = tmp_path / 'baseline.db'
+    with sqlite3.connect(db_path) as conn:
+        conn.executescript(BASELINE)
+
+    output = _run(db_path, sys.executable, '-m', 'flask', 'upgrade-db', '--batch-size', '2')
+    assert 'Applying 0001' in output and 'Applying 0012' in output
+    assert _run(db_path, sys.executable, '-m', 'flask', 'upgrade-db').strip() == 'Database is up to date'
+
+    with sqlite3.connect(db_path) as conn:
+        columns = {row[1] for row in conn.execute('PRAGMA table_info("transaction")')}
+    assert 'amount' not in columns
+
+    state = json.loads(_run(db_path, sys.executable, '-c', INSPECT))
+    # Floats become exact satang; dues take their slot's semester, the rest the active one
+    assert state['transactions'] == [[1, 2010, 'approved', 1], [2, 100035, 'approved', 2],
+                                     [3, 115, 'approved', 2], [4, 4599, 'approved', 2]]
+    assert state['totals'] == [102045, 4714]
+    assert state['ledger_check'] == [] and state['arrears_check'] == []
+    # Both terms are over: one week paid in the old term, two owed in the current one
+    assert state['owed'] == [[0, 3, 2010], [1, 1, 2010], [2, 2, 0]]
+    assert state['search'] == [2]
@@ -0,0 +1,72 @@
+from datetime import date, datetime, timedelta
+
+from models import db, Semester, Transaction, TransactionArchive
+from pagination import PAGE_SIZE, keyset_page, keyset_pages
+import refdata
+import versions
+
+
+def _add(dated, undated):
+    start = datetime(2026, 1, 1)
+    rows = [Transaction(type='donation', amount_minor=100, status='approved', date=start + timedelta(days=i))
+            for i in range(dated)]
+    rows += [Transaction(type='donation', amount_minor=100, status='approved') for _ in range(undated)]
+    db.session.add_all(rows)
+    db.session.flush()
+    # The model default fills date; clear it the way old rows have it
+    db.session.execute(db.update(Transaction).where(Transaction.id.in_([t.id for t in rows[dated:]])).values(date=None))
+    db.session.commit()
+    return [t.id for t in rows[:dated]], [t.id for t in rows[dated:]]
+
+
+def _walk(descending):
+    seen, cursor = [], None
+    while True:
+        page = keyset_page(Transaction.query, Transaction, cursor, descending=descending, per_page=2)
+        seen.append([t.id for t in page.items])
+        if not page.has_next:
+            return seen
+        cursor = page.next_cursor
+
+
+def test_undated_rows_are_listed_after_the_dated_ones_across_pages(app, ctx):
+    dated, undated = _add(3, 4)
+
+    assert _walk(descending=True) == [dated[:0:-1], [dated[0], undated[-1]], undated[-2:0:-1], [undated[0]]]
+    assert _walk(descending=False) == [dated[:2], [dated[2], undated[0]], undated[1:3], [undated[3]]]
+
+
+def test_treasury_page_ending_on_an_undated_row(app, admin, ctx):
+    _add(PAGE_SIZE - 1, 2)
+
+    response = admin.get('/admin/treasury')
+
+    assert response.status_code == 200
+    assert b'cursor=' in response.data
+
+
+def test_live_and_archived_rows_are_listed_together(app, admin, ctx):
+    # Archived rows keep their ids, which the live table may hand out again
+    when = datetime(2026, 3, 1)
+    live = Transaction(id=7, type='donation', amount_minor=100, status='approved', date=when)
+    archived = [TransactionArchive(id=i, type='donation', amount_minor=100, status='approved', date=when,
+                                   semester_id=1)
+                for i in (6, 7, 8)]
+    db.session.add_all([Semester(id=1, name='Old', start_date=date(2026, 1, 1), end_date=date(2026, 4, 1),
+                                 archived_at=datetime(2026, 4, 2), is_active=False), live] + archived)
+    db.session.commit()
+    refdata.changed(versions.REFDATA)
+    db.session.commit()
+    sources = [(Transaction.query, Transaction, Transaction.date),
+               (TransactionArchive.query, TransactionArchive, TransactionArchive.date)]
+
+    seen, cursor = [], None
+    while True:
+        page = keyset_pages(sources, cursor, descending=False, per_page=1)
+        seen += [(row.id, row.archived) for row in page.items]
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+
+    assert seen == [(6, True), (7, False), (7, True), (8, True)]
+    assert admin.get('/admin/treasury').get_data(as_text=True).count('badge bg-dark') == 3
@@ -0,0 +1,16 @@
+from werkzeug.security import generate_password_hash
+
+import passwords
+
+
+def test_rehash_compares_the_scrypt_parameters(app, ctx):
+    cost = app.config['SCRYPT_COST']
+    try:
+        app.config['SCRYPT_COST'] = 'scrypt'
+        assert not passwords.needs_rehash(generate_password_hash('pw', 'scrypt:32768:8:1'))
+        assert passwords.needs_rehash(generate_password_hash('pw', 'scrypt:1024:8:1'))
+        app.config['SCRYPT_COST'] = 'scrypt:1024:8:1'
+        assert not passwords.needs_rehash(generate_password_hash('pw', 'scrypt:1024:8:1'))
+        assert passwords.needs_rehash(generate_password_hash('pw', 'pbkdf2:sha256:1000'))
+    finally:
+        app.config['SCRYPT_COST'] = cost
@@ -0,0 +1,11 @@
+import query_plans
+
+
+def test_hot_route_queries_do_not_scan_large_tables(app, ctx):
+    assert query_plans.check_plans() == []
+
+
+def test_an_index_walk_counts_as_a_scan():
+    assert query_plans.full_scans(['SCAN transaction']) == ['transaction']
+    assert query_plans.full_scans(['SCAN announcement USING INDEX ix_announcement_created_at']) == ['announcement']
+    assert query_plans.full_scans(['SEARCH transaction USING INDEX ix_transaction_status_date (status=?)']) == []
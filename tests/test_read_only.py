@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import select, update
+
+from database import READONLY_BIND, ReadOnlyError, read_only
+from models import db, Announcement, User
+
+
+def _count():
+    return db.session.query(Announcement).count()
+
+
+def test_selects_in_a_read_only_view_use_the_query_only_engine(ctx):
+    @read_only
+    def view():
+        bind = db.session.get_bind(clause=select(User))
+        return bind, db.session.connection(bind_arguments={'bind': bind}).exec_driver_sql(
+            'PRAGMA query_only').scalar()
+
+    bind, query_only = view()
+    assert bind is db.engines[READONLY_BIND]
+    assert query_only == 1
+    # Outside the view everything goes to the primary again
+    assert db.session.get_bind(clause=select(User)) is db.engine
+
+
+def test_an_orm_write_in_a_read_only_view_fails(ctx):
+    @read_only
+    def view():
+        db.session.add(Announcement(title='Sneaky', content='write'))
+        db.session.commit()
+
+    with pytest.raises(ReadOnlyError):
+        view()
+    db.session.rollback()
+    assert _count() == 0
+
+
+def test_a_core_write_in_a_read_only_view_fails(ctx):
+    @read_only
+    def view():
+        db.session.execute(update(User).values(real_name='Sneaky'))
+
+    with pytest.raises(ReadOnlyError):
+        view()
+    db.session.rollback()
+    assert db.session.query(User).filter_by(real_name='Sneaky').count() == 0
+
+
+def test_every_read_only_page_renders_without_writing(app, admin):
+    admin.post('/admin/news', data={'title': 'Fresh news', 'content': 'Body'})
+
+    for url in ('/', '/news/older', '/api/events', '/api/events.ics', '/transparency', '/admin/arrears',
+                '/admin/search?q=news'):
+        assert admin.get(url).status_code == 200, url
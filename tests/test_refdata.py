@@ -0,0 +1,63 @@
+from datetime import date, timedelta
+
+from models import Project, Semester, User
+
+# Every request runs in its own app context here, as on a server, so each one
+# reads the data-version stamps afresh and only a bumped stamp reloads the cache.
+
+
+def _page(client, url):
+    return client.get(url).get_data(as_text=True)
+
+
+def _id(app, model, **filters):
+    with app.app_context():
+        return model.query.filter_by(**filters).one().id
+
+
+def test_a_profile_change_replaces_the_cached_current_user(app, admin):
+    assert 'value="Bursar"' not in _page(admin, '/profile')
+
+    admin.post('/profile', data={'real_name': 'Bursar'})
+
+    assert 'value="Bursar"' in _page(admin, '/profile')
+
+
+def test_project_writes_reach_the_cached_dropdown(app, admin):
+    assert 'Iftar fund' not in _page(admin, '/admin/treasury')
+
+    admin.post('/admin/projects', data={'create': '1', 'name': 'Iftar fund', 'description': ''})
+    assert 'Iftar fund' in _page(admin, '/admin/treasury')
+
+    project_id = _id(app, Project, name='Iftar fund')
+    admin.post('/admin/projects', data={'update_status': '1', 'project_id': project_id, 'status': 'Cancelled'})
+    # Cancelled projects are hidden from the selection menus
+    assert 'Iftar fund' not in _page(admin, '/admin/treasury')
+
+
+def test_semester_writes_reach_the_cached_semesters(app, admin):
+    start = date.today() - timedelta(days=7)
+    admin.get('/admin/api/tracker')
+    admin.post('/admin/semesters', data={'create': '1', 'name': '1/2569', 'start_date': start.isoformat(),
+                                         'end_date': (start + timedelta(days=27)).isoformat()})
+    assert admin.get('/admin/api/tracker').get_json()['semester']['name'] == '1/2569'
+
+    semester_id = _id(app, Semester, name='1/2569')
+    admin.post('/admin/semester/edit', data={'sem_id': semester_id, 'name': 'Term 1', 'start_date': start.isoformat(),
+                                             'end_date': (start + timedelta(days=27)).isoformat()})
+    assert 'Term 1' in _page(admin, '/admin/treasury')
+    assert admin.get('/admin/api/tracker').get_json()['semester']['name'] == 'Term 1'
+
+    admin.post('/admin/semesters', data={'toggle_status': '1', 'sem_id': semester_id})
+    assert admin.get('/admin/api/tracker').get_json()['semester'] is None
+
+
+def test_a_deleted_member_is_signed_out(app, admin):
+    member = app.test_client()
+    member.post('/register', data={'username': 'm1', 'password': 'pw123456', 'real_name': 'M',
+                                   'department': 'Eng'})
+    assert member.get('/dues').status_code == 200
+
+    admin.post('/admin/members', data={'user_id': _id(app, User, username='m1'), 'action': 'delete'})
+
+    assert member.get('/dues').status_code == 302
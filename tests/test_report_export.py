@@ -0,0 +1,67 @@
+import csv
+import io
+
+import pytest
+
+from models import db, Transaction
+import ledger
+import report_export
+
+
+def _ledger():
+    rows = [Transaction(type='income_dues', amount_minor=12050, description='Week 1 Dues', status='approved'),
+            Transaction(type='income_donation', amount_minor=100000, description='ทุนการศึกษา', status='approved'),
+            Transaction(type='expense', amount_minor=4599, description='Snacks', status='approved'),
+            Transaction(type='income_dues', amount_minor=5000, description='Rejected slip', status='rejected')]
+    db.session.add_all(rows)
+    db.session.flush()
+    for txn in rows:
+        ledger.record(txn)
+    db.session.commit()
+    return ledger.totals()
+
+
+def _amount(text):
+    return round(float(text.replace(',', '')) * 100) if text else 0
+
+
+def test_csv_export_lists_every_counted_row_and_the_ledger_totals(ctx, admin):
+    income, expense = _ledger()
+
+    response = admin.get('/admin/report/export.csv')
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True).lstrip('\ufeff'))))
+
+    assert rows[0] == report_export.HEADER
+    body = rows[1:rows.index([])]
+    assert len(body) == 3 and 'Rejected slip' not in {row[1] for row in body}
+    total, balance = rows[-2], rows[-1]
+    assert (_amount(total[4]), _amount(total[5])) == (income, expense)
+    assert _amount(balance[4]) == income - expense
+
+
+def test_xlsx_export_totals_match_the_ledger(ctx, admin):
+    openpyxl = pytest.importorskip('openpyxl')
+    income, expense = _ledger()
+
+    response = admin.get('/admin/report/export.xlsx')
+    sheet = openpyxl.load_workbook(io.BytesIO(response.get_data())).active
+    rows = [[cell.value for cell in row] for row in sheet.iter_rows()]
+
+    assert len([row for row in rows[1:] if row[3]]) == 3
+    total = next(row for row in rows if row[1] == 'Total')
+    assert (round(total[4] * 100), round(total[5] * 100)) == (income, expense)
+
+
+def test_xlsx_export_reads_no_row_before_it_is_iterated():
+    class Query:
+        read = False
+
+        def execution_options(self, **options):
+            Query.read = True
+            return iter(())
+
+    pytest.importorskip('openpyxl')
+    body = report_export.iter_xlsx(Query())
+    assert not Query.read
+    next(body)
+    assert Query.read
@@ -0,0 +1,76 @@
+from datetime import datetime
+
+from sqlalchemy import insert
+
+from models import db, User, Transaction, Announcement, Activity
+import search
+
+
+def test_an_old_strong_match_outranks_many_newer_weak_ones(ctx):
+    db.session.execute(insert(Transaction), [{'type': 'expense', 'amount_minor': 100, 'description': 'Refund'}] + [
+        {'type': 'expense', 'amount_minor': 100, 'description': f'Projector cable {i} and a refund of the deposit'}
+        for i in range(1100)
+    ])
+    search.index(Transaction)
+    db.session.commit()
+    oldest = db.session.query(db.func.min(Transaction.id)).scalar()
+
+    results = search.search('refund', kinds=['transaction'])
+    assert results.hits['transaction'][0].id == oldest
+    assert results.more['transaction']
+
+
+def _member(username, real_name, department):
+    member = User(username=username, password='x', real_name=real_name, department=department, role='member')
+    db.session.add(member)
+    db.session.commit()
+    return member
+
+
+def _names(query):
+    return [row.real_name for row in search.search(query, kinds=['member']).hits['member']]
+
+
+def test_thai_queries_match_any_substring_of_a_word(ctx):
+    _member('somchai', 'สมชาย ใจดี', 'วิศวกรรมศาสตร์')
+    _member('somsri', 'สมศรี มีสุข', 'Engineering')
+
+    assert _names('ชาย') == ['สมชาย ใจดี']
+    assert _names('ศวกร') == ['สมชาย ใจดี']
+    assert sorted(_names('สม')) == ['สมชาย ใจดี', 'สมศรี มีสุข']
+    # Bigrams must be adjacent: letters from two words, or a different tone mark, do not match
+    assert _names('สมใจ') == []
+    assert _names('ใจดิ') == []
+    # Every term must match; Latin terms match as prefixes, ignoring case
+    assert _names('สม ENG') == ['สมศรี มีสุข']
+
+
+def test_renames_and_deletes_update_the_index(ctx):
+    member = _member('somchai', 'สมชาย ใจดี', 'Eng')
+
+    member.real_name = 'สมหญิง ใจดี'
+    db.session.commit()
+    assert (_names('ชาย'), _names('หญิง')) == ([], ['สมหญิง ใจดี'])
+
+    db.session.delete(member)
+    db.session.commit()
+    assert _names('ใจดี') == []
+
+
+def test_the_kind_filter_searches_one_kind(ctx, admin):
+    _member('iftar', 'Iftar Volunteer', 'Eng')
+    db.session.add_all([Transaction(type='expense', amount_minor=100, description='Iftar dates'),
+                        Announcement(title='Iftar tonight', content='Hall 2'),
+                        Activity(title='Iftar dinner', start_date=datetime(2030, 3, 1, 18), end_date=datetime(2030, 3, 1, 20))])
+    db.session.commit()
+
+    everything = search.search('iftar')
+    assert {kind: len(rows) for kind, rows in everything.hits.items()} == dict.fromkeys(search.KINDS, 1)
+    only = search.search('iftar', kinds=['announcement'])
+    assert list(only.hits) == ['announcement'] and only.hits['announcement'][0].title == 'Iftar tonight'
+
+    page = admin.get('/admin/search', query_string={'q': 'iftar', 'kind': 'transaction'}).get_data(as_text=True)
+    assert 'Iftar dates' in page and 'Iftar tonight' not in page and 'Iftar Volunteer' not in page
+    # An unknown kind falls back to every kind
+    page = admin.get('/admin/search', query_string={'q': 'iftar', 'kind': 'bogus'}).get_data(as_text=True)
+    assert all(text in page for text in ('Iftar dates', 'Iftar tonight', 'Iftar Volunteer', 'Iftar dinner'))
@@ -0,0 +1,81 @@
+from datetime import date, timedelta
+
+import pytest
+
+from models import db, User, Semester, WeeklySlot, Transaction
+import search
+import slots
+
+
+def test_moving_the_start_keeps_payments_on_their_calendar_week(ctx):
+    member = User(username='m1', password='x', real_name='M', department='D', role='member')
+    semester = Semester(name='S', start_date=date(2026, 1, 5), end_date=date(2026, 2, 1))
+    db.session.add_all([member, semester])
+    db.session.flush()
+    slots.create(semester.id, semester.start_date, semester.end_date)
+    week1, week2 = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number).limit(2)
+    paid = [Transaction(type='income_dues', amount_minor=1000, user_id=member.id, weekly_slot_id=slot.id,
+                        semester_id=semester.id, status='approved', description=f'Week {slot.week_number} Dues')
+            for slot in (week1, week2)]
+    db.session.add_all(paid)
+    db.session.commit()
+    week2_id = week2.id
+
+    # Start a week later: the week of Jan 12 becomes week 1 and keeps its id
+    semester.start_date = date(2026, 1, 12)
+    result = slots.regenerate(semester)
+    db.session.commit()
+
+    kept = db.session.get(WeeklySlot, week2_id)
+    assert (kept.week_number, kept.start_date) == (1, date(2026, 1, 12))
+    assert db.session.get(Transaction, paid[1].id).weekly_slot_id == week2_id
+    assert db.session.get(Transaction, paid[1].id).description == 'Week 1 Dues'
+    # The payment for the dropped week moved to the member's first uncovered week
+    assert result.removed == 1 and result.remapped == 1
+    assert db.session.get(Transaction, paid[0].id).description == 'Week 2 Dues'
+    assert [t.id for t in search.search('Week 2', kinds=['transaction']).hits['transaction']] == [paid[0].id]
+
+
+def _four_weeks_paid_on_week_3():
+    member = User(username='m1', password='x', real_name='M', department='D', role='member')
+    semester = Semester(name='S', start_date=date(2026, 1, 5), end_date=date(2026, 2, 1))
+    db.session.add_all([member, semester])
+    db.session.flush()
+    slots.create(semester.id, semester.start_date, semester.end_date)
+    ids = [slot.id for slot in WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number)]
+    payment = Transaction(type='income_dues', amount_minor=1000, user_id=member.id, weekly_slot_id=ids[2],
+                          semester_id=semester.id, status='approved', description='Week 3 Dues')
+    db.session.add(payment)
+    db.session.commit()
+    return semester, ids, payment.id
+
+
+@pytest.mark.parametrize('start_days, end_days', [(1, 0), (3, 0), (-2, -2)])
+def test_dates_moved_by_a_few_days_update_every_week_in_place(ctx, start_days, end_days):
+    semester, ids, payment_id = _four_weeks_paid_on_week_3()
+
+    semester.start_date += timedelta(days=start_days)
+    semester.end_date += timedelta(days=end_days)
+    result = slots.regenerate(semester)
+    db.session.commit()
+
+    assert (result.added, result.removed, result.remapped) == (0, 0, 0)
+    weeks = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number).all()
+    assert [slot.id for slot in weeks] == ids
+    assert weeks[0].start_date == semester.start_date
+    payment = db.session.get(Transaction, payment_id)
+    assert (payment.weekly_slot_id, payment.description) == (ids[2], 'Week 3 Dues')
+
+
+def test_shortening_a_semester_only_removes_the_weeks_past_its_end(ctx):
+    semester, ids, payment_id = _four_weeks_paid_on_week_3()
+
+    semester.end_date = date(2026, 1, 20)
+    result = slots.regenerate(semester)
+    db.session.commit()
+
+    assert (result.updated, result.added, result.removed, result.remapped) == (1, 0, 1, 0)
+    weeks = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number).all()
+    assert [slot.id for slot in weeks] == ids[:3]
+    assert weeks[-1].end_date == date(2026, 1, 20)
+    assert db.session.get(Transaction, payment_id).weekly_slot_id == ids[2]
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import the app the way gunicorn --preload does and count database connections
+IMPORT = """
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+connects = []
+event.listen(Pool, 'connect', lambda *args: connects.append(1))
+import app
+app.create_app()
+print(len(connects))
+"""
+
+
+def _run(tmp_path, *args):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + str(tmp_path / 'app.db'), FLASK_APP='app',
+               JINJA_CACHE_DIR=str(tmp_path / 'jinja'))
+    return subprocess.run(args, cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+
+
+def test_importing_the_app_does_not_touch_the_database(tmp_path):
+    assert _run(tmp_path, sys.executable, '-c', IMPORT).strip() == '0'
+    assert not (tmp_path / 'app.db').exists()
+
+
+def test_bootstrap_creates_the_schema_and_admin_once(tmp_path):
+    first = _run(tmp_path, sys.executable, '-m', 'flask', 'bootstrap')
+    assert 'Applying 0001' in first and 'Created admin user' in first
+
+    assert _run(tmp_path, sys.executable, '-m', 'flask', 'bootstrap').strip() == 'Database is up to date'
+
+
+def test_precompile_fills_the_bytecode_cache_for_every_template(tmp_path):
+    output = _run(tmp_path, sys.executable, '-m', 'flask', 'precompile-templates')
+
+    templates = sum(len([name for name in files if name.endswith('.html')])
+                    for _, _, files in os.walk(os.path.join(ROOT, 'templates')))
+    assert f'Compiled {templates} templates' in output
+    assert len(os.listdir(tmp_path / 'jinja')) == templates
@@ -0,0 +1,76 @@
+from datetime import date, timedelta
+
+from models import db, User, Semester, WeeklySlot, Transaction
+import passwords
+import slots
+
+# Five weeks, of which weeks 1-3 have started; one string per member, one letter per week:
+# a(pproved), p(ending), r(ejected), . (nothing)
+MEMBERS = [('m1', 'Eng', 'aaa..'), ('m2', 'Eng', 'par..'), ('m3', 'Sci', '.....'),
+           ('m4', 'Sci', '....a'), ('m5', 'Eng', 'ppp..')]
+STATUSES = {'a': 'approved', 'p': 'pending', 'r': 'rejected'}
+
+
+def _tracker():
+    today = date.today()
+    semester = Semester(name='S', start_date=today - timedelta(days=14), end_date=today + timedelta(days=20),
+                        is_active=True)
+    db.session.add(semester)
+    db.session.flush()
+    slots.create(semester.id, semester.start_date, semester.end_date)
+    weeks = WeeklySlot.query.filter_by(semester_id=semester.id).order_by(WeeklySlot.week_number).all()
+    for username, department, paid in MEMBERS:
+        member = User(username=username, password='x', real_name=username.upper(), department=department,
+                      role='member')
+        db.session.add(member)
+        db.session.flush()
+        db.session.add_all(Transaction(type='income_dues', amount_minor=1000, user_id=member.id, semester_id=semester.id,
+                                       weekly_slot_id=week.id, status=STATUSES[mark])
+                           for week, mark in zip(weeks, paid) if mark != '.')
+    db.session.commit()
+
+
+def _pages(client, **params):
+    """Every row of the tracker, following next_after; and the first page's total."""
+    rows, after, total = [], 0, None
+    while after is not None:
+        data = client.get('/admin/api/tracker', query_string={**params, 'after': after, 'limit': 2}).get_json()
+        if not after:
+            total = data['total']
+        else:
+            assert 'total' not in data
+        assert len(data['rows']) <= 2
+        rows += data['rows']
+        after = data['next_after']
+    return rows, total
+
+
+def test_pages_follow_the_cursor_through_every_member(ctx, admin):
+    _tracker()
+
+    rows, total = _pages(admin)
+
+    assert total == 5
+    assert [(row['name'], row['status'], row['arrears']) for row in rows] == [
+        ('M1', 'PPP--', 0), ('M2', '?Px--', 1), ('M3', '-----', 3), ('M4', '----P', 3), ('M5', '???--', 0)]
+
+
+def test_unpaid_lists_members_owing_a_started_week(ctx, admin):
+    _tracker()
+
+    rows, total = _pages(admin, unpaid='1')
+    # Paying ahead for week 5 does not cover the started weeks
+    assert ([row['name'] for row in rows], total) == (['M2', 'M3', 'M4'], 3)
+
+    rows, total = _pages(admin, unpaid='1', department='Eng')
+    assert ([row['name'] for row in rows], total) == (['M2'], 1)
+
+
+def test_members_cannot_read_the_tracker(app, ctx):
+    _tracker()
+    User.query.filter_by(username='m1').one().password = passwords.hash_password('pw123456')
+    db.session.commit()
+    member = app.test_client()
+    member.post('/login', data={'username': 'm1', 'password': 'pw123456'})
+
+    assert member.get('/admin/api/tracker').status_code == 403
@@ -0,0 +1,100 @@
+import hashlib
+import io
+import os
+import struct
+import tracemalloc
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import uploads
+
+Image = pytest.importorskip('PIL.Image')
+PngImagePlugin = pytest.importorskip('PIL.PngImagePlugin')
+
+GPS_IFD = 0x8825
+
+
+def _ingest(tmp_path, data, name):
+    stored = uploads.ingest(FileStorage(io.BytesIO(data), name), str(tmp_path), {'jpg', 'png'}, 10 * 1024 * 1024)
+    with open(os.path.join(tmp_path, stored.filename), 'rb') as fh:
+        return fh.read()
+
+
+def test_jpeg_original_loses_its_exif_but_keeps_its_orientation(tmp_path):
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    exif[0x010F] = 'Camera maker'
+    exif[GPS_IFD] = {2: (13.0, 45.0, 0.0), 4: (100.0, 30.0, 0.0)}
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 20), 'red').save(buffer, 'JPEG', exif=exif, comment=b'taken at home')
+
+    stored = _ingest(tmp_path, buffer.getvalue(), 'slip.jpg')
+
+    assert b'Camera maker' not in stored and b'taken at home' not in stored
+    with Image.open(io.BytesIO(stored)) as image:
+        assert dict(image.getexif()) == {0x0112: 6}
+        assert image.size == (40, 20)
+
+
+def test_png_original_loses_its_text_chunks(tmp_path):
+    info = PngImagePlugin.PngInfo()
+    info.add_text('Location', '13.75 N 100.5 E')
+    buffer = io.BytesIO()
+    Image.new('RGB', (8, 8)).save(buffer, 'PNG', pnginfo=info)
+
+    stored = _ingest(tmp_path, buffer.getvalue(), 'news.png')
+
+    assert b'Location' not in stored
+    with Image.open(io.BytesIO(stored)) as image:
+        image.load()
+
+
+def test_a_truncated_jpeg_is_rejected(tmp_path):
+    with pytest.raises(uploads.UploadRejected):
+        _ingest(tmp_path, b'\xff\xd8\xff\xe1\x40\x00Exif', 'slip.jpg')
+
+
+def _png(*chunks):
+    return b'\x89PNG\r\n\x1a\n' + b''.join(
+        struct.pack('>I', len(data)) + kind + data + b'\0\0\0\0' for kind, data in chunks)
+
+
+def test_the_same_image_is_stored_once_whatever_its_metadata(tmp_path):
+    plain = _png((b'IHDR', b'\0' * 13), (b'IDAT', b'pixels'), (b'IEND', b''))
+    tagged = _png((b'IHDR', b'\0' * 13), (b'tEXt', b'Author\0me'), (b'IDAT', b'pixels'), (b'IEND', b''))
+
+    first = uploads.ingest(FileStorage(io.BytesIO(plain), 'a.png'), str(tmp_path), {'png'}, 1024)
+    second = uploads.ingest(FileStorage(io.BytesIO(tagged), 'b.png'), str(tmp_path), {'png'}, 1024)
+
+    assert first.created and not second.created
+    assert first.filename == second.filename == f'{hashlib.sha256(plain).hexdigest()[:2]}/' \
+                                                f'{hashlib.sha256(plain).hexdigest()}.png'
+
+
+@pytest.mark.parametrize('data, name, message', [
+    (b'\x89PNG\r\n\x1a\n' + b'\0' * 2048, 'big.png', 'larger'),
+    (b'MZ\x90\0' + b'\0' * 100, 'slip.png', 'not a PNG'),
+    (b'GIF89a', 'slip.exe', 'not allowed'),
+])
+def test_oversized_or_disguised_files_are_rejected_without_leftovers(tmp_path, data, name, message):
+    with pytest.raises(uploads.UploadRejected, match=message):
+        uploads.ingest(FileStorage(io.BytesIO(data), name), str(tmp_path), {'png', 'gif'}, 1024)
+    assert os.listdir(tmp_path) == []
+
+
+def test_a_large_upload_is_stripped_in_bounded_memory(tmp_path):
+    pixels = os.urandom(3 * 1024 * 1024)
+    data = _png((b'IHDR', b'\0' * 13), (b'IDAT', pixels), (b'tEXt', b'Comment\0x'), (b'IEND', b''))
+    upload = FileStorage(io.BytesIO(data), 'big.png')
+
+    tracemalloc.start()
+    try:
+        stored = uploads.ingest(upload, str(tmp_path), {'png'}, 8 * 1024 * 1024)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert peak < 4 * uploads.CHUNK_SIZE
+    with open(os.path.join(tmp_path, stored.filename), 'rb') as fh:
+        assert fh.read() == _png((b'IHDR', b'\0' * 13), (b'IDAT', pixels), (b'IEND', b''))
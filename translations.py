@@ -108,7 +108,54 @@ TRANSLATIONS = {
         'edit_semester': 'แก้ไขภาคเรียน',
         'delete_semester': 'ลบภาคเรียน',
         'confirm_delete_semester': 'ยืนยันการลบภาคเรียน? ข้อมูลการชำระเงินที่เกี่ยวข้องอาจได้รับผลกระทบ',
-        'update': 'อัปเดต'
+        'update': 'อัปเดต',
+        'arrears': 'ค้างชำระ (สัปดาห์)',
+        'collection_rate': 'อัตราการชำระ',
+        'has_unpaid': 'มียอดค้างชำระ',
+        'first_page': 'หน้าแรกสุด',
+        'next_page': 'หน้าถัดไป',
+        'subscribe_calendar': 'เพิ่มในปฏิทิน (iCal)',
+        'older_news': 'ข่าวเก่ากว่า',
+        'project_subtotals': 'ยอดรวมแยกตามโครงการ',
+        'no_project': 'ไม่ระบุโครงการ',
+        'rejection_reason': 'เหตุผลที่ไม่อนุมัติ',
+        'approve_selected': 'อนุมัติที่เลือก',
+        'reject_selected': 'ไม่อนุมัติที่เลือก',
+        'import_members': 'นำเข้าสมาชิก (CSV)',
+        'import_members_help': 'ไฟล์ CSV (UTF-8) แถวแรกเป็นหัวคอลัมน์ หากไม่ระบุรหัสผ่านระบบจะสร้างให้:',
+        'import_members_limit': 'จำนวนแถวสูงสุดต่อการอัปโหลด:',
+        'import_members_cli': 'ไฟล์ที่ใหญ่กว่านี้ให้นำเข้าบนเซิร์ฟเวอร์ด้วยคำสั่ง',
+        'skip_invalid_rows': 'นำเข้าแถวที่ถูกต้องและข้ามแถวที่มีข้อผิดพลาด',
+        'validate_only': 'ตรวจสอบอย่างเดียว ไม่บันทึก',
+        'rows_with_errors': 'แถวมีข้อผิดพลาด',
+        'nothing_imported': 'ยังไม่ได้นำเข้าข้อมูลใด ๆ',
+        'members_imported': 'สมาชิกถูกนำเข้าแล้ว',
+        'members_validated': 'สมาชิกพร้อมนำเข้า',
+        'generated_passwords_note': 'รหัสผ่านที่สร้างขึ้นจะแสดงเพียงครั้งเดียว โปรดแจ้งสมาชิก',
+        'line': 'บรรทัด',
+        'error': 'ข้อผิดพลาด',
+        'archive_semester': 'ปิดและเก็บถาวร',
+        'confirm_archive_semester': 'ปิดภาคเรียนนี้ถาวร? ข้อมูลจะถูกย้ายไปยังคลังและแก้ไขไม่ได้อีก',
+        'view_snapshot': 'ดูสรุป',
+        'semester_snapshot': 'สรุปภาคเรียน',
+        'transactions': 'รายการเงิน',
+        'search_placeholder': 'ค้นหาสมาชิก รายการเงิน ข่าว หรือกิจกรรม',
+        'no_results': 'ไม่พบผลลัพธ์',
+        'show_more': 'ดูเพิ่มเติม',
+        'all_results': 'ผลลัพธ์ทั้งหมด',
+        'dues_history': 'ประวัติเงินสมทบ',
+        'arrears_ranking': 'สมาชิกที่ค้างชำระมากที่สุด',
+        'weeks_paid': 'จ่ายแล้ว (สัปดาห์)',
+        'weeks_pending': 'รอตรวจสอบ (สัปดาห์)',
+        'amount_paid': 'ยอดที่จ่ายแล้ว',
+        'amount_pending': 'ยอดรอตรวจสอบ',
+        'total_weeks': 'จำนวนสัปดาห์',
+        'total_arrears': 'ค้างชำระรวมทุกภาคเรียน (สัปดาห์)',
+        'sort_by': 'เรียงตาม',
+        'nobody_owes': 'ไม่มีสมาชิกค้างชำระ',
+        'registration_order': 'ลำดับการสมัคร',
+        'load_failed': 'โหลดรายชื่อสมาชิกไม่สำเร็จ',
+        'retry': 'ลองอีกครั้ง'
     },
     'US': {
         'home': 'Home',
@@ -219,6 +266,53 @@ TRANSLATIONS = {
         'edit_semester': 'Edit Semester',
         'delete_semester': 'Delete Semester',
         'confirm_delete_semester': 'Confirm Delete Semester? Associated payment data might be affected.',
-        'update': 'Update'
+        'update': 'Update',
+        'arrears': 'Weeks Owed',
+        'collection_rate': 'Collection Rate',
+        'has_unpaid': 'Has unpaid weeks',
+        'first_page': 'First page',
+        'next_page': 'Next page',
+        'subscribe_calendar': 'Subscribe (iCal)',
+        'older_news': 'Older news',
+        'project_subtotals': 'Subtotals by project',
+        'no_project': 'No project',
+        'rejection_reason': 'Reason for rejection',
+        'approve_selected': 'Approve selected',
+        'reject_selected': 'Reject selected',
+        'import_members': 'Import members (CSV)',
+        'import_members_help': 'UTF-8 CSV with a header row; a blank password is generated for you:',
+        'import_members_limit': 'Most rows per upload:',
+        'import_members_cli': 'Import larger files on the server with',
+        'skip_invalid_rows': 'Import the valid rows and skip rows with errors',
+        'validate_only': 'Validate only, do not import',
+        'rows_with_errors': 'rows with errors',
+        'nothing_imported': 'nothing was imported',
+        'members_imported': 'members imported',
+        'members_validated': 'members ready to import',
+        'generated_passwords_note': 'Generated passwords are shown only once; pass them on to the members now.',
+        'line': 'Line',
+        'error': 'Error',
+        'archive_semester': 'Close & Archive',
+        'confirm_archive_semester': 'Close this semester for good? Its records move to the archive and can no longer be changed.',
+        'view_snapshot': 'View Snapshot',
+        'semester_snapshot': 'Semester Snapshot',
+        'transactions': 'Transactions',
+        'search_placeholder': 'Search members, transactions, news or events',
+        'no_results': 'No results',
+        'show_more': 'Show more',
+        'all_results': 'All results',
+        'dues_history': 'Dues History',
+        'arrears_ranking': 'Top Arrears',
+        'weeks_paid': 'Weeks Paid',
+        'weeks_pending': 'Weeks Pending',
+        'amount_paid': 'Amount Paid',
+        'amount_pending': 'Amount Pending',
+        'total_weeks': 'Weeks',
+        'total_arrears': 'Weeks Owed, All Semesters',
+        'sort_by': 'Sort by',
+        'nobody_owes': 'No member owes dues',
+        'registration_order': 'Registration order',
+        'load_failed': 'Could not load the member list.',
+        'retry': 'Retry'
     }
 }
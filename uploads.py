@@ -0,0 +1,228 @@
+import hashlib
+import os
+import struct
+import tempfile
+from collections import namedtuple
+
+# Upload ingestion shared by every route that accepts a file.
+#
+# The upload is read in chunks; the first bytes must match a known image
+# signature and the running size must stay under MAX_UPLOAD_BYTES, otherwise
+# ingestion stops right there. The stored content is hashed once, as it is
+# written to a temp file in the upload folder, and the file is then moved to
+# <sha256[:2]>/<sha256>.<ext>, so the same image uploaded twice is stored once
+# and names can never collide.
+#
+# Originals are served from static/, so JPEG and PNG metadata (EXIF with GPS and
+# camera serials, XMP, IPTC, comments) is cut out of the file on its way to the
+# stored copy. This is a lossless byte-level edit: pixels are not re-encoded,
+# and a JPEG keeps only its EXIF orientation so it still displays the right
+# way up. The strippers stream too, holding at most a chunk or one JPEG header
+# segment (64 KiB), so memory per upload does not grow with the file.
+
+CHUNK_SIZE = 64 * 1024
+
+# Detected type -> (stored extension, signatures)
+SIGNATURES = {
+    'png': ('png', (b'\x89PNG\r\n\x1a\n',)),
+    'jpeg': ('jpg', (b'\xff\xd8\xff',)),
+    'gif': ('gif', (b'GIF87a', b'GIF89a')),
+}
+_SNIFF_BYTES = 8
+
+StoredUpload = namedtuple('StoredUpload', 'filename created')
+
+# JPEG segments dropped from originals: APP1 (EXIF, XMP), APP13 (IPTC), COM
+_JPEG_METADATA = {0xE1, 0xED, 0xFE}
+# PNG chunks dropped from originals
+_PNG_METADATA = {b'eXIf', b'tEXt', b'zTXt', b'iTXt', b'tIME'}
+_ORIENTATION_TAG = 0x0112
+
+
+class UploadRejected(ValueError):
+    pass
+
+
+def allowed_file(filename, allowed_extensions):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
+
+
+def sniff(head):
+    """Stored extension for the image type the leading bytes belong to, or None."""
+    for ext, signatures in SIGNATURES.values():
+        if any(head.startswith(sig) for sig in signatures):
+            return ext
+    return None
+
+
+def _exif_orientation(exif):
+    """Orientation from an APP1 EXIF payload, or None."""
+    if not exif.startswith(b'Exif\0\0') or len(exif) < 14:
+        return None
+    tiff = exif[6:]
+    order = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+    if order is None:
+        return None
+    ifd = struct.unpack(order + 'I', tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return None
+    count = struct.unpack(order + 'H', tiff[ifd:ifd + 2])[0]
+    for i in range(count):
+        entry = tiff[ifd + 2 + 12 * i:ifd + 14 + 12 * i]
+        if len(entry) < 12:
+            return None
+        tag, kind = struct.unpack(order + 'HH', entry[:4])
+        if tag == _ORIENTATION_TAG and kind == 3:
+            return struct.unpack(order + 'H', entry[8:10])[0]
+    return None
+
+
+def _orientation_segment(orientation):
+    """A minimal APP1 EXIF segment holding only the orientation tag."""
+    payload = b'Exif\0\0' + b'MM\0*' + struct.pack('>IHHHIHHI', 8, 1, _ORIENTATION_TAG, 3, 1, orientation, 0, 0)
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+
+
+def _read(src, size, invalid):
+    data = src.read(size)
+    if len(data) < size:
+        raise UploadRejected(invalid)
+    return data
+
+
+def _copy(src, emit, size=None, invalid=None):
+    """Pass the next size bytes of src (the rest of it if None) to emit, a chunk at a time."""
+    while size is None or size > 0:
+        chunk = src.read(CHUNK_SIZE if size is None else min(size, CHUNK_SIZE))
+        if not chunk:
+            if size is not None:
+                raise UploadRejected(invalid)
+            return
+        emit(chunk)
+        if size is not None:
+            size -= len(chunk)
+
+
+def strip_jpeg(src, emit):
+    """Pass src to emit without its metadata segments; everything from the scan on is copied as is."""
+    invalid = 'File is not a valid JPEG image'
+    emit(_read(src, 2, invalid))
+    while True:
+        marker = _read(src, 2, invalid)
+        if marker[0] != 0xFF:
+            raise UploadRejected(invalid)
+        while marker[1] == 0xFF:
+            # Fill byte before a marker
+            marker = b'\xff' + _read(src, 1, invalid)
+        if marker[1] == 0xDA:
+            emit(marker)
+            _copy(src, emit)
+            return
+        size = _read(src, 2, invalid)
+        length = struct.unpack('>H', size)[0]
+        if length < 2:
+            raise UploadRejected(invalid)
+        payload = _read(src, length - 2, invalid)
+        if marker[1] not in _JPEG_METADATA:
+            emit(marker + size + payload)
+        elif marker[1] == 0xE1:
+            orientation = _exif_orientation(payload)
+            if orientation not in (None, 1):
+                emit(_orientation_segment(orientation))
+
+
+def strip_png(src, emit):
+    """Pass src to emit without its text, time and EXIF chunks."""
+    invalid = 'File is not a valid PNG image'
+    emit(_read(src, 8, invalid))
+    while True:
+        header = src.read(8)
+        if not header:
+            return
+        if len(header) < 8:
+            raise UploadRejected(invalid)
+        length = struct.unpack('>I', header[:4])[0]
+        kind = header[4:]
+        if kind in _PNG_METADATA:
+            _copy(src, lambda chunk: None, length + 4, invalid)
+        else:
+            emit(header)
+            _copy(src, emit, length + 4, invalid)  # data and CRC
+        if kind == b'IEND':
+            return
+
+
+# Stored extension -> metadata stripper
+STRIPPERS = {'jpg': strip_jpeg, 'png': strip_png}
+
+
+class _Upload:
+    """An upload stream that raises UploadRejected once more than max_bytes are read."""
+
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.head = b''
+
+    def _read(self, size):
+        data = self.stream.read(size)
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise UploadRejected(f'File is larger than {self.max_bytes // (1024 * 1024)} MB')
+        return data
+
+    def peek(self, size):
+        """The first size bytes (fewer for a shorter file), read again by read()."""
+        while len(self.head) < size:
+            data = self._read(size - len(self.head))
+            if not data:
+                break
+            self.head += data
+        return self.head
+
+    def read(self, size):
+        data, self.head = self.head[:size], self.head[size:]
+        if len(data) < size:
+            data += self._read(size - len(data))
+        return data
+
+
+def ingest(file, upload_folder, allowed_extensions, max_bytes):
+    """Validate and store a werkzeug FileStorage; returns StoredUpload or None if no file was sent.
+
+    Raises UploadRejected for a disallowed name, non-image content or an oversized file.
+    """
+    if file is None or not file.filename:
+        return None
+    if not allowed_file(file.filename, allowed_extensions):
+        raise UploadRejected('File type not allowed')
+
+    source = _Upload(file.stream, max_bytes)
+    ext = sniff(source.peek(_SNIFF_BYTES))
+    if ext is None:
+        raise UploadRejected('File is not a PNG, JPEG or GIF image')
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(prefix='.incoming-', dir=upload_folder)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            def emit(data):
+                digest.update(data)
+                out.write(data)
+            STRIPPERS.get(ext, _copy)(source, emit)
+
+        name = digest.hexdigest()
+        filename = f'{name[:2]}/{name}.{ext}'
+        target = os.path.join(upload_folder, filename)
+        if os.path.exists(target):
+            os.unlink(tmp_path)
+            return StoredUpload(filename, False)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # mkstemp creates the file private; uploads are served as static files
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, target)
+        return StoredUpload(filename, True)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
@@ -0,0 +1,44 @@
+from datetime import datetime
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, DataVersion
+
+# Data-version stamps. Each name covers one group of data that read-mostly
+# pages depend on; writers bump it in the same transaction as their change,
+# readers compare stamps instead of re-reading the data.
+
+LEDGER = 'ledger'      # transactions and balances
+NEWS = 'news'          # announcements
+EVENTS = 'events'      # activities
+USERS = 'users'        # user accounts (the cached current user)
+REFDATA = 'refdata'    # semesters and projects
+
+
+def bump(*names):
+    """Increment the given stamps as part of the current db.session transaction."""
+    now = datetime.utcnow()
+    dialect = db.session.get_bind().dialect.name
+    for name in names:
+        if dialect in ('sqlite', 'postgresql'):
+            insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+            stmt = insert(DataVersion).values(name=name, version=1, updated_at=now)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['name'],
+                set_={'version': DataVersion.version + 1, 'updated_at': now},
+            )
+            db.session.execute(stmt)
+            continue
+        updated = DataVersion.query.filter_by(name=name).update(
+            {DataVersion.version: DataVersion.version + 1, DataVersion.updated_at: now},
+            synchronize_session=False)
+        if not updated:
+            db.session.add(DataVersion(name=name, version=1, updated_at=now))
+            db.session.flush()
+
+
+def get(*names):
+    """{name: (version, updated_at)} for the given stamps, in one query."""
+    found = {
+        row.name: (row.version, row.updated_at)
+        for row in DataVersion.query.filter(DataVersion.name.in_(names))
+    }
+    return {name: found.get(name, (0, None)) for name in names}